@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+
+
+def help():
+    print('''
+    Usage:
+    ------------
+    LTRdigestGeometry.py [-gff <path>] [-summary] > output.tsv
+
+    Description:
+    ------------
+    Takes an LTRharvest/LTRdigest GFF3 (-gff or stdin) and outputs one
+    tab-separated row per element describing its structure. Features
+    are grouped into elements through their ID and Parent attributes,
+    each repeat_region being the root of one element, and an element
+    is output when a ### line, a repeat_region beyond it, or the end
+    of the file is reached.
+
+    Positions are genomic coordinates. 5' and 3' are relative to the
+    strand of the LTR_retrotransposon feature, so on the - strand the
+    5' LTR is the one with the higher coordinates. Elements without a
+    strand (?) are treated as being on the + strand. Values that do
+    not apply to an element (e.g. no PPT was found) are NA.
+
+    Output columns:
+    ------------
+    element             ID of the LTR_retrotransposon, or of the
+                        repeat_region if there is none
+    seqid, start, end   coordinates of the LTR_retrotransposon
+    strand              strand of the LTR_retrotransposon
+    element_length      length of the LTR_retrotransposon
+    ltr5_length         length of the 5' long_terminal_repeat
+    ltr3_length         length of the 3' long_terminal_repeat
+    internal_length     bases between the two LTRs
+    ltr_similarity      ltr_similarity attribute from LTRharvest
+    tsd_length          length of the 5' target_site_duplication
+    pbs_start, pbs_end  coordinates of the primer_binding_site
+    pbs_offset          bases between the 5' LTR and the PBS
+    pbs_trna            trna attribute of the PBS
+    ppt_start, ppt_end  coordinates of the RR_tract (PPT)
+    ppt_dist            bases between the PPT and the 3' LTR
+    domains             names of the protein_match features in 5' to
+                        3' order, repeated hits of a domain counted
+                        once
+
+    Options:
+    ------------
+    -gff <path>     LTRdigest GFF3. Default stdin.
+
+    -summary        Output the count, mean, standard deviation,
+                    minimum, 5th, 25th, 50th (median), 75th, and 95th
+                    percentiles, and maximum of each numeric column
+                    across elements, and the number of elements with
+                    each domain order, instead of a row per element.
+                    Depends on NumPy.
+    ''', file=sys.stderr)
+    sys.exit(0)
+
+
+# ID and Parent attributes in the attributes column
+ATTR_ID = re.compile('(?:^|;)ID=([^;]*)')
+ATTR_PARENT = re.compile('(?:^|;)Parent=([^;]*)')
+# output columns
+COLUMNS = ('element', 'seqid', 'start', 'end', 'strand', 'element_length',
+           'ltr5_length', 'ltr3_length', 'internal_length', 'ltr_similarity',
+           'tsd_length', 'pbs_start', 'pbs_end', 'pbs_offset', 'pbs_trna',
+           'ppt_start', 'ppt_end', 'ppt_dist', 'domains')
+# columns summarized with -summary
+NUMERIC_COLUMNS = ('element_length', 'ltr5_length', 'ltr3_length',
+                   'internal_length', 'ltr_similarity', 'tsd_length',
+                   'pbs_offset', 'ppt_dist')
+
+
+def attributeValue(attributes, key):
+    """Returns the value of key in a GFF3 attributes column, or None."""
+    for attribute in attributes.split(';'):
+        attrKey, sep, value = attribute.partition('=')
+        if attrKey == key:
+            return value
+    return None
+
+
+class LTRElement:
+    """A class to represent the features of one repeat_region block of
+    an LTRdigest GFF3. Each feature is a tuple (start, end, strand,
+    attributes column).
+
+    Attributes:
+    ------------
+    id          ID of the repeat_region
+    seqid       sequence of the repeat_region
+    end         end of the repeat_region
+    features    dictionary {feature type:list of features}
+
+    Methods:
+    ------------
+    add()       Adds a feature
+    row()       Returns the output columns as a dictionary
+    """
+    def __init__(self, regionId, seqid, end):
+        self.id = regionId
+        self.seqid = seqid
+        self.end = end
+        self.features = {}
+
+    def add(self, featureType, start, end, strand, attributes):
+        self.features.setdefault(featureType, []).append((start, end, strand,
+                                                          attributes))
+
+    def ordered(self, featureType, reverse):
+        """Returns the features of a type in 5' to 3' order."""
+        return sorted(self.features.get(featureType, []), reverse=reverse)
+
+    def row(self):
+        """Returns a dictionary {column:value} of the structure of the
+        element, with None for values that do not apply.
+        """
+        row = dict.fromkeys(COLUMNS)
+        row['element'] = self.id
+        row['seqid'] = self.seqid
+        reverse = False
+        element = self.features.get('LTR_retrotransposon')
+        if element:
+            start, end, strand, attributes = element[0]
+            featureId = ATTR_ID.search(attributes)
+            if featureId:
+                row['element'] = featureId.group(1)
+            row['start'], row['end'], row['strand'] = start, end, strand
+            row['element_length'] = end - start + 1
+            similarity = attributeValue(attributes, 'ltr_similarity')
+            if similarity != None:
+                row['ltr_similarity'] = float(similarity)
+            reverse = strand == '-'
+        # sign to give distances along the element in 5' to 3' order
+        direction = -1 if reverse else 1
+        ltrs = self.ordered('long_terminal_repeat', reverse)
+        ltr5 = ltr3 = None
+        if ltrs:
+            ltr5 = ltrs[0]
+            row['ltr5_length'] = ltr5[1] - ltr5[0] + 1
+        if len(ltrs) > 1:
+            ltr3 = ltrs[-1]
+            row['ltr3_length'] = ltr3[1] - ltr3[0] + 1
+            row['internal_length'] = gap(ltr5, ltr3, direction)
+        tsds = self.ordered('target_site_duplication', reverse)
+        if tsds:
+            row['tsd_length'] = tsds[0][1] - tsds[0][0] + 1
+        pbss = self.ordered('primer_binding_site', reverse)
+        if pbss:
+            pbs = pbss[0]
+            row['pbs_start'], row['pbs_end'] = pbs[0], pbs[1]
+            row['pbs_trna'] = attributeValue(pbs[3], 'trna')
+            if ltr5 != None:
+                row['pbs_offset'] = gap(ltr5, pbs, direction)
+        ppts = self.ordered('RR_tract', reverse)
+        if ppts:
+            ppt = ppts[-1]
+            row['ppt_start'], row['ppt_end'] = ppt[0], ppt[1]
+            if ltr3 != None:
+                row['ppt_dist'] = gap(ppt, ltr3, direction)
+        domains = []
+        for domain in self.ordered('protein_match', reverse):
+            name = attributeValue(domain[3], 'name')
+            if name == None:
+                name = attributeValue(domain[3], 'Name')
+            if name != None and (domains == [] or domains[-1] != name):
+                domains.append(name)
+        if domains:
+            row['domains'] = ','.join(domains)
+        return row
+
+
+def gap(upstream, downstream, direction):
+    """Returns the number of bases between two features (start, end,
+    ...) where upstream is 5' of downstream in the direction given by
+    direction (1 for +, -1 for -). Negative if they overlap.
+    """
+    if direction == 1:
+        return downstream[0] - upstream[1] - 1
+    return upstream[0] - downstream[1] - 1
+
+def readElements(lines):
+    """Generator that yields the LTRElement of each repeat_region in
+    the lines of an LTRdigest GFF3. Features are attached to the
+    repeat_region their Parent attributes lead to. Elements are yielded
+    in the order their repeat_regions occur once they are complete.
+    Features whose ancestors are not in an open element are reported
+    on stderr.
+    """
+    # the open elements by repeat_region ID and the repeat_region ID
+    # each feature ID descends from
+    elements = {}
+    rootOf = {}
+    for line in lines:
+        if line.startswith('##FASTA'):
+            break
+        if line.startswith('###'):
+            yield from elements.values()
+            elements = {}
+            rootOf = {}
+            continue
+        if line.startswith('#') or line.strip() == '':
+            continue
+        fields = line.rstrip('\r\n').split('\t')
+        seqid, featureType = fields[0], fields[2]
+        start, end, strand, attributes = (int(fields[3]), int(fields[4]),
+                                          fields[6], fields[8])
+        featureId = ATTR_ID.search(attributes)
+        if featureType == 'repeat_region':
+            # yield the elements that can have no more features, in the
+            # order they occur
+            for regionId in list(elements):
+                element = elements[regionId]
+                if element.seqid == seqid and element.end >= start:
+                    break
+                yield elements.pop(regionId)
+            if len(elements) == 0:
+                rootOf = {}
+            regionId = featureId.group(1) if featureId else \
+                                        '{0}:{1}-{2}'.format(seqid, start, end)
+            elements[regionId] = LTRElement(regionId, seqid, end)
+            rootOf[regionId] = regionId
+            continue
+        parent = ATTR_PARENT.search(attributes)
+        root = None
+        if parent:
+            root = rootOf.get(parent.group(1).split(',')[0])
+        if root == None:
+            print('Feature not part of a repeat_region: {0}'.format(
+                                           line.rstrip('\r\n')), file=sys.stderr)
+            continue
+        if featureId:
+            rootOf[featureId.group(1)] = root
+        elements[root].add(featureType, start, end, strand, attributes)
+    yield from elements.values()
+
+def formatValue(value):
+    """Returns the text of an output value."""
+    if value == None:
+        return 'NA'
+    if isinstance(value, float):
+        return '{0:.2f}'.format(value)
+    return str(value)
+
+def summarize(rows, outFl):
+    """Writes the distribution of each numeric column and the counts of
+    each domain order across the row dictionaries rows to outFl.
+    """
+    import numpy as np
+    outFl.write('#column\tcount\tmean\tsd\tmin\tq05\tq25\tmedian\tq75\t'
+                'q95\tmax\n')
+    for column in NUMERIC_COLUMNS:
+        values = np.array([row[column] for row in rows
+                           if row[column] != None], dtype=np.float64)
+        if len(values) == 0:
+            outFl.write('\t'.join([column, '0'] + ['NA'] * 9) + '\n')
+            continue
+        stats = ([values.mean(), values.std(), values.min()]
+                 + list(np.percentile(values, (5, 25, 50, 75, 95)))
+                 + [values.max()])
+        outFl.write('\t'.join([column, str(len(values))]
+                              + ['{0:.2f}'.format(x) for x in stats]) + '\n')
+    domainOrders = {}
+    for row in rows:
+        domainOrder = formatValue(row['domains'])
+        domainOrders[domainOrder] = domainOrders.get(domainOrder, 0) + 1
+    outFl.write('#domains\tcount\n')
+    for domainOrder, count in sorted(domainOrders.items(),
+                                     key=lambda x:(-x[1], x[0])):
+        outFl.write('{0}\t{1}\n'.format(domainOrder, count))
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    # output help information if asked for
+    if '-h' in args or '-help' in args:
+        help()
+    if '-gff' in args:
+        inFl = open(args[args.index('-gff') + 1])
+    else:
+        inFl = sys.stdin
+    outFl = open(sys.stdout.fileno(), 'w', buffering=1024*1024, closefd=False)
+    with inFl, outFl:
+        if '-summary' in args:
+            summarize([element.row() for element in readElements(inFl)],
+                      outFl)
+        else:
+            outFl.write('#' + '\t'.join(COLUMNS) + '\n')
+            for element in readElements(inFl):
+                row = element.row()
+                outFl.write('\t'.join(formatValue(row[column]) for column
+                                      in COLUMNS) + '\n')
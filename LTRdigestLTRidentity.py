@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+import sys
+import math
+import numpy as np
+from multiprocessing import Pool
+from fastaIndex import FastaIndex
+from LTRdigestGeometry import readElements
+
+
+def help():
+    print('''
+    Usage:
+    ------------
+    LTRdigestLTRidentity.py -fasta <path> [-gff <path>] [options]
+
+    Description:
+    ------------
+    Takes an LTRharvest/LTRdigest GFF3 (-gff or stdin) and the genome
+    FASTA it was made from and outputs the identity of the two long
+    terminal repeats of each element, for estimating insertion ages.
+    The sequences of the LTRs are read from the FASTA using an index
+    (<fasta>.fai, built if needed, see fastaIndex.py), so the sequence
+    ids in the GFF3 must be the names in the FASTA (see
+    renameSeqids.py). Elements without two LTRs or on sequences not in
+    the FASTA are reported on stderr.
+
+    Each pair of LTRs is aligned with a global alignment (match 1,
+    mismatch -1, gap -2) restricted to a band of diagonals around the
+    difference in their lengths. The number of transitions and
+    transversions between aligned bases (ignoring positions with
+    bases other than A, C, G, or T) gives the Kimura 2-parameter
+    distance, and with -mu the age of the element is estimated as
+    K2P / (2 * mu).
+
+    Output columns:
+    ------------
+    element             ID of the LTR_retrotransposon
+    seqid               sequence of the element
+    ltr5_length         length of the 5' LTR
+    ltr3_length         length of the 3' LTR
+    aligned_length      number of columns in the alignment
+    identity            identical bases / aligned_length
+    transitions         aligned A-G and C-T differences
+    transversions       other aligned A, C, G, T differences
+    gaps                alignment columns with a gap
+    k2p                 Kimura 2-parameter distance, NA if saturated
+    age                 with -mu, k2p / (2 * mu)
+
+    Options:
+    ------------
+    -gff <path>         LTRdigest GFF3. Default stdin.
+
+    -fasta <path>       Genome FASTA
+
+    -band <int>         Number of diagonals on each side of those
+                        between the ends of the alignment to fill.
+                        Default 20. Indels in one LTR relative to the
+                        other of more than this many bases can not be
+                        aligned.
+
+    -mu <float>         Substitution rate per site per year for the age
+                        column, e.g. 1.3e-8
+
+    -threads <int>      Number of processes aligning pairs. Default 1.
+        ''', file=sys.stderr)
+    sys.exit(0)
+
+
+# alignment scores
+MATCH = 1
+MISMATCH = -1
+GAP = -2
+# score of cells outside the band or the matrix
+NEG = -10 ** 9
+# pointers for the traceback
+DIAG, UP, LEFT = 0, 1, 2
+# most LTR pairs aligned together, and most cells of their traceback
+# pointers (bytes) in a batch unless one pair needs more
+BATCH_SIZE = 128
+BATCH_CELLS = 16 * 1024 * 1024
+# whether each byte is A, C, G, or T, and whether it is a purine
+IS_ACGT = np.zeros(256, dtype=bool)
+IS_ACGT[list(b'ACGT')] = True
+IS_PURINE = np.zeros(256, dtype=bool)
+IS_PURINE[list(b'AG')] = True
+
+
+def alignPairs(pairs, band):
+    """Returns (aligned length, identity, transitions, transversions,
+    gaps, K2P distance) for each pair of sequences in pairs, from the
+    highest-scoring global alignment of the pair restricted to the
+    diagonals j - i between min(0, len(b) - len(a)) - band and
+    max(0, len(b) - len(a)) + band. The pairs are aligned together
+    with NumPy, one row of all of their matrices at a time: matches
+    and gaps in b from the previous row, then gaps in a as a running
+    maximum along the row. The tracebacks are also done together.
+    """
+    count = len(pairs)
+    seqsA = [a.upper().encode() for a, b in pairs]
+    seqsB = [b.upper().encode() for a, b in pairs]
+    n = np.array([len(a) for a in seqsA], dtype=np.int64)
+    m = np.array([len(b) for b in seqsB], dtype=np.int64)
+    lo = np.maximum(np.minimum(0, m - n) - band, -n)
+    hi = np.minimum(np.maximum(0, m - n) + band, m)
+    width = int((hi - lo).max()) + 1
+    maxN, maxM = int(n.max()), int(m.max())
+    # the sequences padded to the same length
+    a = np.zeros((count, maxN + 1), dtype=np.uint8)
+    b = np.zeros((count, maxM + 1), dtype=np.uint8)
+    for e in range(count):
+        a[e, :n[e]] = np.frombuffer(seqsA[e], dtype=np.uint8)
+        b[e, :m[e]] = np.frombuffer(seqsB[e], dtype=np.uint8)
+    # cell k of row i of pair e is column j = i + lo[e] + k of its
+    # full matrix
+    ks = np.arange(width, dtype=np.int64)
+    gapRun = GAP * ks
+    lo, m, hi = lo[:, None], m[:, None], hi[:, None]
+    pointers = np.empty((count, maxN + 1, width), dtype=np.int8)
+    j = lo + ks
+    outside = (j < 0) | (j > m) | (j > hi)
+    row = np.where(outside, NEG, GAP * j)
+    pointers[:, 0] = LEFT
+    for i in range(1, maxN + 1):
+        j += 1
+        outside = (j < 0) | (j > m) | (j - i > hi)
+        # match or mismatch of a[i - 1] and b[j - 1], from the same
+        # cell of the previous row
+        bases = np.take_along_axis(b, np.clip(j - 1, 0, maxM), axis=1)
+        diag = row + np.where(bases == a[:, i - 1:i], MATCH, MISMATCH)
+        diag[j < 1] = NEG
+        # gap in b, from the next cell of the previous row
+        up = np.empty_like(row)
+        up[:, :-1] = row[:, 1:] + GAP
+        up[:, -1] = NEG
+        best = np.maximum(diag, up)
+        best[outside] = NEG
+        # gap in a, from the best cell to the left in the same row
+        row = np.maximum.accumulate(best - gapRun, axis=1) + gapRun
+        row[outside] = NEG
+        pointers[:, i] = np.where(row > best, LEFT,
+                                  np.where(diag >= up, DIAG, UP))
+    # trace back from the last cell of each pair, counting the columns
+    lo = lo[:, 0]
+    elements = np.arange(count)
+    i = n.copy()
+    k = m[:, 0] - n - lo
+    columns, gaps, sites, matches, transitions, transversions = \
+                          [np.zeros(count, dtype=np.int64) for x in range(6)]
+    active = (i > 0) | (i + lo + k > 0)
+    while active.any():
+        pointer = pointers[elements, i, k]
+        x = a[elements, i - 1]
+        y = b[elements, np.maximum(i + lo + k - 1, 0)]
+        isDiag = active & (pointer == DIAG)
+        isUp = active & (pointer == UP)
+        isLeft = active & (pointer == LEFT)
+        compared = isDiag & IS_ACGT[x] & IS_ACGT[y]
+        different = compared & (x != y)
+        columns += active
+        gaps += isUp | isLeft
+        sites += compared
+        matches += compared & (x == y)
+        transitions += different & (IS_PURINE[x] == IS_PURINE[y])
+        transversions += different & (IS_PURINE[x] != IS_PURINE[y])
+        i -= isDiag | isUp
+        k += isUp
+        k -= isLeft
+        active = (i > 0) | (i + lo + k > 0)
+    results = []
+    for e in range(count):
+        identity = float(matches[e] / columns[e]) if columns[e] else None
+        results.append((int(columns[e]), identity,
+                        int(transitions[e]), int(transversions[e]),
+                        int(gaps[e]),
+                        k2p(transitions[e], transversions[e], sites[e])))
+    return results
+
+def k2p(transitions, transversions, sites):
+    """Returns the Kimura 2-parameter distance for the numbers of
+    transitions and transversions among sites compared sites, or None
+    if it is undefined.
+    """
+    if sites == 0:
+        return None
+    if transitions == 0 and transversions == 0:
+        return 0.0
+    p = transitions / sites
+    q = transversions / sites
+    if 1 - 2 * p - q <= 0 or 1 - 2 * q <= 0:
+        return None
+    return float(-0.5 * math.log(1 - 2 * p - q)
+                 - 0.25 * math.log(1 - 2 * q))
+
+
+def initWorker(fastaPath, workerBand):
+    """Opens the FASTA index once in each worker process."""
+    global fasta, band
+    fasta = FastaIndex(fastaPath)
+    band = workerBand
+
+def compareBatch(jobs):
+    """Returns a tuple (element ID, seqid, 5' LTR length, 3' LTR
+    length) plus the result of alignPairs() for each job in jobs, a
+    list of tuples (element ID, seqid, 5' LTR coordinates, 3' LTR
+    coordinates).
+    """
+    pairs = [(fasta.fetch(seqid, start5, end5),
+              fasta.fetch(seqid, start3, end3))
+             for elementId, seqid, (start5, end5), (start3, end3) in jobs]
+    return [(elementId, seqid, len(ltr5), len(ltr3)) + result
+            for (elementId, seqid, coords5, coords3), (ltr5, ltr3), result
+            in zip(jobs, pairs, alignPairs(pairs, band))]
+
+def pairCells(job, band):
+    """Returns the rows and at most the width of the traceback
+    pointers alignPairs() uses for the LTRs of a job.
+    """
+    elementId, seqid, (start5, end5), (start3, end3) = job
+    n = end5 - start5 + 1
+    m = end3 - start3 + 1
+    return (n + 1, min(abs(m - n) + 2 * band, n + m) + 1)
+
+def batches(jobs, band):
+    """Generator that yields lists of consecutive jobs, up to
+    BATCH_SIZE of them and, as the pointers of a batch are sized by
+    its longest LTR and widest band, with up to BATCH_CELLS pointer
+    cells unless one job needs more.
+    """
+    batch = []
+    rows = width = 0
+    for job in jobs:
+        jobRows, jobWidth = pairCells(job, band)
+        cells = (len(batch) + 1) * max(rows, jobRows) * max(width, jobWidth)
+        if batch != [] and cells > BATCH_CELLS:
+            yield batch
+            batch = []
+            rows = width = 0
+        batch.append(job)
+        rows = max(rows, jobRows)
+        width = max(width, jobWidth)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+            rows = width = 0
+    if batch:
+        yield batch
+
+def ltrPairs(elements, fasta):
+    """Generator that yields a job for compareBatch() for each
+    element with two LTRs on a sequence in fasta.
+    """
+    for element in elements:
+        row = element.row()
+        ltrs = sorted(element.features.get('long_terminal_repeat', []),
+                      reverse=row['strand'] == '-')
+        if len(ltrs) < 2:
+            print('Element without two LTRs: {0}'.format(row['element']),
+                                                               file=sys.stderr)
+            continue
+        if row['seqid'] not in fasta:
+            print('Sequence not in FASTA: {0}'.format(row['seqid']),
+                                                               file=sys.stderr)
+            continue
+        yield (row['element'], row['seqid'], ltrs[0][:2], ltrs[-1][:2])
+
+def formatValue(value):
+    """Returns the text of an output value."""
+    if value == None:
+        return 'NA'
+    if isinstance(value, float):
+        return '{0:.6g}'.format(value)
+    return str(value)
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    # output help information if missing command line arguments
+    if '-h' in args or '-fasta' not in args:
+        help()
+    fastaPath = args[args.index('-fasta') + 1]
+    band = int(args[args.index('-band') + 1]) if '-band' in args else 20
+    mu = float(args[args.index('-mu') + 1]) if '-mu' in args else None
+    threads = int(args[args.index('-threads') + 1]) if '-threads' in args \
+                                                                        else 1
+    if '-gff' in args:
+        inFl = open(args[args.index('-gff') + 1])
+    else:
+        inFl = sys.stdin
+    try:
+        initWorker(fastaPath, band)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    jobs = ltrPairs(readElements(inFl), fasta)
+    outFl = open(sys.stdout.fileno(), 'w', buffering=1024*1024, closefd=False)
+    with inFl, outFl:
+        outFl.write('#element\tseqid\tltr5_length\tltr3_length\t'
+                    'aligned_length\tidentity\ttransitions\ttransversions\t'
+                    'gaps\tk2p' + ('\tage' if mu != None else '') + '\n')
+        if threads > 1:
+            pool = Pool(threads, initializer=initWorker,
+                        initargs=(fastaPath, band))
+            results = pool.imap(compareBatch, batches(jobs, band))
+        else:
+            results = map(compareBatch, batches(jobs, band))
+        for result in (result for batch in results for result in batch):
+            fields = [formatValue(value) for value in result]
+            if mu != None:
+                distance = result[-1]
+                fields.append(formatValue(distance / (2 * mu)
+                                          if distance != None else None))
+            outFl.write('\t'.join(fields) + '\n')
+        if threads > 1:
+            pool.close()
+            pool.join()
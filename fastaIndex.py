@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import mmap
+
+
+def help():
+    print('''
+    Usage:
+    ------------
+    fastaIndex.py -fasta <path> [-region <seqid:start-end> ...]
+
+    Description:
+    ------------
+    Builds a FASTA index (<fasta>.fai) in the format written by
+    samtools faidx, recording the length of each sequence and where it
+    starts in the file. With -region, outputs the sequence of each
+    region given (1-based, inclusive) in FASTA format, reading only the
+    part of the file containing it. An existing .fai is used if it is
+    newer than the FASTA.
+
+    Every line of a sequence except the last must be the same length.
+    ''', file=sys.stderr)
+    sys.exit(0)
+
+
+# complements of IUPAC nucleotide codes
+COMPLEMENT = str.maketrans('ACGTURYKMBVDHNacgturykmbvdhn',
+                           'TGCAAYRMKVBHDNtgcaayrmkvbhdn')
+
+
+def reverseComplement(seq):
+    """Returns the reverse complement of a nucleotide sequence."""
+    return seq.translate(COMPLEMENT)[::-1]
+
+
+class FastaIndex:
+    """A class to fetch subsequences from a FASTA file using a .fai
+    index and a memory map of the file, so only the lines containing a
+    subsequence are read. The index is read from <fasta>.fai if it is
+    newer than the FASTA, and otherwise built and written there (or
+    kept in memory if it cannot be written).
+
+    Attributes:
+    ------------
+    path        path to the FASTA file
+    index       {seqid:(length, offset, line bases, line width)}
+
+    Methods:
+    ------------
+    length()    Returns the length of a sequence
+    fetch()     Returns a subsequence
+    close()     Closes the memory map and file
+    """
+    def __init__(self, path):
+        self.path = path
+        faiPath = path + '.fai'
+        if (os.path.exists(faiPath)
+            and os.path.getmtime(faiPath) >= os.path.getmtime(path)):
+            self.index = readFai(faiPath)
+        else:
+            self.index = buildFai(path)
+            try:
+                writeFai(faiPath, self.index)
+            except OSError:
+                pass
+        self.fl = open(path, 'rb')
+        # an empty file can not be memory mapped
+        if os.path.getsize(path) > 0:
+            self.mm = mmap.mmap(self.fl.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = b''
+
+    def __contains__(self, seqid):
+        return seqid in self.index
+
+    def length(self, seqid):
+        return self.index[seqid][0]
+
+    def fetch(self, seqid, start, end):
+        """Returns the sequence of seqid from start to end (1-based,
+        inclusive) as a string. Coordinates outside the sequence are
+        clipped. Raises KeyError if seqid is not in the index.
+        """
+        length, offset, lineBases, lineWidth = self.index[seqid]
+        start = max(start, 1) - 1
+        end = min(end, length)
+        if end <= start:
+            return ''
+        # byte positions of the first and last bases
+        first = offset + (start // lineBases) * lineWidth + start % lineBases
+        last = offset + ((end - 1) // lineBases) * lineWidth + \
+               (end - 1) % lineBases
+        seq = self.mm[first:last + 1]
+        # remove line ends
+        if lineWidth > lineBases:
+            seq = seq.replace(b'\n', b'').replace(b'\r', b'')
+        return seq.decode('ascii')
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.fl.close()
+
+
+def buildFai(path):
+    """Returns an index {seqid:(length, offset, line bases, line
+    width)} of a FASTA file. Raises ValueError if the lines of a
+    sequence other than its last line differ in length.
+    """
+    index = {}
+    seqid = None
+
+    def finish():
+        # a sequence with no sequence lines has no line lengths
+        if seqid != None:
+            index[seqid] = (length, offset, lineBases or 0, lineWidth or 0)
+
+    with open(path, 'rb') as fl:
+        position = 0
+        for line in fl:
+            if line.startswith(b'>'):
+                finish()
+                seqid = line[1:].split()[0].decode() if line[1:].split() \
+                                                                    else ''
+                length = 0
+                offset = position + len(line)
+                lineBases = None
+                lineWidth = None
+                # True after a line shorter than the others
+                ended = False
+            elif seqid != None:
+                bases = len(line.rstrip(b'\r\n'))
+                # sequence after a blank line can not be indexed
+                if bases == 0:
+                    ended = True
+                else:
+                    if ended or (lineBases != None and bases > lineBases):
+                        raise ValueError('Lines of different lengths in '
+                                         '{0} in {1}'.format(seqid, path))
+                    if lineBases == None:
+                        lineBases = bases
+                        lineWidth = len(line)
+                    elif bases < lineBases or len(line) != lineWidth:
+                        ended = True
+                    length += bases
+            position += len(line)
+    finish()
+    return index
+
+def readFai(faiPath):
+    """Reads a .fai file into an index {seqid:(length, offset, line
+    bases, line width)}.
+    """
+    index = {}
+    with open(faiPath) as fl:
+        for line in fl:
+            fields = line.rstrip('\n').split('\t')
+            index[fields[0]] = tuple(int(field) for field in fields[1:5])
+    return index
+
+def writeFai(faiPath, index):
+    """Writes an index to a .fai file."""
+    with open(faiPath, 'w') as fl:
+        for seqid, fields in index.items():
+            fl.write('\t'.join([seqid] + [str(field) for field in fields])
+                     + '\n')
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    # output help information if missing command line arguments
+    if '-h' in args or '-fasta' not in args:
+        help()
+    try:
+        fasta = FastaIndex(args[args.index('-fasta') + 1])
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    # output each region
+    for i, arg in enumerate(args):
+        if arg == '-region':
+            region = args[i + 1]
+            seqid, coords = region.rsplit(':', 1)
+            start, end = (int(coord) for coord in coords.split('-'))
+            seq = fasta.fetch(seqid, start, end)
+            sys.stdout.write('>{0}\n'.format(region))
+            for j in range(0, len(seq), 60):
+                sys.stdout.write(seq[j:j + 60] + '\n')
+    fasta.close()
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
+import os
+import re
 import sys
+import tempfile
+import numpy as np
+from array import array
 
 
 def help():
@@ -9,6 +14,8 @@ def help():
     ------------
     gff2circosHeatmap.py -gff <path> -window <int> 
         [<path> -scafLens | -fasta <path>] [-scafList <path>]
+        [-groupBy <type|source|attr:key> [-out <prefix>]]
+        [-mem <int> [-tmpDir <path>]]
 
     Description:
     ------------
@@ -19,8 +26,9 @@ def help():
     parameter sets the number of bases in the sliding window used to 
     determine the density of features and corresponding colors in
     Circos. Different GFF3 features types are not distinguished from
-    each other; therefore the input GFF3 file should contain only one
-    type of feature (e.g. genes of interest). Overlapping features are
+    each other unless -groupBy is used; therefore without -groupBy the
+    input GFF3 file should contain only one type of feature (e.g.
+    genes of interest). Overlapping features are
     merged and feature strand is not taken into account. Features are
     all treated as if they are on a single strand.
 
@@ -34,6 +42,34 @@ def help():
     -window       <int>     The number of bases in the sliding window 
     -scafList     <path>    Restrict output to these scaffolds. A file
                             with a list of scaffold names
+
+    Options:
+    ------------
+    -groupBy      <str>     Write one heatmap per group of features
+                            instead of one heatmap to stdout. Features
+                            are grouped by type, source, or the value
+                            of an attribute, e.g. attr:Name. Features
+                            without the attribute are grouped as None.
+                            The GFF3 is read once for all groups.
+    -out          <str>     Prefix of the files written with -groupBy.
+                            Files are named <prefix>.<group>.txt,
+                            with characters of the group other than
+                            letters, digits, _, ., and - replaced by
+                            _. Exits with an error before writing if
+                            two groups would get the same file name.
+                            Default is the -gff file name.
+    -mem          <int>     Memory budget in megabytes for holding
+                            feature coordinates while reading the GFF3.
+                            When it is reached, coordinates are written
+                            to a temporary file and each scaffold is
+                            loaded back by itself when its windows are
+                            calculated, so memory use is bounded by the
+                            largest scaffold rather than the whole
+                            file. Default is to keep all coordinates in
+                            memory.
+    -tmpDir       <path>    Directory for the temporary file used with
+                            -mem. Default is the system temporary
+                            directory.
     Output:
     ------------
     scaf    start    stop    density
@@ -104,183 +140,280 @@ def fasta2LenDct(filepath, scafList=None):
 
             
 
-def gff2circosHeatmap(filepath, 
-                      scafLens, 
-                      windowLen, 
-                      scafList=None):
-    """1. Reads scaf, start, and start for features in GFF3 file into 
-       memory
-    2. Creates all windows for a given scaf
-    3. Loops through the features and adds them to whatever scaf they
-       are part of
+def windowCoords(scafLen, windowLen):
+    """Takes the length of a scaffold and the length of the window as
+    arguments and returns a tuple of two NumPy arrays, the start and
+    end coordinates of each window on the scaffold. All windows but
+    the last are windowLen long; the last extends from the end of the
+    second to last window to the end of the scaffold.
+    """
+    # number of windows of full length
+    if scafLen >= windowLen:
+        fullWindows = (scafLen + 1) // windowLen
+        lastWindowEnd = fullWindows * windowLen - 1
+    else:
+        fullWindows = 0
+        lastWindowEnd = 0
+    windowStarts = np.arange(fullWindows, dtype=np.int64) * windowLen
+    windowEnds = windowStarts + windowLen - 1
+    # generate the window for the last scaffold (may be shorter than
+    # the window size)
+    if lastWindowEnd < scafLen:
+        windowStarts = np.append(windowStarts, lastWindowEnd + 1)
+        windowEnds = np.append(windowEnds, scafLen)
+    return (windowStarts, windowEnds)
 
-    Arguments:
-    ----------
-    filepath: Path to a GFF3 file
-    scafLens: Dictionary with lengths of sequences represented in the
-              GFF3 file
+def windowCoverage(featStarts, featEnds, numWindows, windowLen):
+    """Takes NumPy arrays of the start and end coordinates of features
+    on a scaffold (half-open, 0-based) and returns an array with the
+    number of bases in each window covered by at least one feature.
+    Overlapping features are merged using a difference array: +1 at
+    each feature start and -1 at each feature end, together with the
+    window boundaries, are sorted, and a running sum gives the number
+    of features covering each segment between consecutive points. The
+    covered segment lengths are then summed per window with
+    np.add.reduceat.
     """
+    boundaries = np.arange(numWindows + 1, dtype=np.int64) * windowLen
+    # coordinates past the last window are counted in the last window
+    featStarts = np.minimum(featStarts, boundaries[-1])
+    featEnds = np.minimum(featEnds, boundaries[-1])
+    points = np.concatenate((featStarts, featEnds, boundaries))
+    deltas = np.concatenate((np.ones(len(featStarts), dtype=np.int64),
+                             -np.ones(len(featEnds), dtype=np.int64),
+                             np.zeros(len(boundaries), dtype=np.int64)))
+    order = np.argsort(points, kind='stable')
+    points = points[order]
+    depth = np.cumsum(deltas[order])
+    covered = np.diff(points) * (depth[:-1] > 0)
+    # position of each window boundary among the sorted points. each
+    # window's segments are those between its boundary and the next
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    windowFirstSegments = position[len(featStarts) + len(featEnds):][:-1]
+    return np.add.reduceat(covered, windowFirstSegments)
 
-    def whichWindow(coord, windowLen):
-        """Takes a coordinate and the length of the window as arguments
-        and returns the window number.
-        """
-        return coord//windowLen
+class SpilledCoords:
+    """A class to hold the coordinates of the features of one group of
+    features in a temporary file, organized by scaffold. Coordinates
+    are written in chunks and each scaffold's chunks are read back
+    together. Supports the same operations as the dictionary
+    {scaf:([starts], [ends])} used by writeHeatmap().
 
-    def genWindowCoords(n, windowLen):
-        """Takes the window number n and the length of the window as
-        arguments and returns a 2-element tuple of the start and end
-        coordinates of that window.
-        """
-        return (n * windowLen, (n + 1) * windowLen - 1)
+    Attributes:
+    ------------
+    tmpFl       binary temporary file shared by all groups
+    chunks      dictionary {scaf:[(offset, number of bytes)]} of the
+                coordinates of each scaffold in tmpFl
 
-    def mergeCoords(A, B):
-        """Takes two tuples of coordinates A and B as arguments; A must
-        have a start coordinate before or equal to the start coordinate
-        of B. If they do not overlap then A and B are returned as input
-        and if they overlap the minimum and maximum values are returned.
+    Methods:
+    ------------
+    write()     Appends an array of coordinates of a scaffold to tmpFl
+    pop()       Reads and removes the coordinates of a scaffold
+    """
+    def __init__(self, tmpFl):
+        self.tmpFl = tmpFl
+        self.chunks = {}
 
-        let A = (a1, a2), B = (b1, b2) | a1<=b1, a1<=a2, b1<=b2
+    def __contains__(self, scaf):
+        return scaf in self.chunks
 
-        case 1: a2<=b1 ---> output A and B
+    def __iter__(self):
+        return iter(self.chunks)
 
-        case 2: b1<a2 && b2>a2 ---> output (a1, b2)
+    def write(self, scaf, coords):
+        """Appends coords, an array('q') of start and end coordinates
+        alternating, to the end of tmpFl.
+        """
+        self.tmpFl.seek(0, 2)
+        chunk = (self.tmpFl.tell(), len(coords) * coords.itemsize)
+        coords.tofile(self.tmpFl)
+        if scaf in self.chunks:
+            self.chunks[scaf].append(chunk)
+        else:
+            self.chunks[scaf] = [chunk]
 
-        case 3: b2<=a2 ---> output A
+    def pop(self, scaf):
+        """Returns a tuple of NumPy arrays of the start and end
+        coordinates of features on scaf and forgets the scaffold.
         """
+        coords = []
+        for offset, numBytes in self.chunks.pop(scaf):
+            self.tmpFl.seek(offset)
+            coords.append(np.frombuffer(self.tmpFl.read(numBytes), 
+                                        dtype=np.int64))
+        coords = np.concatenate(coords)
+        return (coords[0::2], coords[1::2])
 
-        assert min(A) <= min(B), ("tuples given to mergeCoords in wrong order: "
-                                    "A={0}, B={1}").format(A,B)
-        if min(B) >= max(A):
-            return ((A, B), 0)
-        elif min(B) < max(A) and max(B) > max(A):
-            output = (min(A),max(B))
-            return ((output, output), 1)
-        elif max(B) <= max(A):
-            return ((A, A), 2)
-        else:
-            raise Exception(("Unexpected result from mergeCoords(A,B) using "
-                               " A={0}, B={1}").format(A,B))
 
-    # open gff file and read it line by line, adding start and end
-    # coordinates for each feature to the scaffold on which it resides.
+def readGFFcoords(filepath, groupBy=None, scafList=None, memBytes=None,
+                  tmpDir=None):
+    """Reads the start and end coordinates of features in a GFF3 file
+    and returns a dictionary {group:{scaf:([starts], [ends])}}. The
+    coordinates are 0-based half-open intervals [start - 1, end - 1).
+    If groupBy is None all features are in group None; otherwise
+    groupBy is 'type', 'source', or 'attr:<key>'. If memBytes is given
+    the coordinates are buffered in memory until about memBytes are
+    held, then written to a temporary file, and each group's
+    coordinates are returned as a SpilledCoords instead of a
+    dictionary.
+
+    Arguments:
+    ----------
+    filepath: Path to a GFF3 file
+    groupBy: how to group features
+    scafList: optional list of scaffolds to restrict output to
+    memBytes: optional memory budget in bytes
+    tmpDir: directory for the temporary file used with memBytes
+    """
+
+    def spill():
+        """Writes the buffered coordinates to the temporary file."""
+        for (group, scaf), coords in buffered.items():
+            if group not in gffFeats:
+                gffFeats[group] = SpilledCoords(tmpFl)
+            gffFeats[group].write(scaf, coords)
+        buffered.clear()
+
+    if memBytes != None:
+        tmpFl = tempfile.TemporaryFile(dir=tmpDir)
+        # {(group, scaf):array('q') of alternating starts and ends}
+        buffered = {}
+        bufferedBytes = 0
+    if scafList != None:
+        scafSet = set(scafList)
+    if groupBy != None and groupBy.startswith('attr:'):
+        attrPattern = re.compile('(?:^|;){0}=([^;\n]*)'.format(
+                                                   re.escape(groupBy[5:])))
+    gffFeats = {}
     with open(filepath) as fl:
-        gffFeats = {}
         for line in fl:
             # skip commented lines
-            if not line.startswith('#'):
-                contents = line.strip().split('\t')
-                scaf = contents[0]
-                start = int(contents[3]) - 1
-                end = int(contents[4]) - 1
-                if scaf in gffFeats:
-                    gffFeats[scaf].append((start, end))
-                else:
-                    gffFeats[scaf] = [(start, end)]
-        # for each scaffold, sort features by length then merge
-        # all overlapping adjacent features
-        for scaf in gffFeats:
-            gffFeats[scaf] = sorted(gffFeats[scaf], key=lambda x:x[0])
-            newScafFeats = []
-            currentFeat = gffFeats[scaf][0]
-            i = 0
-            while i < len(gffFeats[scaf]) - 1:
-                mergeResult = mergeCoords(currentFeat, gffFeats[scaf][i + 1])
-                # adjacent features do not overlap: save the first as
-                # a feature in the processed merged set and set the
-                # second as the next feature to check for overlaps
-                if mergeResult[1] == 0:
-                    newScafFeats.append(mergeResult[0][0])
-                    currentFeat = mergeResult[0][1]
-                # features overlap: merge them and continue to check
-                # if they overlap with the next adjacent feature
-                elif mergeResult[1] == 1:
-                    currentFeat = mergeResult[0][0]
-                elif mergeResult[1] == 2:
-                    currentFeat = mergeResult[0][0]
+            if line.startswith('#'):
+                continue
+            contents = line.split('\t')
+            scaf = contents[0]
+            if scafList != None and scaf not in scafSet:
+                continue
+            if groupBy == None:
+                group = None
+            elif groupBy == 'type':
+                group = contents[2]
+            elif groupBy == 'source':
+                group = contents[1]
+            else:
+                attrValue = attrPattern.search(contents[8])
+                group = attrValue.group(1) if attrValue else 'None'
+            # buffer coordinates to write to the temporary file
+            if memBytes != None:
+                if (group, scaf) in buffered:
+                    buffered[(group, scaf)].extend((int(contents[3]) - 1,
+                                                    int(contents[4]) - 1))
                 else:
-                    raise Exception("Unexpected result from mergeResult block")
-                i += 1
-            newScafFeats.append(currentFeat)
-            gffFeats[scaf] = newScafFeats
-        # if a scaffold list to restrict output to hasn't been provided
-        # then set the scaffolds to output as the scaffolds with
-        # features
-        if scafList == None:
-            scafList = sorted(list(gffFeats.keys()))
-        # for each scaffold create a set of windows, the last of which will be
-        # the length from the end of the second to last window to the end of
-        # the scaffold
-        for scaf in scafList:
-            windows = {}
-            # for cumulative length of all features in window
-            windowFeatLens = {}
-            lastWindowEnd = 0
-            currentWindow = 0
-            # generate windows for each scaffold
-            while lastWindowEnd < scafLens[scaf] - windowLen + 1:
-                windows[currentWindow] = genWindowCoords(currentWindow, windowLen)
-                windowFeatLens[currentWindow] = 0
-                lastWindowEnd = windows[currentWindow][1]
-                currentWindow += 1
-            assert lastWindowEnd <= scafLens[scaf], ("During window generation "
-                                  "window extends beyond length of scaffold.")
-            # generate the window for the last scaffold (may be shorter than
-            # the window size)
-            if lastWindowEnd < scafLens[scaf]:
-                windows[currentWindow] = (lastWindowEnd + 1, scafLens[scaf])
-                windowFeatLens[currentWindow] = 0
-            # calculate proportion of window occupied by any feature by summing
-            # the lengths of the each feature. This is output as the density
-            # 4th column in the Circos heatmap file
-            if scaf in gffFeats:
-                for feature in gffFeats[scaf]:
-                    startWindow = whichWindow(feature[0], windowLen)
-                    endWindow = whichWindow(feature[1], windowLen)
-                    windowSpread = endWindow - startWindow
-                    assert windowSpread >= 0, ("windowSpread < 0, check "
-                                                "whichWhindow() implementation")
-                    # feature is fully contained in one window: add the length
-                    # of this feature to the running total
-                    if windowSpread == 0:
-                        windowFeatLens[startWindow] += (feature[1] - feature[0])
-                        assert windowFeatLens[startWindow] <= windowLen, ("1: "
-                                   "window coverage greater than window length")
-                    # feature is spread across two or more winodws: add the
-                    # length of the fraction of this feature within each
-                    # window to the running totals of each window
-                    elif windowSpread >= 1:
-                        windowFeatLens[startWindow] += (windows[startWindow][1] 
-                                                        - feature[0])
-                        windowFeatLens[endWindow] += (feature[1] 
-                                                      -  windows[endWindow][0])
-                        assert windowFeatLens[startWindow] <= windowLen, ("2.start: "
-                                  "window coverage greater than window length")
-                        assert windowFeatLens[endWindow] <= windowLen, ("2.end:"
-                                 " window coverage greater than window length")
-                        # feature is spread across three or more windows:
-                        # for each internal window mark the density as 100%
-                        if windowSpread > 1:
-                            for i in range(startWindow+1, endWindow):
-                                windowFeatLens[i] += windowLen
-                                assert windowFeatLens[i] <= windowLen, ("3. "
-                                  "window coverage greater than window length")
-                # this scaffold contains features. output Circos heatmap line
-                for i in range(len(windowFeatLens)):
-                    propFeatInWindow = windowFeatLens[i]/windowLen
-                    windowStart = windows[i][0]
-                    windowEnd = windows[i][1]
-                    print('{0}\t{1}\t{2}\t{3:.10f}'.format(scaf, windowStart, 
-                                                  windowEnd, propFeatInWindow))
-            # this scaffold contains no features. output lines with 0 for every
-            # value in the density column
+                    buffered[(group, scaf)] = array('q', 
+                                                    (int(contents[3]) - 1,
+                                                     int(contents[4]) - 1))
+                bufferedBytes += 16
+                if bufferedBytes >= memBytes:
+                    spill()
+                    bufferedBytes = 0
+                continue
+            if group not in gffFeats:
+                gffFeats[group] = {}
+            groupFeats = gffFeats[group]
+            if scaf in groupFeats:
+                groupFeats[scaf][0].append(int(contents[3]) - 1)
+                groupFeats[scaf][1].append(int(contents[4]) - 1)
             else:
-                for i in windows:
-                    print('{0}\t{1}\t{2}\t{3:.10f}'.format(scaf, windows[i][0], 
-                                                             windows[i][1], 0))
-            for i in windowFeatLens:
-                assert windowFeatLens[i] <= windowLen, ("4. window coverage"
-                                                 " greater than window length")
+                groupFeats[scaf] = ([int(contents[3]) - 1],
+                                    [int(contents[4]) - 1])
+    if memBytes != None:
+        spill()
+    return gffFeats
+
+def writeHeatmap(outFl, scafFeats, scafLens, windowLen, scafList):
+    """For each scaffold in scafList creates a set of windows and
+    writes the proportion of each window occupied by any feature in
+    scafFeats, a dictionary {scaf:([starts], [ends])}, as the density
+    4th column in the Circos heatmap file outFl. Scaffolds are removed
+    from scafFeats as they are written. scafFeats may also be a
+    SpilledCoords.
+    """
+    for scaf in scafList:
+        windowStarts, windowEnds = windowCoords(scafLens[scaf], windowLen)
+        if scaf in scafFeats:
+            featStarts, featEnds = scafFeats.pop(scaf)
+            windowFeatLens = windowCoverage(np.array(featStarts, 
+                                                     dtype=np.int64),
+                                            np.array(featEnds, dtype=np.int64),
+                                            len(windowStarts), windowLen)
+        # this scaffold contains no features. output lines with 0 for
+        # every value in the density column
+        else:
+            windowFeatLens = np.zeros(len(windowStarts), dtype=np.int64)
+        propFeatInWindow = (windowFeatLens / windowLen).tolist()
+        outFl.write(''.join(['{0}\t{1}\t{2}\t{3:.10f}\n'.format(scaf, *window) 
+                             for window in zip(windowStarts.tolist(), 
+                                               windowEnds.tolist(), 
+                                               propFeatInWindow)]))
+
+def gff2circosHeatmap(filepath, 
+                      scafLens, 
+                      windowLen, 
+                      scafList=None,
+                      groupBy=None,
+                      outPrefix=None,
+                      memBytes=None,
+                      tmpDir=None):
+    """1. Reads scaf, start, and start for features in GFF3 file into 
+       memory, grouped per groupBy
+    2. Creates all windows for a given scaf
+    3. Calculates the proportion of each window covered by features
+       with windowCoverage() and outputs it to stdout or, if groupBy
+       is used, to one file per group
+
+    Arguments:
+    ----------
+    filepath: Path to a GFF3 file
+    scafLens: Dictionary with lengths of sequences represented in the
+              GFF3 file
+    windowLen: The number of bases in each window
+    scafList: optional list of scaffolds to restrict output to
+    groupBy: optional 'type', 'source', or 'attr:<key>'
+    outPrefix: prefix of the files written if groupBy is used
+    memBytes: optional memory budget in bytes, see readGFFcoords()
+    tmpDir: directory for temporary files used with memBytes
+    """
+    gffFeats = readGFFcoords(filepath, groupBy, scafList, memBytes, tmpDir)
+    # if a scaffold list to restrict output to hasn't been provided
+    # then set the scaffolds to output as the scaffolds with
+    # features in any group
+    if scafList == None:
+        scafList = sorted(set(scaf for group in gffFeats 
+                                   for scaf in gffFeats[group]))
+    if groupBy == None:
+        writeHeatmap(sys.stdout, gffFeats.get(None, {}), scafLens, windowLen,
+                     scafList)
+    else:
+        if outPrefix == None:
+            outPrefix = os.path.basename(filepath)
+        # keep group names that are unsafe in file names readable, and
+        # check that no two groups are written to the same file before
+        # writing any
+        fileGroups = {}
+        for group in sorted(gffFeats.keys()):
+            groupFile = '{0}.{1}.txt'.format(outPrefix,
+                                     re.sub('[^A-Za-z0-9_.-]', '_', group))
+            if groupFile in fileGroups:
+                print('Groups {0} and {1} would both be written to {2}'
+                      .format(fileGroups[groupFile], group, groupFile),
+                      file=sys.stderr)
+                sys.exit(1)
+            fileGroups[groupFile] = group
+        for groupFile, group in fileGroups.items():
+            with open(groupFile, 'w') as outFl:
+                writeHeatmap(outFl, gffFeats.pop(group), scafLens, windowLen,
+                             scafList)
 
 
 if __name__ == '__main__':
@@ -311,5 +444,29 @@ if __name__ == '__main__':
         scafLens = parseLenFile(scafLens_filepath)
     # read the window length
     windowLen = int(args[args.index('-window') +1])
+    # read the optional grouping of features and output file prefix
+    if '-groupBy' in args:
+        groupBy = args[args.index('-groupBy') +1]
+        if groupBy not in ('type', 'source') and not groupBy.startswith(
+                                                                   'attr:'):
+            print('-groupBy must be type, source, or attr:<key>', 
+                                                          file=sys.stderr)
+            sys.exit(1)
+    else:
+        groupBy = None
+    if '-out' in args:
+        outPrefix = args[args.index('-out') +1]
+    else:
+        outPrefix = None
+    # read the optional memory budget
+    if '-mem' in args:
+        memBytes = int(args[args.index('-mem') +1]) * 1024 * 1024
+    else:
+        memBytes = None
+    if '-tmpDir' in args:
+        tmpDir = args[args.index('-tmpDir') +1]
+    else:
+        tmpDir = None
     # calculate and output the Circos heatmap
-    gff2circosHeatmap(gff_filepath, scafLens, windowLen, scafList)
+    gff2circosHeatmap(gff_filepath, scafLens, windowLen, scafList, groupBy,
+                      outPrefix, memBytes, tmpDir)
@@ -1,179 +1,743 @@
 #!/usr/bin/env python3
 
+import re
 import sys
+import math
+import heapq
+from array import array
+from multiprocessing import Pool
+from fastaIndex import FastaIndex, reverseComplement
+from intervalIndex import IntervalIndex
 
 
-class GFF3_line:
-    """A class to represet GFF3 lines and allow modification of the
-    values of its fields.
+def help():
+    print('''
+        Usage:
+        ------------
+        gff2introns.py [options] < input.gff > output.txt
+
+        Description:
+        ------------
+        Takes a GFF3 on stdin and outputs a list of intron lengths to
+        stdout and a list of number of exons for each transcript to
+        stderr. Instead of a list of lengths and exon counts, GFF3 lines
+        for each intron are output if -gff is used.
+
+        Exons are grouped into transcripts by their Parent attribute, so
+        each isoform of a gene gets its own introns. Exons with more
+        than one Parent are part of each of them. An exon without a
+        Parent is part of the shortest gene (feature without a Parent)
+        on the same seqid that contains it, whether the gene comes
+        before or after the exon, so genes sharing a start with their
+        first exon can follow it as gffSort.py orders them. Exons
+        without a Parent that are not within such a feature are
+        ignored. The exons of each transcript are sorted and an
+        intron is output between each pair of successive exons that do
+        not overlap or touch. Introns are numbered in order of position
+        and have the ID <transcript>:intron_<n> and the Parent
+        <transcript>.
+
+        The input GFF3 is expected to be sorted by seqid and start
+        coordinate (see gffSort.py). Each transcript is output as soon
+        as the gene it belongs to ends, so only the genes overlapping
+        the current position are held in memory. Unsorted input is
+        detected and reported unless -unsorted is used.
+
+        With -stats, a summary of the intron lengths, number of exons
+        per transcript, exon lengths, and transcript spans (first exon
+        start to last exon end) is output instead, computed in the same
+        pass. For each distribution the count, mean, minimum, 5th, 25th,
+        50th (median), 75th, and 95th percentiles, and maximum are
+        output, followed by a histogram with bins doubling in width
+        (1, 2-3, 4-7, 8-15, ...). Exons shared by several transcripts
+        are counted once for each transcript.
+
+        With -fasta, the donor and acceptor dinucleotides at the ends
+        of each intron are read from the genome sequence and a
+        splice_motif attribute such as GT-AG is added to each intron
+        in the GFF3 output. Motifs of introns on the - strand are read
+        from the reverse complement. Introns on a seqid not in the
+        FASTA or extending past the end of its sequence get the motif
+        NA. A tally of the motifs, marking those other than the
+        canonical GT-AG, GC-AG, and AT-AC and counting NA separately
+        as unavailable, is output to stderr, or after the report with
+        -stats. Fractions are of the introns with a motif. Only the
+        needed bases are read using a FASTA index (<fasta>.fai), which
+        is built if needed (see fastaIndex.py).
+
+        Options:
+        ------------
+        -gff            Output GFF3 of intron features instead of a
+                        list of intron lengths and exon counts
+
+        -fasta <path>   Genome FASTA for splice motifs. Implies -gff
+                        unless -stats is used.
+
+        -stats          Output summary statistics instead of a list of
+                        intron lengths and exon counts
+
+        -approx         With -stats, estimate percentiles from bins 2%
+                        wide instead of keeping every value, so memory
+                        use does not grow with the number of introns
+
+        -unsorted       Read the whole GFF3 into memory so it does not
+                        need to be sorted. Transcripts are output in the
+                        order their genes first occur.
+
+        -threads <int>  Process each seqid separately, this many at
+                        once. The output of each seqid is written in
+                        the order the seqids first occur.
+        ''', file=sys.stderr)
+    sys.exit(0)
+
+
+# ID and Parent attributes in the attributes column
+ATTR_ID = re.compile('(?:^|;)ID=([^;]*)')
+ATTR_PARENT = re.compile('(?:^|;)Parent=([^;]*)')
+
+
+class UnsortedError(Exception):
+    """Raised when input expected to be sorted is not."""
+
+
+class Transcript:
+    """A class to represent the exons of a transcript.
 
     Attributes:
     ------------
-    field0, ..., field8   strings containing the values of each field
-                          in a GFF3 line
-    attributes            a dictionary containing the key-value pairs
-                          in the GFF3 line 9th field
+    id          the value of the Parent attribute of the exons
+    seqid       seqid of the first exon
+    source      source of the first exon
+    strand      strand of the first exon
+    exons       list of (start, end) of the exons in input order
 
-    Methods:    
+    Methods:
     ------------
-    str()               Outputs GFF3 line
-    repr()              Outputs GFF3 line
-    refreshAttrStr()    This needs to be called if changes were made to
-                        any of the attributes. It refreshes
+    introns()   Returns the introns between the exons
     """
+    def __init__(self, transcriptId, seqid, source, strand):
+        self.id = transcriptId
+        self.seqid = seqid
+        self.source = source
+        self.strand = strand
+        self.exons = []
 
-    def __init__(self, line):
-        """GFF3_line is initialized to contain the fields of the GFF3
-        line provided as attributes. The attributes are kept in a
-        dictionary and a the keys are ordered in a list to preserve
-        the order of attributes upon getting the sring representation
-        of the line from the GFF3_line object.
+    def introns(self):
+        """Returns a list of (start, end) of the gaps between the exons
+        sorted by start. Overlapping or adjacent exons have no intron
+        between them.
         """
-        (self.seqid, 
-         self.source, 
-         self.type, 
-         self.start, 
-         self.end, 
-         self.score, 
-         self.strand, 
-         self.phase, 
-         self.attributes_str) = line.strip().split('\t')
-        # preserve attribute order as a list of keys (attributes_order)
-        attributes_list = self.attributes_str.split(';')
-        self.attributes_order = [attr.split('=')[0] for attr in 
-                                                               attributes_list]
-        # store attribute keys and their values in a dictionary
-        self.attributes = {attr.split('=')[0]:attr.split('=')[1] for attr in 
-                                                               attributes_list}
-        # rename the name attribute key to Name so it conforms to the
-        # GFF3 specification, where Name is a reserved attribute key
-        if 'name' in self.attributes:
-            self.attributes['Name'] = self.attributes.pop('name')
-            self.attributes_order[self.attributes_order.index('name')] = 'Name'
-
-    def __repr__(self):
-        """Output for overloaded functions str() and repr()"""
-        return '\t'.join([str(self.seqid), 
-                          str(self.source), 
-                          str(self.type), 
-                          str(self.start), 
-                          str(self.end), 
-                          str(self.score), 
-                          str(self.strand), 
-                          str(self.phase), 
-                          str(self.attributes_str)])
-
-    def refreshAttrStr(self):
-        """If the attributes dictionary or attributes_order has been 
-        altered this should be called to update attributes_str.
+        introns = []
+        lastEnd = None
+        for start, end in sorted(self.exons):
+            if lastEnd != None and start > lastEnd + 1:
+                introns.append((lastEnd + 1, start - 1))
+            if lastEnd == None or end > lastEnd:
+                lastEnd = end
+        return introns
+
+
+class TranscriptCollector:
+    """A class to group the exons of GFF3 lines into Transcripts and
+    output them when the top-level feature (the root, usually a gene)
+    they belong to has ended. The ends of the open roots are kept in a
+    heap, so that when a line starting after the end of a root is added
+    the root's transcripts are returned. Features are assigned to
+    roots through their Parent attributes. Exons whose parent has not
+    been seen yet are collected under a provisional root that is merged
+    into the real root when the parent is read. The end of a
+    provisional root is not known, so it is kept until the end of its
+    seqid unless its parent is read. Exons without a Parent
+    are held until no more features starting before them can be read
+    and then added to the shortest root enclosing them.
+
+    Methods:
+    ------------
+    add()       Adds a GFF3 line and returns the transcripts finished
+                before it
+    flush()     Returns the transcripts of roots ending before a
+                position, or of all roots
+    """
+    def __init__(self, unsorted=False):
+        self.unsorted = unsorted
+        # {feature ID:root ID}
+        self.rootOf = {}
+        # {root ID:[feature IDs]} so rootOf can be cleaned up
+        self.rootMembers = {}
+        # {root ID:largest end of its features}
+        self.rootEnd = {}
+        # {root ID:{transcript ID:Transcript}}
+        self.rootTranscripts = {}
+        # heap of (end, root ID) of the roots read as features without
+        # a Parent. entries are stale if rootEnd differs
+        self.ends = []
+        # IDs of the roots read as features without a Parent
+        self.realRoots = set()
+        self.seqid = None
+        self.lastStart = 0
+        self.seenSeqids = set()
+        # heap of (end, seqid, start, ID) of the features without a
+        # Parent that can enclose exons still to be read
+        self.topFeatures = []
+        # (seqid, start, end, source, strand) of the exons without a
+        # Parent not yet added to a root
+        self.heldExons = []
+
+    def extendRoot(self, root, end):
+        """Starts a new root or extends the end of an existing one."""
+        if root not in self.rootEnd:
+            self.rootEnd[root] = end
+            self.rootMembers[root] = []
+            self.rootTranscripts[root] = {}
+        elif end > self.rootEnd[root]:
+            self.rootEnd[root] = end
+        else:
+            return
+        if not self.unsorted and root in self.realRoots:
+            heapq.heappush(self.ends, (end, root))
+
+    def attach(self, featureId, root):
+        """Records featureId as part of root. If exons were collected
+        under featureId as a provisional root they are moved to root.
         """
-        self.attributes_str = ';'.join(['='.join(
-             [attr, self.attributes[attr]]) for attr in self.attributes_order])
+        # features such as CDS can have the same ID on several lines
+        if self.rootOf.get(featureId) == root:
+            return
+        self.rootOf[featureId] = root
+        self.rootMembers[root].append(featureId)
+        if featureId in self.rootTranscripts:
+            self.rootTranscripts[root].update(
+                                       self.rootTranscripts.pop(featureId))
+            for member in self.rootMembers.pop(featureId):
+                self.rootOf[member] = root
+                self.rootMembers[root].append(member)
+            self.extendRoot(root, self.rootEnd.pop(featureId))
 
+    def addExon(self, transcriptIds, seqid, start, end, source, strand):
+        """Adds an exon to the Transcripts transcriptIds."""
+        for transcriptId in transcriptIds:
+            root = self.rootOf.get(transcriptId, transcriptId)
+            self.extendRoot(root, end)
+            transcripts = self.rootTranscripts[root]
+            if transcriptId not in transcripts:
+                transcripts[transcriptId] = Transcript(transcriptId, seqid,
+                                                       source, strand)
+            transcripts[transcriptId].exons.append((start, end))
 
-def help():
-    print('''
-        Usage:
-        ------------
-        gff2introns.py < input.gff > output.txt
+    def placeHeldExons(self, position=None):
+        """Adds the held exons starting before position, or all of them
+        if position is None, to the shortest feature without a Parent
+        on their seqid that encloses them. Exons without one are
+        dropped.
+        """
+        if self.heldExons == []:
+            return
+        if position == None:
+            held = self.heldExons
+            self.heldExons = []
+        else:
+            held = [exon for exon in self.heldExons if exon[1] < position]
+            self.heldExons = [exon for exon in self.heldExons
+                              if exon[1] >= position]
+        if held == []:
+            return
+        if self.unsorted:
+            index = IntervalIndex()
+            for end, featureSeqid, start, featureId in self.topFeatures:
+                index.add(featureSeqid, start, end, featureId)
+        for seqid, start, end, source, strand in held:
+            if self.unsorted:
+                features = index.overlapping(seqid, start, end)
+            else:
+                features = [(featureStart, featureEnd, featureId)
+                            for featureEnd, featureSeqid, featureStart,
+                                featureId in self.topFeatures]
+            best = None
+            for featureStart, featureEnd, featureId in features:
+                if (featureStart <= start and featureEnd >= end
+                     and (best == None or featureEnd - featureStart
+                                          < best[1] - best[0])):
+                    best = (featureStart, featureEnd, featureId)
+            if best != None:
+                self.addExon([best[2]], seqid, start, end, source, strand)
 
-        Description:
-        ------------
-        Takes a GFF3 on stdin and outputs a list of intron lengths to
-        stdout and a list of number of exons for each gene to stderr.
-        Instead of a list of lengths and exon counts, GFF3 lines for 
-        each intron are output if -gff is used. This script assumes the 
-        input GFF3 is sorted by start coordinate and that features of 
-        type exon follow the gene of which they are a part.
+    def finishRoot(self, root):
+        """Removes a root and returns a list of its Transcripts."""
+        for member in self.rootMembers.pop(root):
+            del self.rootOf[member]
+        del self.rootEnd[root]
+        self.realRoots.discard(root)
+        return list(self.rootTranscripts.pop(root).values())
 
-        Options:
-        ------------
-        -gff    Output GFF3 of intron features instead of 
-        ''')
-    sys.exit(0)
+    def flush(self, position=None):
+        """Returns a list of the Transcripts of roots ending before
+        position, or of all roots if position is None.
+        """
+        finished = []
+        self.placeHeldExons(position)
+        if position == None:
+            self.topFeatures = []
+            for root in list(self.rootTranscripts):
+                finished += self.finishRoot(root)
+            self.ends = []
+            return finished
+        while self.topFeatures and self.topFeatures[0][0] < position:
+            heapq.heappop(self.topFeatures)
+        while self.ends and self.ends[0][0] < position:
+            end, root = heapq.heappop(self.ends)
+            if self.rootEnd.get(root) == end:
+                finished += self.finishRoot(root)
+        return finished
 
+    def add(self, line):
+        """Adds a GFF3 feature line and returns a list of Transcripts
+        that ended before it. Raises UnsortedError if the lines are not
+        sorted by seqid and start and unsorted is False.
+        """
+        fields = line.rstrip('\n').split('\t')
+        seqid = fields[0]
+        start = int(fields[3])
+        end = int(fields[4])
+        finished = []
+        if not self.unsorted:
+            if seqid != self.seqid:
+                if seqid in self.seenSeqids:
+                    raise UnsortedError('Input is not sorted: {0} occurs '
+                                        'in more than one place'.format(seqid))
+                self.seenSeqids.add(seqid)
+                finished = self.flush()
+                self.seqid = seqid
+                self.lastStart = 0
+            elif start < self.lastStart:
+                raise UnsortedError('Input is not sorted: {0} {1} follows '
+                                    '{2}'.format(seqid, start, self.lastStart))
+            self.lastStart = start
+            finished += self.flush(start)
+        parent = ATTR_PARENT.search(fields[8])
+        if fields[2] == 'exon':
+            if parent:
+                self.addExon(parent.group(1).split(','), seqid, start, end,
+                             fields[1], fields[6])
+            else:
+                self.heldExons.append((seqid, start, end, fields[1],
+                                       fields[6]))
+        else:
+            featureId = ATTR_ID.search(fields[8])
+            if featureId == None:
+                return finished
+            featureId = featureId.group(1)
+            if parent:
+                parentId = parent.group(1).split(',')[0]
+                root = self.rootOf.get(parentId, parentId)
+            else:
+                root = featureId
+                heapq.heappush(self.topFeatures, (end, seqid, start,
+                                                  featureId))
+                # exons read before the root can now end with it
+                if root not in self.realRoots:
+                    self.realRoots.add(root)
+                    if root in self.rootEnd and not self.unsorted:
+                        heapq.heappush(self.ends, (self.rootEnd[root], root))
+            self.extendRoot(root, end)
+            if featureId != root:
+                self.attach(featureId, root)
+        return finished
 
-# Get parameters
-args = sys.argv
-# If asked for help or insufficient parameters
-if "-help" in args or "-h" in args:
-    help()
-exon_count = None
-last_exon_end = None
-gene = None
-# read each line of gff input and output one gff3 intron line for each
-# pair of successive exons in each gene
-if '-gff' in args:
-    for line in sys.stdin:
-        # ignore commented lines
-        if not line.startswith('#'):
-            gffLine = GFF3_line(line)
-            contents = line.strip().split('\t')
-            if contents[2] == 'gene':
-                # use exon counts to calculate intron counts for
-                # inclusion in the value of the new intron feature gff
-                # line's ID attribute
-                exon_count = 0
-                # reset this variable to mark the first exon in a
-                # gene
-                last_exon_end = None
-                continue
-            elif contents[2] == 'exon':
-                exon_count += 1
-                # this is the second of a pair of successive exons.
-                # use the exon coordinates to formulate an intron line
-                # with appropriate coordinates
-                if not last_exon_end == None:
-                    intronStart = last_exon_end + 1
-                    intronEnd = int(contents[3]) - 1
-                    gffLine.type = 'intron'
-                    gffLine.start = str(intronStart)
-                    gffLine.end = str(intronEnd)
-                    gffLine.score = '.'
-                    gffLine.phase = '.'
-                    # get the gene name from this exon's ID attribute
-                    # and format the intron's ID attribute as
-                    # geneName-intron_number
-                    # assumes the naming convention used is
-                    # geneName-exonName
-                    gffLine.attributes['ID'] = gffLine.attributes['ID'].split(
-                                 '-')[0] + ':intron_{0}'.format(exon_count - 1)
-                    gffLine.refreshAttrStr()
-                    # output the new intron gff line
-                    print(str(gffLine))
-                    last_exon_end = int(contents[4])
-                # mark this exon as the first in the gene and continue
-                else:
-                    last_exon_end = int(contents[4])
-# read each line of gff input and output a list of intron lengths and a
-# list of exon counts to stdout and sterr respectively
-else:
-    for line in sys.stdin:
-        if not line.startswith('#'):
-            contents = line.strip().split('\t')
-            if contents[2] == 'gene':
-                # output the last gene's exon count to stderr
-                if not exon_count == None:
-                    print('{0}\t{1}'.format(gene, exon_count), file=sys.stderr)
-                exon_count = 0
-                last_exon_end = None
-                # extract gene ID. assumes the ID key is the first key
-                # in the attributes column
-                gene = contents[8].split(';')[0].split('=')[1]
+
+class Distribution:
+    """A class to accumulate a distribution of positive integers one
+    value at a time. The count, total, minimum, maximum, and histogram
+    are kept as running values. For exact percentiles all values are
+    kept in a compact array. For approximate percentiles only the
+    counts of values in bins of width ratio 2**(1/APPROX_BINS) are kept.
+
+    Attributes:
+    ------------
+    name        name of the distribution in the report
+    count       number of values
+    total       sum of the values
+    min, max    smallest and largest values
+    histogram   {k:number of values from 2**(k-1) to 2**k - 1}
+
+    Methods:
+    ------------
+    add()       Adds a value
+    merge()     Adds the values of another Distribution
+    quantile()  Returns a percentile as a fraction, e.g. 0.5
+    """
+    # bins per doubling for approximate percentiles
+    APPROX_BINS = 32
+
+    def __init__(self, name, approximate=False):
+        self.name = name
+        self.approximate = approximate
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.histogram = {}
+        if approximate:
+            # {bin index:count}
+            self.bins = {}
+        else:
+            self.values = array('q')
+            self.isSorted = True
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.min == None or value < self.min:
+            self.min = value
+        if self.max == None or value > self.max:
+            self.max = value
+        # the number of binary digits is the histogram bin
+        k = value.bit_length()
+        self.histogram[k] = self.histogram.get(k, 0) + 1
+        if self.approximate:
+            index = int(math.log2(value) * self.APPROX_BINS) if value > 0 \
+                                                                      else -1
+            self.bins[index] = self.bins.get(index, 0) + 1
+        else:
+            self.values.append(value)
+            self.isSorted = False
+
+    def merge(self, other):
+        """Adds the values of other, a Distribution of the same kind."""
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.total += other.total
+        if self.min == None or other.min < self.min:
+            self.min = other.min
+        if self.max == None or other.max > self.max:
+            self.max = other.max
+        for k, count in other.histogram.items():
+            self.histogram[k] = self.histogram.get(k, 0) + count
+        if self.approximate:
+            for index, count in other.bins.items():
+                self.bins[index] = self.bins.get(index, 0) + count
+        else:
+            self.values.extend(other.values)
+            self.isSorted = False
+
+    def quantile(self, q):
+        """Returns the value below which a fraction q of the values
+        fall, interpolating between the two nearest values as
+        statistics.median() does. Approximate percentiles are the
+        geometric middle of the bin the percentile falls in.
+        """
+        position = q * (self.count - 1)
+        if not self.approximate:
+            if not self.isSorted:
+                self.values = array('q', sorted(self.values))
+                self.isSorted = True
+            lower = self.values[math.floor(position)]
+            upper = self.values[math.ceil(position)]
+            return lower + (upper - lower) * (position - math.floor(position))
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > position:
+                if index < 0:
+                    return 0
+                middle = 2 ** ((index + 0.5) / self.APPROX_BINS)
+                return min(max(middle, self.min), self.max)
+
+    def report(self):
+        """Returns a tuple (summary line, histogram lines) of text."""
+        if self.count == 0:
+            summary = [self.name, '0'] + ['NA'] * 8
+        else:
+            summary = ([self.name, str(self.count),
+                        '{0:.1f}'.format(self.total / self.count),
+                        str(self.min)]
+                       + ['{0:.1f}'.format(self.quantile(q)) 
+                          for q in (0.05, 0.25, 0.5, 0.75, 0.95)]
+                       + [str(self.max)])
+        histogram = ['{0}\t{1}-{2}\t{3}\n'.format(self.name,
+                                 2 ** (k - 1) if k > 0 else 0, 2 ** k - 1,
+                                 self.histogram[k])
+                     for k in sorted(self.histogram)]
+        return ('\t'.join(summary) + '\n', ''.join(histogram))
+
+
+class TranscriptStats:
+    """A class to accumulate the distributions of intron length, exon
+    count, exon length, and transcript span of Transcripts.
+
+    Methods:
+    ------------
+    add()       Adds a Transcript
+    merge()     Adds the Transcripts of another TranscriptStats
+    report()    Returns the report as text
+    """
+    def __init__(self, approximate=False):
+        self.distributions = [Distribution(name, approximate) for name in
+                              ('intron_length', 'exon_count', 'exon_length',
+                               'transcript_span')]
+
+    def add(self, transcript):
+        intronLength, exonCount, exonLength, span = self.distributions
+        for start, end in transcript.introns():
+            intronLength.add(end - start + 1)
+        exonCount.add(len(transcript.exons))
+        for start, end in transcript.exons:
+            exonLength.add(end - start + 1)
+        span.add(max(end for start, end in transcript.exons)
+                 - min(start for start, end in transcript.exons) + 1)
+
+    def merge(self, other):
+        for distribution, otherDistribution in zip(self.distributions,
+                                                   other.distributions):
+            distribution.merge(otherDistribution)
+
+    def report(self):
+        summaries, histograms = zip(*[distribution.report() for
+                                      distribution in self.distributions])
+        return ('#distribution\tcount\tmean\tmin\tq05\tq25\tmedian\tq75\t'
+                'q95\tmax\n' + ''.join(summaries)
+                + '#distribution\tbin\tcount\n' + ''.join(histograms))
+
+
+class SpliceMotifs:
+    """A class to read the splice site dinucleotides of introns from an
+    indexed FASTA and tally them. The FASTA is opened on first use so
+    that a SpliceMotifs can be sent to another process before use.
+
+    Attributes:
+    ------------
+    fastaPath   path to the FASTA
+    counts      {motif:number of introns}
+
+    Methods:
+    ------------
+    motif()     Returns and tallies the motif of an intron
+    merge()     Adds the tally of another SpliceMotifs
+    report()    Returns the tally as text
+    """
+    CANONICAL = ('GT-AG', 'GC-AG', 'AT-AC')
+
+    def __init__(self, fastaPath):
+        self.fastaPath = fastaPath
+        self.fasta = None
+        self.counts = {}
+
+    def __getstate__(self):
+        # the memory map of the FASTA can not be sent between processes
+        state = self.__dict__.copy()
+        state['fasta'] = None
+        return state
+
+    def motif(self, seqid, start, end, strand):
+        """Returns the motif donor-acceptor of the intron start-end on
+        seqid, reading from the reverse complement if strand is -, or NA
+        if seqid is not in the FASTA or the intron is not within it.
+        """
+        if self.fasta == None:
+            self.fasta = FastaIndex(self.fastaPath)
+        if (seqid not in self.fasta
+             or start < 1
+             or end > self.fasta.length(seqid)):
+            motif = 'NA'
+        else:
+            donor = self.fasta.fetch(seqid, start, start + 1).upper()
+            acceptor = self.fasta.fetch(seqid, end - 1, end).upper()
+            if strand == '-':
+                donor, acceptor = (reverseComplement(acceptor),
+                                   reverseComplement(donor))
+            motif = '{0}-{1}'.format(donor, acceptor)
+        self.counts[motif] = self.counts.get(motif, 0) + 1
+        return motif
+
+    def merge(self, other):
+        for motif, count in other.counts.items():
+            self.counts[motif] = self.counts.get(motif, 0) + count
+
+    def report(self):
+        # introns with a motif, which the fractions are of
+        total = sum(count for motif, count in self.counts.items()
+                    if motif != 'NA')
+        lines = ['#splice_motif\tcount\tfraction\tclass\n']
+        for motif in sorted(self.counts, key=lambda m:(-self.counts[m], m)):
+            if motif == 'NA':
+                lines.append('NA\t{0}\tNA\tunavailable\n'.format(
+                                                         self.counts[motif]))
                 continue
-            elif contents[2] == 'exon':
-                exon_count += 1
-                # if this is the second of a pair of successive exons
-                # then calculate the length between them as the intron
-                # length and output that to stdout
-                if not last_exon_end == None:
-                    intronStart = last_exon_end + 1
-                    intronEnd = int(contents[3]) - 1
-                    intronLen = intronEnd - intronStart + 1
-                    print('{0}\t{1}'.format(gene, intronLen))
-                    last_exon_end = int(contents[4])
-                # mark this as the first gene's exon encountered
-                else:
-                    last_exon_end = int(contents[4])
-    # output the last gene's exon count to stderr
-    print('{0}\t{1}'.format(gene, exon_count), file=sys.stderr)
+            if motif in self.CANONICAL:
+                motifClass = 'canonical'
+            else:
+                motifClass = 'non-canonical'
+            lines.append('{0}\t{1}\t{2:.4f}\t{3}\n'.format(motif,
+                          self.counts[motif], self.counts[motif] / total,
+                          motifClass))
+        return ''.join(lines)
+
+
+def featureLines(lines):
+    """Generator that yields the feature lines of a GFF3, stopping at
+    a ##FASTA section.
+    """
+    for line in lines:
+        if line.startswith('##FASTA'):
+            return
+        if line.startswith('#') or line.strip() == '':
+            continue
+        yield line
+
+def readTranscripts(lines, unsorted=False):
+    """Generator that yields the Transcripts in GFF3 lines."""
+    collector = TranscriptCollector(unsorted)
+    for line in featureLines(lines):
+        yield from collector.add(line)
+    yield from collector.flush()
+
+def formatTranscript(transcript, gffMode, motifs=None):
+    """Returns a tuple (stdout text, stderr text) of the output for a
+    Transcript: the GFF3 lines of its introns if gffMode is True,
+    otherwise its intron lengths and exon count. If motifs is a
+    SpliceMotifs the GFF3 lines get a splice_motif attribute.
+    """
+    introns = transcript.introns()
+    if gffMode:
+        lines = []
+        for n, (start, end) in enumerate(introns, 1):
+            lines.append('{0}\t{1}\tintron\t{2}\t{3}\t.\t{4}\t.\t'
+                         'ID={5}:intron_{6};Parent={5}'.format(
+                                transcript.seqid, transcript.source, start,
+                                end, transcript.strand, transcript.id, n))
+            if motifs != None:
+                lines.append(';splice_motif={0}'.format(motifs.motif(
+                           transcript.seqid, start, end, transcript.strand)))
+            lines.append('\n')
+        return (''.join(lines), '')
+    return (''.join(['{0}\t{1}\n'.format(transcript.id, end - start + 1)
+                     for start, end in introns]),
+            '{0}\t{1}\n'.format(transcript.id, len(transcript.exons)))
+
+def processTranscripts(transcripts, gffMode, stats=None, motifs=None):
+    """Generator that yields a tuple (stdout text, stderr text) of the
+    output for each of transcripts. If stats is a TranscriptStats the
+    transcripts are added to it instead of being output. If motifs is
+    a SpliceMotifs the splice motifs of the introns are tallied.
+    """
+    for transcript in transcripts:
+        if stats != None:
+            stats.add(transcript)
+            if motifs != None:
+                for start, end in transcript.introns():
+                    motifs.motif(transcript.seqid, start, end,
+                                 transcript.strand)
+            continue
+        yield formatTranscript(transcript, gffMode, motifs)
+
+def processBatch(batch):
+    """Returns a tuple (stdout text, stderr text, stats, motifs) of the
+    output for the lines of one seqid. batch is (lines, unsorted,
+    gffMode, stats, motifs), as for processTranscripts().
+    """
+    lines, unsorted, gffMode, stats, motifs = batch
+    out = []
+    err = []
+    for outText, errText in processTranscripts(readTranscripts(lines,
+                                     unsorted), gffMode, stats, motifs):
+        out.append(outText)
+        err.append(errText)
+    return (''.join(out), ''.join(err), stats, motifs)
+
+def seqidBatches(lines, unsorted=False):
+    """Generator that yields a list of the feature lines of each seqid.
+    Raises UnsortedError if a seqid's lines are not together and unsorted
+    is False.
+    """
+    if unsorted:
+        batches = {}
+        for line in featureLines(lines):
+            seqid = line.split('\t', 1)[0]
+            if seqid in batches:
+                batches[seqid].append(line)
+            else:
+                batches[seqid] = [line]
+        yield from batches.values()
+        return
+    batch = []
+    seqid = None
+    seenSeqids = set()
+    for line in featureLines(lines):
+        lineSeqid = line.split('\t', 1)[0]
+        if lineSeqid != seqid:
+            if lineSeqid in seenSeqids:
+                raise UnsortedError('Input is not sorted: {0} occurs in '
+                                    'more than one place'.format(lineSeqid))
+            seenSeqids.add(lineSeqid)
+            if batch != []:
+                yield batch
+            batch = []
+            seqid = lineSeqid
+        batch.append(line)
+    if batch != []:
+        yield batch
+
+
+if __name__ == '__main__':
+    # Get parameters
+    args = sys.argv
+    # If asked for help or insufficient parameters
+    if "-help" in args or "-h" in args:
+        help()
+    gffMode = '-gff' in args or '-fasta' in args
+    unsorted = '-unsorted' in args
+    if '-stats' in args:
+        stats = TranscriptStats('-approx' in args)
+    else:
+        stats = None
+    if '-fasta' in args:
+        fastaPath = args[args.index('-fasta') + 1]
+        # build the FASTA index once before any worker processes use it
+        try:
+            FastaIndex(fastaPath).close()
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        motifs = SpliceMotifs(fastaPath)
+    else:
+        motifs = None
+    if '-threads' in args:
+        threads = int(args[args.index('-threads') + 1])
+    else:
+        threads = 1
+    try:
+        # process the lines of each seqid in a separate process and
+        # write the output of each seqid in input order
+        if threads > 1:
+            with Pool(threads) as pool:
+                for out, err, batchStats, batchMotifs in pool.imap(
+                            processBatch,
+                            ((batch, unsorted, gffMode,
+                              None if stats == None else
+                              TranscriptStats('-approx' in args),
+                              None if motifs == None else
+                              SpliceMotifs(fastaPath))
+                             for batch in seqidBatches(sys.stdin, unsorted))):
+                    if stats != None:
+                        stats.merge(batchStats)
+                    if motifs != None:
+                        motifs.merge(batchMotifs)
+                    sys.stdout.write(out)
+                    sys.stderr.write(err)
+        # write the output for each transcript when its gene ends
+        else:
+            for out, err in processTranscripts(readTranscripts(sys.stdin,
+                                        unsorted), gffMode, stats, motifs):
+                sys.stdout.write(out)
+                sys.stderr.write(err)
+        if stats != None:
+            sys.stdout.write(stats.report())
+        if motifs != None:
+            if stats != None:
+                sys.stdout.write(motifs.report())
+            else:
+                sys.stderr.write(motifs.report())
+    except UnsortedError as e:
+        print('{0}. Sort it with gffSort.py or use -unsorted.'.format(e),
+                                                               file=sys.stderr)
+        sys.exit(1)
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import os
+import re
 import sys
+from functools import lru_cache
+from intervalIndex import IntervalIndex, coveredLength
 
 
 def help():
@@ -9,6 +13,12 @@ def help():
     ------------
     gffAddAttr.py -gff <filepath> -attr <string> -map <filepath> \\
                       -mapKey <string> > output.gff
+    gffAddAttr.py -gff <filepath> -attr <string> -map <filepath> \\
+                      -mapKey <string> -attr <string> -map <filepath> \\
+                      -mapKey <string> [...] > output.gff
+    gffAddAttr.py -gff <filepath> -config <filepath> > output.gff
+    gffAddAttr.py -gff <filepath> -overlapWith <filepath> \\
+                      -overlapAttr <string> > output.gff
 
     Description: 
     ------------
@@ -42,6 +52,40 @@ def help():
         ID=Gene1;function=protease
         ID=Gene2;function=intracellular_transport
         Name=Repeat1;function=None
+
+    More than one attribute can be added in a single pass through the
+    GFF3 by giving -attr, -map, and -mapKey more than once. The first
+    -attr is joined using the first -map and -mapKey, the second -attr
+    using the second -map and -mapKey, and so on. The joins can also be
+    listed in a file given by -config. The other options apply to all
+    of the joins.
+
+    With -overlapWith, each feature is also annotated with the features
+    in a second GFF3 that overlap it, such as repeats overlapping genes.
+    Only features of the second GFF3 that have the attribute key given
+    by -overlapAttr are used. Four attributes are added:
+
+        overlap_<key>        the distinct values of the -overlapAttr key
+                             among the overlapping features, comma-
+                             separated in order of position, or None
+        overlap_<key>_count  the number of overlapping features with
+                             each of those values, or 0
+        overlap_bp           the number of bases of the feature covered
+                             by the overlapping features
+        overlap_frac         overlap_bp divided by the feature length
+
+    e.g.
+        -overlapWith repeats.gff -overlapAttr Class
+
+    attributes of the modified GFF3:
+    ------------------------------
+        ID=Gene1;overlap_Class=Gypsy,Copia;overlap_Class_count=3,1;
+        overlap_bp=1250;overlap_frac=0.4167
+
+    The second GFF3 is read into memory and indexed by scaffold and
+    start coordinate. The input GFF3 is read once and does not need to
+    be sorted. -overlapWith can be combined with -attr, -map, and
+    -mapKey.
     
 
     Options:
@@ -61,9 +105,30 @@ def help():
                           file, the values of which are present in the
                           first column of the file specified by -map
 
+    -config <filepath>    A tab-delimited file with one join per line
+                          and three columns: the new attribute key
+                          (-attr), the map file (-map), and the
+                          attribute key in the GFF3 (-mapKey). Lines
+                          starting with # are ignored. Joins given on
+                          the command line are applied after these.
+
+    -overlapWith <filepath> A GFF3 file of features to find overlaps
+                          with
+
+    -overlapAttr <string> Attribute key in the -overlapWith GFF3 whose
+                          values are reported, e.g. ID, Name, or Class
+
     -restrictType <string> Only add new attribute to features of this 
                            type
 
+    -mapIndex             Instead of reading the -map file into memory,
+                          look up values in a sorted index of it that
+                          is stored on disk next to the -map file as
+                          <map>.idx (see gffIndex.py). The index is
+                          built on first use and rebuilt when the -map
+                          file changes, so very large maps can be
+                          reused across runs with little memory.
+
     -replace              Replace existing attribute if present
 
     -replaceIfNone        Replace existing attribute only if present
@@ -142,98 +207,251 @@ class GFF3_line:
              [attr, self.attributes[attr]]) for attr in self.attributes_order])
 
 
-# print help information if not eanough arguments are present
-args = sys.argv
-if (len(sys.argv) < 9 
-    or '-h' in args
-    or '-attr' not in args
-    or '-gff' not in args
-    or '-map' not in args
-    or '-mapKey' not in args):
-    help()
-# read the file provided by -map into a dictionary
-attrMap = {}
-with open(sys.argv[sys.argv.index('-map') + 1]) as mapFl:
-    for line in mapFl:
-        try:
-            gene, annot = line.strip().split('\t')
-            attrMap[gene] = annot
-        except:
-            continue
-# read other command line flags
-mapKey = sys.argv[sys.argv.index('-mapKey')+1]
-newAttrKey = sys.argv[sys.argv.index('-attr')+1]
-gffFilepath = sys.argv[sys.argv.index('-gff')+1]
-if '-restrictType' in args:
-    restrictType = sys.argv[sys.argv.index('-restrictType')+1]
-# read gff file and for each line, add the specified attribute and
-# print the line
-with open(gffFilepath) as gffFl:
+def readMap(mapFilepath):
+    """Generator that yields (key, value) for each line of a two-column
+    tab-delimited map file. Lines without two columns are skipped.
+    """
+    with open(mapFilepath) as mapFl:
+        for line in mapFl:
+            try:
+                gene, annot = line.strip().split('\t')
+                yield (gene, annot)
+            except ValueError:
+                continue
+
+def openMapIndex(mapFilepath):
+    """Returns a function that looks up a key in the on-disk index of
+    a map file and returns its value or None, building the index first
+    if it does not exist or the map file has changed. When a key is in
+    the map more than once the last value is used. Recent lookups are
+    cached because consecutive features often share a key.
+    """
+    from gffIndex import SortedKeyIndex, writeSortedKeyIndex
+    indexPath = mapFilepath + '.idx'
+    index = None
+    if os.path.exists(indexPath):
+        index = SortedKeyIndex(indexPath)
+        if not index.isCurrent(mapFilepath):
+            index.close()
+            index = None
+    if index == None:
+        writeSortedKeyIndex(indexPath, mapFilepath, readMap(mapFilepath),
+                            keepLast=True)
+        index = SortedKeyIndex(indexPath)
+    return lru_cache(maxsize=65536)(index.lookup)
+
+
+def readJoins(args):
+    """Returns a list of (newAttrKey, mapFilepath, mapKey) for the joins
+    in the file given by -config followed by those given by repeated
+    -attr, -map, and -mapKey command line arguments.
+    """
+    joins = []
+    if '-config' in args:
+        with open(args[args.index('-config') + 1]) as configFl:
+            for line in configFl:
+                if line.startswith('#') or line.strip() == '':
+                    continue
+                newAttrKey, mapFilepath, mapKey = line.strip().split('\t')
+                joins.append((newAttrKey, mapFilepath, mapKey))
+    newAttrKeys = [args[i + 1] for i, arg in enumerate(args) if arg == '-attr']
+    mapFilepaths = [args[i + 1] for i, arg in enumerate(args) if arg == '-map']
+    mapKeys = [args[i + 1] for i, arg in enumerate(args) if arg == '-mapKey']
+    if not len(newAttrKeys) == len(mapFilepaths) == len(mapKeys):
+        print('-attr, -map, and -mapKey must be given the same number of '
+              'times', file=sys.stderr)
+        sys.exit(1)
+    joins += zip(newAttrKeys, mapFilepaths, mapKeys)
+    return joins
+
+def openMaps(joins, useIndex):
+    """Returns a list of (newAttrKey, lookupMap, mapKey) for joins, where
+    lookupMap is a function returning the value for a key in the map
+    or None. A map file used by more than one join is read once.
+    """
+    lookups = {}
+    for newAttrKey, mapFilepath, mapKey in joins:
+        if mapFilepath not in lookups:
+            if useIndex:
+                lookups[mapFilepath] = openMapIndex(mapFilepath)
+            else:
+                lookups[mapFilepath] = dict(readMap(mapFilepath)).get
+    return [(newAttrKey, lookups[mapFilepath], mapKey) 
+                               for newAttrKey, mapFilepath, mapKey in joins]
+
+def readOverlapIndex(gffFilepath, overlapAttr):
+    """Returns an IntervalIndex of the features in a GFF3 file that
+    have the attribute key overlapAttr, with each feature's list of
+    values of the key (comma-separated values are split) as its value.
+    """
+    attrValue = re.compile('[\\t;]{0}=([^;\\n]*)'.format(
+                                                      re.escape(overlapAttr)))
+    overlapIndex = IntervalIndex()
+    with open(gffFilepath) as gffFl:
+        for line in gffFl:
+            if line.startswith('#'):
+                continue
+            # stop at the sequences at the end of some GFF3 files
+            if line.startswith('>'):
+                break
+            match = attrValue.search(line)
+            if match:
+                fields = line.split('\t', 5)
+                overlapIndex.add(fields[0], int(fields[3]), int(fields[4]),
+                                 match.group(1).split(','))
+    return overlapIndex
+
+def overlapAttributes(overlapIndex, overlapAttr, gffLine):
+    """Returns a list of (key, value) of the attributes describing the
+    features in overlapIndex that overlap gffLine.
+    """
+    start = int(gffLine.start)
+    end = int(gffLine.end)
+    overlaps = overlapIndex.overlapping(gffLine.seqid, start, end)
+    # count the overlapping features with each value, keeping the
+    # values in order of position
+    counts = {}
+    for overlapStart, overlapEnd, values in overlaps:
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+    if counts == {}:
+        values = 'None'
+        valueCounts = '0'
+    else:
+        values = ','.join(counts)
+        valueCounts = ','.join(str(count) for count in counts.values())
+    overlapBp = coveredLength(overlaps, start, end)
+    return [('overlap_{0}'.format(overlapAttr), values),
+            ('overlap_{0}_count'.format(overlapAttr), valueCounts),
+            ('overlap_bp', str(overlapBp)),
+            ('overlap_frac', '{0:.4f}'.format(overlapBp/(end - start + 1)))]
+
+def keepExisting(gffLine, newAttrKey, replace, replaceIfNone, verbose):
+    """Returns True if newAttrKey is already an attribute key of
+    gffLine and should not be replaced, printing a warning to stderr
+    if verbose is True.
+    """
+    if newAttrKey in gffLine.attributes:
+        if (not replace and not (replaceIfNone and
+                                 gffLine.attributes[newAttrKey] == 'None')):
+            if verbose:
+                print(('{0}\nAbove line in GFF3 input already has '
+                       'attribute {1}. Continuing').format(str(gffLine), 
+                                                  newAttrKey), file=sys.stderr)
+            return True
+    return False
+
+def setAttribute(gffLine, newAttrKey, newAttrValue):
+    """Sets the value of an attribute of gffLine, adding the key after
+    the existing keys if it is new.
+    """
+    gffLine.attributes[newAttrKey] = newAttrValue
+    if newAttrKey not in gffLine.attributes_order:
+        gffLine.attributes_order.append(newAttrKey)
+
+def addAttributes(gffFl, outFl, joins, restrictType=None, replace=False,
+                  replaceIfNone=False, verbose=False, overlapIndex=None,
+                  overlapAttr=None):
+    """Reads GFF3 lines from gffFl, adds the new attribute for each of
+    joins, a list of (newAttrKey, lookupMap, mapKey), and the overlap
+    attributes if overlapIndex is given, and writes the lines to outFl.
+    The attributes column of each line is rebuilt once after all
+    attributes have been added, and lines that are not changed are
+    written as they are.
+    """
     for line in gffFl:
         # output commented lines as they are
         if line.startswith('#'):
-            print(line, end='')
-        else:
-            # read each line into a GFF3_line object for manipulation
-            gffLine = GFF3_line(line)
-            # output the original lines if they are not the type
-            # specified by the optional flag -restrictType
-            if '-restrictType' in args:
-                if gffLine.type != restrictType:
-                    print(line, end='')
-                    continue
-            # output the original line if the attribute key to be
-            # added is already a key in the original line. print a
-            # warning to stderr if -v is specified
-            if newAttrKey in gffLine.attributes:
-                if (not '-replace' in args 
-                    and ('-replaceIfNone' in args 
-                    and gffLine.attributes[newAttrKey]) != 'None'):
-                    if '-v' in args:
-                        print(('{0}\nAbove line in GFF3 input already has '
-                              'attribute {1}. Continuing').format(str(gffLine), 
-                                                  newAttrKey), file=sys.stderr)
-                    print(line, end='')
-                    continue
+            outFl.write(line)
+            continue
+        # output the original lines if they are not the type specified
+        # by the optional flag -restrictType. the type is checked before
+        # parsing the line
+        if restrictType != None and line.split('\t', 3)[2] != restrictType:
+            outFl.write(line)
+            continue
+        # read each line into a GFF3_line object for manipulation
+        gffLine = GFF3_line(line)
+        changed = False
+        for newAttrKey, lookupMap, mapKey in joins:
+            # skip this join if the attribute key to be added is already
+            # a key in the original line. print a warning to stderr if
+            # -v is specified
+            if keepExisting(gffLine, newAttrKey, replace, replaceIfNone,
+                            verbose):
+                continue
             # if the -mapKey is not in an original GFF3 line then write
             # a new attribute key with a value of None
-            try:
-                featureIdentifier = gffLine.attributes[mapKey]
-            except KeyError:
-                if '-v' in args:
+            if mapKey not in gffLine.attributes:
+                if verbose:
                     print('{0}\n-mapKey {1} not in above GFF3 line.'.format(
                                         str(gffLine), mapKey), file=sys.stderr)
                     print('--------', file=sys.stderr)
                 newAttrValue = 'None'
-                gffLine.attributes[newAttrKey] = newAttrValue
-                if newAttrKey not in gffLine.attributes_order:
-                    gffLine.attributes_order.append(newAttrKey)
-                gffLine.refreshAttrStr()
-                print(str(gffLine))
-                continue
-            # if the -mapKey is in an original GFF3 line and its value
-            # is in the -map, write the new attribute key and value
-            # and output the modified line
-            if featureIdentifier in attrMap:
-                newAttrValue = attrMap[featureIdentifier]
-                gffLine.attributes[newAttrKey] = newAttrValue
-                if newAttrKey not in gffLine.attributes_order:
-                    gffLine.attributes_order.append(newAttrKey)
-                gffLine.refreshAttrStr()
-                print(str(gffLine))
-            # if -mapKey is in an original GFF3 line but its value is
-            # not in the -map, add the new attribute key with a value
-            # of None and output the modified line
             else:
-                if '-v' in args:
-                    print(('{0}\nNo item in -map matching {1} from the above '
-                                            'GFF3 line').format(str(gffLine), 
+                # if the -mapKey is in an original GFF3 line and its
+                # value is in the -map, use the value from the -map.
+                # otherwise use a value of None
+                featureIdentifier = gffLine.attributes[mapKey]
+                newAttrValue = lookupMap(featureIdentifier)
+                if newAttrValue == None:
+                    if verbose:
+                        print(('{0}\nNo item in -map matching {1} from the '
+                               'above GFF3 line').format(str(gffLine), 
                                                            featureIdentifier), 
                                                                file=sys.stderr)
-                    print('--------', file=sys.stderr)
-                newAttrValue = 'None'
-                gffLine.attributes[newAttrKey] = newAttrValue
-                if newAttrKey not in gffLine.attributes_order:
-                    gffLine.attributes_order.append(newAttrKey)
-                gffLine.refreshAttrStr()
-                print(str(gffLine))
+                        print('--------', file=sys.stderr)
+                    newAttrValue = 'None'
+            setAttribute(gffLine, newAttrKey, newAttrValue)
+            changed = True
+        # add the attributes describing overlapping features
+        if overlapIndex != None:
+            for newAttrKey, newAttrValue in overlapAttributes(overlapIndex,
+                                                       overlapAttr, gffLine):
+                if not keepExisting(gffLine, newAttrKey, replace,
+                                    replaceIfNone, verbose):
+                    setAttribute(gffLine, newAttrKey, newAttrValue)
+                    changed = True
+        # output the modified line
+        if changed:
+            gffLine.refreshAttrStr()
+            outFl.write(str(gffLine) + '\n')
+        else:
+            outFl.write(line)
+
+
+# print help information if not enough arguments are present
+args = sys.argv
+if ('-h' in args
+    or '-gff' not in args
+    or ('-config' not in args 
+        and ('-overlapWith' not in args or '-overlapAttr' not in args)
+        and ('-attr' not in args
+             or '-map' not in args
+             or '-mapKey' not in args))):
+    help()
+# read command line arguments
+gffFilepath = args[args.index('-gff') + 1]
+if '-restrictType' in args:
+    restrictType = args[args.index('-restrictType') + 1]
+else:
+    restrictType = None
+# read the files provided by -map into dictionaries, or open their
+# indexes
+joins = openMaps(readJoins(args), '-mapIndex' in args)
+# index the features of the GFF3 provided by -overlapWith
+if '-overlapWith' in args:
+    overlapAttr = args[args.index('-overlapAttr') + 1]
+    overlapIndex = readOverlapIndex(args[args.index('-overlapWith') + 1],
+                                    overlapAttr)
+else:
+    overlapAttr = None
+    overlapIndex = None
+# read gff file and for each line add the specified attributes and
+# write the line through a large output buffer
+with open(gffFilepath) as gffFl, open(sys.stdout.fileno(), 'w', 
+                                      buffering=1024*1024,
+                                      closefd=False) as outFl:
+    addAttributes(gffFl, outFl, joins, restrictType, '-replace' in args,
+                  '-replaceIfNone' in args, '-v' in args, overlapIndex,
+                  overlapAttr)
@@ -2,18 +2,23 @@
 
 import sys
 import re
+import operator
 
 def help():
     print('''
     Usage:
     ------------
     gffFilter.py [options] < input.gff > output.gff
+    gffFilter.py -id <path> -index -gff <path> [options] > output.gff
 
     Description:
     ------------
     Removes lines from a GFF3 file if the lines do or do not match
     scaffold names or ID attributes present in lists provided with
-    either -scaf or -id.
+    -scaf and -id, or a filter expression provided with -expr. When
+    more than one of these is used a line must match all of them.
+    The expression is compiled once and only the columns and
+    attributes it uses are extracted from each line.
 
     Options:
     ------------
@@ -23,133 +28,321 @@ def help():
     -id <path>      Output lines where the value of the ID attribute
                     matches an item of the list in the file provided
 
+    -expr <str>     Output lines matching the filter expression, e.g.
+                    'type==gene && seqid in @scafs.txt && length>500
+                     && attr.Name~^Ty3'
+
     -v              Invert. Print non-matching lines.
+
+    -gff <path>     Read the GFF3 from this file instead of stdin.
+
+    -index          With -id and -gff, find lines using an index of the
+                    ID attribute (see gffIndex.py) instead of reading
+                    the whole GFF3, then apply -scaf and -expr to them.
+                    The index is built on first use and rebuilt when
+                    the GFF3 changes. Commented lines are not output.
+                    Ignored with -v.
+
+    Filter expressions:
+    ------------
+    Fields:         seqid, source, type, start, end, score, strand,
+                    phase, length (end - start + 1), and attr.<key>
+                    for the value of an attribute
+    Comparisons:    ==  !=  <  <=  >  >=  (numeric if the value is a
+                    number and the field is start, end, score, length
+                    or an attribute)
+                    ~  !~   regular expression search
+                    in, not in   membership in a set given as
+                    @<path> (one value per line, quote the path
+                    if needed) or {a,b,c}
+    Logic:          &&  ||  !  and parentheses
+    Values containing whitespace or any of ()&|=!<>~ must be quoted.
+    A comparison with a missing attribute or a score of . is false,
+    except that !=, !~, and not in are true.
     ''')
     sys.exit(0)
 
 
-class GFF3_line:
-    """A class to represet GFF3 lines and allow modification of the
-    values of its fields.
+# columns of the GFF3 fields that can be used in filter expressions
+FIELD_COLUMNS = {'seqid':0, 'source':1, 'type':2, 'start':3, 'end':4,
+                 'score':5, 'strand':6, 'phase':7}
+# fields compared as numbers when compared to a number
+NUMERIC_FIELDS = {'start', 'end', 'score', 'length'}
+# tokens of the filter expression language in the order they are
+# tried at each position
+TOKEN_PATTERN = re.compile(r'''\s*(?:
+    (?P<logic>&&|\|\|)
+   |(?P<paren>[()])
+   |(?P<op>==|!=|<=|>=|!~|<|>|~)
+   |(?P<not>!)
+   |(?P<file>@(?:"[^"]*"|'[^']*'|[^\s()&|]+))
+   |(?P<set>\{[^}]*\})
+   |(?P<quoted>"[^"]*"|'[^']*')
+   |(?P<word>[^\s()&|=!<>~]+)
+   )''', re.VERBOSE)
 
-    Attributes:
-    ------------
-    field0, ..., field8   strings containing the values of each field
-                          in a GFF3 line
-    attributes            a dictionary containing the key-value pairs
-                          in the GFF3 line 9th field
 
-    Methods:    
-    ------------
-    str()               Outputs GFF3 line
-    repr()              Outputs GFF3 line
-    refreshAttrStr()    This needs to be called if changes were made to
-                        any of the attributes. It refreshes
+def readSet(path):
+    """Reads a file with one value per line into a set."""
+    valueSet = set()
+    with open(path) as fl:
+        for line in fl:
+            valueSet.add(line.strip())
+    return valueSet
+
+def tokenize(expr):
+    """Splits a filter expression into a list of (kind, text) tuples.
+    Raises ValueError if part of the expression is not a token.
     """
+    tokens = []
+    position = 0
+    expr = expr.strip()
+    while position < len(expr):
+        match = TOKEN_PATTERN.match(expr, position)
+        if match == None or match.end() == position:
+            raise ValueError('Cannot parse -expr at: {0}'.format(
+                                                             expr[position:]))
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'quoted':
+            kind, text = 'word', text[1:-1]
+        elif kind == 'file':
+            text = text[1:].strip('"\'')
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
 
-    def __init__(self, line):
-        """GFF3_line is initialized to contain the fields of the GFF3
-        line provided as attributes. The attributes are kept in a
-        dictionary and a the keys are ordered in a list to preserve
-        the order of attributes upon getting the sring representation
-        of the line from the GFF3_line object.
-        """
-        (self.seqid, 
-         self.source, 
-         self.type, 
-         self.start, 
-         self.end, 
-         self.score, 
-         self.strand, 
-         self.phase, 
-         self.attributes_str) = line.strip().split('\t')
-        # preserve attribute order as a list of keys (attributes_order)
-        attributes_list = self.attributes_str.split(';')
-        self.attributes_order = [attr.split('=')[0] for attr in 
-                                                               attributes_list]
-        # store attribute keys and their values in a dictionary
-        self.attributes = {attr.split('=')[0]:attr.split('=')[1] for attr in 
-                                                               attributes_list}
-        # rename the name attribute key to Name so it conforms to the
-        # GFF3 specification, where Name is a reserved attribute key
-        if 'name' in self.attributes:
-            self.attributes['Name'] = self.attributes.pop('name')
-            self.attributes_order[self.attributes_order.index('name')] = 'Name'
-
-    def __repr__(self):
-        """Output for overloaded functions str() and repr()"""
-        return '\t'.join([str(self.seqid), 
-                          str(self.source), 
-                          str(self.type), 
-                          str(self.start), 
-                          str(self.end), 
-                          str(self.score), 
-                          str(self.strand), 
-                          str(self.phase), 
-                          str(self.attributes_str)])
-
-    def refreshAttrStr(self):
-        """If the attributes dictionary or attributes_order has been 
-        altered this should be called to update attributes_str.
+def compileComparison(field, op, value):
+    """Returns a function that takes the list of fields of a GFF3 line
+    and returns whether field compares to value with op. value is a
+    string, or a set if op is in or not in.
+    """
+    # get the value of the field from the split line
+    if field == 'length':
+        def getValue(fields):
+            return str(int(fields[4]) - int(fields[3]) + 1)
+    elif field.startswith('attr.'):
+        attrPattern = re.compile('(?:^|;){0}=([^;\\n]*)'.format(
+                                                        re.escape(field[5:])))
+        def getValue(fields):
+            attrValue = attrPattern.search(fields[8])
+            return attrValue.group(1) if attrValue else None
+    elif field in FIELD_COLUMNS:
+        column = FIELD_COLUMNS[field]
+        def getValue(fields):
+            return fields[column]
+    else:
+        raise ValueError('Unknown field in -expr: {0}'.format(field))
+    # comparisons that are true when the value is missing
+    negated = op in ('!=', '!~', 'not in')
+    if op in ('in', 'not in'):
+        def compare(fieldValue):
+            return fieldValue in value
+    elif op in ('~', '!~'):
+        try:
+            pattern = re.compile(value)
+        except re.error as e:
+            raise ValueError('Invalid regular expression in -expr: {0} '
+                             '({1})'.format(value, e))
+        def compare(fieldValue):
+            return pattern.search(fieldValue) != None
+    else:
+        try:
+            number = float(value)
+        except ValueError:
+            number = None
+        # compare numerically
+        if number != None and (field in NUMERIC_FIELDS
+                               or field.startswith('attr.')):
+            opFunction = {'==':operator.eq, '!=':operator.ne,
+                          '<':operator.lt, '<=':operator.le,
+                          '>':operator.gt, '>=':operator.ge}[op]
+            def compare(fieldValue):
+                try:
+                    return opFunction(float(fieldValue), number)
+                except ValueError:
+                    return negated
+        elif op in ('==', '!='):
+            def compare(fieldValue):
+                return fieldValue == value
+        else:
+            raise ValueError('{0} needs a number, not {1}'.format(op, value))
+    if negated:
+        def comparison(fields):
+            fieldValue = getValue(fields)
+            return fieldValue == None or not compare(fieldValue)
+    else:
+        def comparison(fields):
+            fieldValue = getValue(fields)
+            return fieldValue != None and compare(fieldValue)
+    return comparison
+
+def fieldColumns(field):
+    """Returns the columns of a GFF3 line a field is read from."""
+    if field == 'length':
+        return (3, 4)
+    if field.startswith('attr.'):
+        return (8,)
+    if field in FIELD_COLUMNS:
+        return (FIELD_COLUMNS[field],)
+    return ()
+
+def compileExpression(expr, columns):
+    """Compiles a filter expression (see help()) into a function that
+    takes the list of fields of a GFF3 line and returns whether it
+    matches, adding the columns the expression uses to the set columns.
+    Raises ValueError if the expression cannot be parsed.
+    """
+    tokens = tokenize(expr)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def take(expected):
+        """Returns the next token. expected describes it for the error
+        if the expression has ended.
         """
-        self.attributes_str = ';'.join(['='.join(
-             [attr, self.attributes[attr]]) for attr in self.attributes_order])
+        nonlocal position
+        if position >= len(tokens):
+            raise ValueError('Missing {0} at end of -expr'.format(expected))
+        position += 1
+        return tokens[position - 1]
+
+    def parseOr():
+        left = parseAnd()
+        while peek() == ('logic', '||'):
+            take('||')
+            right = parseAnd()
+            left = (lambda a, b: lambda fields: a(fields) or b(fields))(
+                                                                  left, right)
+        return left
+
+    def parseAnd():
+        left = parseNot()
+        while peek() == ('logic', '&&'):
+            take('&&')
+            right = parseNot()
+            left = (lambda a, b: lambda fields: a(fields) and b(fields))(
+                                                                  left, right)
+        return left
+
+    def parseNot():
+        kind, text = take('operand')
+        if kind == 'not':
+            operand = parseNot()
+            return lambda fields: not operand(fields)
+        if (kind, text) == ('paren', '('):
+            inner = parseOr()
+            if take(')') != ('paren', ')'):
+                raise ValueError('Missing ) in -expr')
+            return inner
+        if kind != 'word':
+            raise ValueError('Expected a field in -expr, not {0}'.format(text))
+        return parseComparison(text)
+
+    def parseComparison(field):
+        kind, op = take('comparison after {0}'.format(field))
+        if (kind, op) == ('word', 'not') and peek() == ('word', 'in'):
+            take('in')
+            op = 'not in'
+        elif (kind, op) == ('word', 'in'):
+            pass
+        elif kind != 'op':
+            raise ValueError('Expected a comparison after {0} in -expr, '
+                             'not {1}'.format(field, op))
+        kind, value = take('value after {0}'.format(op))
+        if op in ('in', 'not in'):
+            if kind == 'file':
+                value = readSet(value)
+            elif kind == 'set':
+                value = set(v.strip() for v in value[1:-1].split(','))
+            else:
+                raise ValueError('{0} needs @<path> or {{a,b}}, not '
+                                 '{1}'.format(op, value))
+        elif kind != 'word':
+            raise ValueError('Expected a value after {0} in -expr, not '
+                             '{1}'.format(op, value))
+        # record which columns need to be split from the line
+        columns.update(fieldColumns(field))
+        return compileComparison(field, op, value)
+
+    matches = parseOr()
+    if position != len(tokens):
+        raise ValueError('Unexpected {0} in -expr'.format(tokens[position][1]))
+    return matches
+
+def compileFilter(expressions, valueSets=()):
+    """Compiles a list of filter expressions and a list of (field, set
+    of values) into a function that takes a GFF3 line and returns
+    whether it matches all of the expressions and has a value of each
+    field in its set. The line is only split as far as the last column
+    used. Raises ValueError if an expression cannot be parsed.
+    """
+    columns = set()
+    matchers = []
+    for field, valueSet in valueSets:
+        columns.update(fieldColumns(field))
+        matchers.append(compileComparison(field, 'in', valueSet))
+    for expr in expressions:
+        matchers.append(compileExpression(expr, columns))
+    maxSplit = max(columns) + 1 if columns else 0
+    if len(matchers) == 1:
+        matches = matchers[0]
+    else:
+        def matches(fields):
+            return all(matcher(fields) for matcher in matchers)
+
+    def lineFilter(line):
+        return matches(line.split('\t', maxSplit))
+
+    return lineFilter
 
 
 # output help information if not enough arguments were proivded
 args = sys.argv
 if '-h' in args or '-help' in args or len(args) < 3:
     help()
-# parse command line arguments
+# parse command line arguments. -id and -scaf are filters on the ID
+# attribute and seqid combined with -expr
+valueSets = []
 if '-id' in args:
-    IDpth = args[args.index('-id') + 1]
-    IDset = set()
-    ID = True
-    with open(IDpth) as IDfl:
-        for line in IDfl:
-            IDset.add(line.strip())
-else:
-    ID = False
+    idSet = readSet(args[args.index('-id') + 1])
+    valueSets.append(('attr.ID', idSet))
 if '-scaf' in args:
-    Scafpth = args[args.index('-scaf') + 1]
-    Scafset = set()
-    SCAF = True
-
-    with open(Scafpth) as Scaffl:
-        for line in Scaffl:
-            Scafset.add(line.strip())
+    valueSets.append(('seqid', readSet(args[args.index('-scaf') + 1])))
+expressions = []
+if '-expr' in args:
+    expressions.append(args[args.index('-expr') + 1])
+if expressions == [] and valueSets == []:
+    help()
+try:
+    lineFilter = compileFilter(expressions, valueSets)
+except ValueError as e:
+    print(e, file=sys.stderr)
+    sys.exit(1)
+invert = '-v' in args
+# look up lines with IDs in the list in the ID attribute index and
+# check the remaining filters on only those lines
+if '-index' in args and '-id' in args and '-gff' in args and not invert:
+    from gffIndex import lookupLines
+    if len(valueSets) > 1 or expressions != []:
+        otherFilter = compileFilter(expressions, valueSets[1:])
+    else:
+        otherFilter = None
+    for line in lookupLines(args[args.index('-gff') + 1], 'ID', idSet):
+        if otherFilter == None or otherFilter(line):
+            sys.stdout.write(line)
+    sys.exit(0)
+if '-gff' in args:
+    inFl = open(args[args.index('-gff') + 1])
 else:
-    SCAF = False
-if SCAF and ID:
-    print(('You used both -scaf and -id but only -id will be used. '
-                        'No implementation exists for both.'), file=sys.stderr)
-# for each line in the input gff3 file, read the line as a GFF3_line
-# object and output lines requested per command line arguments
-for line in sys.stdin:
+    inFl = sys.stdin
+# for each line in the input gff3 file output lines requested per
+# command line arguments
+for line in inFl:
     # output commented lines
     if line.startswith('#'):
-        print(line, end='')
-        continue
-    gffLine = GFF3_line(line)
-    if ID:
-        if gffLine.attributes['ID'] in IDset:
-            if '-v' in args:
-                continue
-            else:
-                print(line, end='')
-        else:
-            if '-v' in args:
-                print(line, end='')
-            else:
-                continue
-    elif SCAF:
-        if gffLine.seqid in Scafset:
-            if '-v' in args:
-                continue
-            else:
-                print(line, end='')
-        else:
-            if '-v' in args:
-                print(line, end='')
-            else:
-                continue
+        sys.stdout.write(line)
+    elif lineFilter(line) != invert:
+        sys.stdout.write(line)
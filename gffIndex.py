@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import mmap
+from bisect import bisect_right
+from gffSort import externalSort
+
+
+def help():
+    print('''
+    Usage:
+    ------------
+    gffIndex.py -gff <path> -attr <str> [-attr <str> ...]
+    gffIndex.py -gff <path> -attr <str> -lookup <path> > output.gff
+
+    Description:
+    ------------
+    Builds an index of the values of an attribute key (e.g. ID, Name,
+    or Parent) in a GFF3 file that maps each value to the byte offsets
+    of the lines it occurs in. The index is written next to the GFF3
+    as <gff>.<attr>.idx and is rebuilt automatically when the GFF3 has
+    changed since the index was built. Comma-separated attribute
+    values (e.g. Parent=mRNA1,mRNA2) are indexed separately. Lookups
+    use binary search in the memory-mapped index file and read only
+    the matching lines from the GFF3, so finding a few features in a
+    very large GFF3 does not require reading the whole file.
+
+    With -lookup, outputs the lines of the GFF3 for which the value of
+    the attribute is in the list in the file provided, in the order
+    they occur in the GFF3. The index is built first if needed.
+
+    Options:
+    ------------
+    -mem    <int>   Memory budget in megabytes for sorting while
+                    building the index. Default 1024.
+    -tmpDir <path>  Directory for temporary files. Default is the system
+                    temporary directory.
+    ''', file=sys.stderr)
+    sys.exit(0)
+
+
+class SortedKeyIndex:
+    """A class to represent a text file of tab-separated key-value
+    lines sorted by the UTF-8 bytes of the key, with unique keys, that
+    is searched with binary search in a memory map of the file. The
+    first line of the file is a header recording the size and
+    modification time of the file the index was built from, so that
+    an index can tell when it is out of date. On the first lookup the
+    key of the first line in each block of blockBytes bytes is read
+    into memory so each lookup only searches one block of the file.
+
+    Attributes:
+    ------------
+    path        path to the index file
+    header      list of the fields of the header line
+
+    Methods:
+    ------------
+    lookup()    Returns the value for a key or None
+    isCurrent() Whether the index was built from a file as it is now
+    close()     Closes the memory map and file
+    """
+    def __init__(self, path, blockBytes=2048):
+        self.path = path
+        self.blockBytes = blockBytes
+        self.blockKeys = None
+        self.blockStarts = None
+        self.fl = open(path, 'rb')
+        # an empty file can not be memory mapped
+        if os.path.getsize(path) > 0:
+            self.mm = mmap.mmap(self.fl.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = b''
+        headerEnd = self.mm.find(b'\n') + 1
+        self.header = self.mm[:headerEnd].decode().rstrip('\n').split('\t')
+        self.dataStart = headerEnd
+
+    def isCurrent(self, sourcePath):
+        """Returns True if the file at sourcePath has the size and
+        modification time recorded in the header.
+        """
+        stat = os.stat(sourcePath)
+        return (len(self.header) >= 3
+                and self.header[0] == '#SortedKeyIndex'
+                and self.header[1] == str(stat.st_size)
+                and self.header[2] == str(stat.st_mtime_ns))
+
+    def readBlocks(self):
+        """Reads the start offset and key of the first line starting in
+        each block of blockBytes bytes into blockStarts and blockKeys.
+        """
+        mm = self.mm
+        self.blockStarts = []
+        self.blockKeys = []
+        lineStart = self.dataStart
+        while lineStart < len(mm):
+            self.blockStarts.append(lineStart)
+            self.blockKeys.append(mm[lineStart:mm.find(b'\t', lineStart)])
+            lineStart = mm.find(b'\n', lineStart + self.blockBytes) + 1
+            if lineStart == 0:
+                break
+        self.blockStarts.append(len(mm))
+
+    def lookup(self, key):
+        """Returns the value for key as a string, or None if key is not
+        in the index. A binary search of the block keys finds the only
+        block that can contain key, which is then searched for a line
+        starting with key and a tab.
+        """
+        if self.blockKeys == None:
+            self.readBlocks()
+        key = key.encode('utf-8')
+        block = bisect_right(self.blockKeys, key) - 1
+        if block < 0:
+            return None
+        mm = self.mm
+        # every line is preceded by a newline, including the first
+        # line after the header
+        lineStart = mm.find(b'\n' + key + b'\t', self.blockStarts[block] - 1,
+                            self.blockStarts[block + 1] + len(key) + 1)
+        if lineStart == -1:
+            return None
+        valueStart = lineStart + len(key) + 2
+        lineEnd = mm.find(b'\n', valueStart)
+        if lineEnd == -1:
+            lineEnd = len(mm)
+        return mm[valueStart:lineEnd].decode('utf-8')
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self.fl.close()
+
+
+def writeSortedKeyIndex(path, sourcePath, items, memBytes=1024**3,
+                        tmpDir=None, keepLast=False):
+    """Writes a SortedKeyIndex file at path from items, an iterable of
+    (key, value) string tuples, none of which may contain tabs or
+    newlines. Items are sorted with externalSort() so they need not
+    fit in memory. Values of items with the same key are joined with
+    commas, or if keepLast is True only the last one is kept, as when
+    filling a dictionary. The header records the size and modification
+    time of sourcePath.
+    """
+    stat = os.stat(sourcePath)
+    sortedItems = externalSort(('{0}\t{1}\n'.format(key, value)
+                                for key, value in items),
+                               lambda x:x.split('\t', 1)[0].encode('utf-8'),
+                               memBytes, tmpDir)
+    # write to a temporary name first so an interrupted build does not
+    # leave a truncated index behind
+    with open(path + '.tmp', 'w', encoding='utf-8') as outFl:
+        outFl.write('#SortedKeyIndex\t{0}\t{1}\n'.format(stat.st_size,
+                                                         stat.st_mtime_ns))
+        lastKey = None
+        values = []
+        for line in sortedItems:
+            key, value = line.rstrip('\n').split('\t')
+            if key != lastKey and lastKey != None:
+                outFl.write('{0}\t{1}\n'.format(lastKey, ','.join(values)))
+                values = []
+            lastKey = key
+            if keepLast:
+                values = [value]
+            else:
+                values.append(value)
+        if lastKey != None:
+            outFl.write('{0}\t{1}\n'.format(lastKey, ','.join(values)))
+    os.replace(path + '.tmp', path)
+
+def attrIndexPath(gffPath, attr):
+    """Returns the path of the index of attribute attr for a GFF3."""
+    return '{0}.{1}.idx'.format(gffPath, attr)
+
+def attrOffsets(gffPath, attr):
+    """Generator that yields (value, byte offset) for each value of the
+    attribute key attr in each line of a GFF3 file. Comma-separated
+    values are yielded separately.
+    """
+    attrPattern = re.compile('[\\t;]{0}=([^;\\r\\n]*)'.format(
+                                           re.escape(attr)).encode('utf-8'))
+    offset = 0
+    with open(gffPath, 'rb') as fl:
+        for line in fl:
+            if not line.startswith(b'#'):
+                match = attrPattern.search(line)
+                if match:
+                    for value in match.group(1).decode('utf-8').split(','):
+                        yield (value, offset)
+            offset += len(line)
+
+def buildAttrIndex(gffPath, attr, memBytes=1024**3, tmpDir=None):
+    """Builds the index of attribute attr for a GFF3 file."""
+    writeSortedKeyIndex(attrIndexPath(gffPath, attr), gffPath,
+                        attrOffsets(gffPath, attr), memBytes, tmpDir)
+
+def openAttrIndex(gffPath, attr, memBytes=1024**3, tmpDir=None):
+    """Returns the SortedKeyIndex of attribute attr for a GFF3 file,
+    building it first if it does not exist or the GFF3 has changed
+    since it was built.
+    """
+    indexPath = attrIndexPath(gffPath, attr)
+    if os.path.exists(indexPath):
+        index = SortedKeyIndex(indexPath)
+        if index.isCurrent(gffPath):
+            return index
+        index.close()
+    buildAttrIndex(gffPath, attr, memBytes, tmpDir)
+    return SortedKeyIndex(indexPath)
+
+def lookupOffsets(index, values):
+    """Returns a sorted list of the unique byte offsets of lines with
+    any of values in an attribute index.
+    """
+    offsets = set()
+    for value in values:
+        found = index.lookup(value)
+        if found != None:
+            offsets.update(int(offset) for offset in found.split(','))
+    return sorted(offsets)
+
+def readLines(gffPath, offsets):
+    """Generator that yields the lines of a GFF3 file that start at
+    the byte offsets given.
+    """
+    with open(gffPath, 'rb') as fl:
+        for offset in offsets:
+            fl.seek(offset)
+            yield fl.readline().decode('utf-8')
+
+def lookupLines(gffPath, attr, values, memBytes=1024**3, tmpDir=None):
+    """Generator that yields the lines of a GFF3 file in which the
+    attribute attr has any of values, in file order, using (and if
+    needed building) the attribute index.
+    """
+    index = openAttrIndex(gffPath, attr, memBytes, tmpDir)
+    offsets = lookupOffsets(index, values)
+    index.close()
+    yield from readLines(gffPath, offsets)
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    # output help information if missing command line arguments
+    if '-h' in args or '-gff' not in args or '-attr' not in args:
+        help()
+    # read command line arguments
+    gffPath = args[args.index('-gff') + 1]
+    attrs = [args[i + 1] for i, arg in enumerate(args) if arg == '-attr']
+    if '-mem' in args:
+        memBytes = int(args[args.index('-mem') + 1]) * 1024 * 1024
+    else:
+        memBytes = 1024**3
+    if '-tmpDir' in args:
+        tmpDir = args[args.index('-tmpDir') + 1]
+    else:
+        tmpDir = None
+    # output lines with values in the list
+    if '-lookup' in args:
+        with open(args[args.index('-lookup') + 1]) as fl:
+            values = [line.strip() for line in fl if line.strip() != '']
+        for line in lookupLines(gffPath, attrs[0], values, memBytes, tmpDir):
+            sys.stdout.write(line)
+    # build the indexes
+    else:
+        for attr in attrs:
+            buildAttrIndex(gffPath, attr, memBytes, tmpDir)
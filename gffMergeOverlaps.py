@@ -1,173 +1,425 @@
 #!/usr/bin/env python3
 
+import re
 import sys
+import heapq
+from multiprocessing import Pool
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 def help():
     print("""
     Usage:
     ------------
-     mergeGFF-Overlaps.py < file.gff > output.gff
+     mergeGFF-Overlaps.py [options] < file.gff > output.gff
 
     Description:
     ------------
-    Combines overlapping features in the input GFF3 file into a single 
+    Combines overlapping features in the input GFF3 file into a single
     feature. Score and attributes are removed. Commented lines are
-    ignored and not output.
+    ignored and not output. By default all features on a scaffold are
+    merged together regardless of strand and type. With -s and -byType
+    each strand and each type is merged separately, all in one pass
+    through the input.
 
     Options:
     ------------
     -keepAttr    For features that do not overlap retain the
                  attributes column from the original GFF3.
+
+    -s           Strand-aware. Only merge features on the same strand.
+
+    -byType      Only merge features of the same type (3rd column).
+
+    -d <int>     Also merge features that start less than <int> bp
+                 after the end of the current merged feature. Default
+                 is 0, which merges only overlapping features.
+
+    -aggAttr     Add attributes summarizing the features that were
+                 merged: merged_count (number of features), merged_IDs
+                 (their ID attributes), and merged_score (the sum of
+                 their scores).
+
+    -cluster     Instead of merging features, output every feature
+                 unchanged with a cluster_id attribute added. Features
+                 that would have been merged share a cluster_id. The
+                 features of each cluster are output together. -s,
+                 -byType, and -d apply; -keepAttr and -aggAttr are
+                 ignored.
+
+    -sorted      Input is sorted by seqid and start coordinate (e.g.
+                 by gffSort.py). Features are merged as they are read
+                 and output once they are finished. Without -s and
+                 -byType memory use does not grow with the size of the
+                 input (with -cluster, it grows with the size of the
+                 largest cluster). With -s or -byType, merged features
+                 are held until the open merged features of the other
+                 strands or types that start before them have ended,
+                 to keep the output sorted, so memory use grows with
+                 the number of features within the longest merged
+                 feature, up to all those on a scaffold. Exits with an
+                 error if the input is not sorted.
+
+    -threads <int>
+                 Merge the coordinates of each scaffold (and strand and
+                 type with -s and -byType) with NumPy in this many
+                 worker processes. Reading the input, sending each
+                 scaffold to a worker, and writing the output are done
+                 by the main process and usually take most of the run
+                 time, so more workers help little; use it for inputs
+                 where most features are merged away, which can run
+                 faster than without -threads even with 1 worker.
+                 Requires NumPy. Ignored with -sorted.
 """, file=sys.stderr)
     sys.exit()
 
 
-class GFF3_line:
-    """A class to represet GFF3 lines and allow modification of the
-    values of its fields.
+# matches the value of the ID attribute
+ID_PATTERN = re.compile('(?:^|;)ID=([^;]*)')
+
+
+class MergedFeature:
+    """A class to represent a feature formed by merging one or more
+    GFF3 features. All fields except the end coordinate, score, and
+    attributes come from the first feature merged.
 
     Attributes:
     ------------
-    field0, ..., field8   strings containing the values of each field
-                          in a GFF3 line
-    attributes            a dictionary containing the key-value pairs
-                          in the GFF3 line 9th field
+    fields      list of the fields of the first feature merged
+    start       start coordinate
+    end         end coordinate, the largest of the merged features
+    count       number of features merged
+    IDs         values of the ID attribute of the merged features
+    scoreSum    sum of the scores of the merged features
+    members     lists of fields of all merged features, if cluster
+    clusterID   cluster_id attribute value given to members, if cluster
 
-    Methods:    
+    Methods:
     ------------
-    str()               Outputs GFF3 line
-    repr()              Outputs GFF3 line
-    refreshAttrStr()    This needs to be called if changes were made to
-                        any of the attributes. It refreshes
+    str()       Outputs GFF3 line
+    repr()      Outputs GFF3 line
+    add()       Merges another feature into this one
+    aggregate() Adds a feature's ID and score to the running totals
     """
+    def __init__(self, fields, keepAttr=False, aggAttr=False, cluster=False):
+        """Takes the list of fields of a GFF3 line as the first
+        feature of the merged feature. If cluster is True the merged
+        features are kept so they can be output unchanged.
+        """
+        self.fields = fields
+        self.start = int(fields[3])
+        self.end = int(fields[4])
+        self.keepAttr = keepAttr
+        self.aggAttr = aggAttr
+        self.count = 0
+        self.IDs = []
+        self.scoreSum = 0
+        self.members = [fields] if cluster else None
+        self.clusterID = None
+        if aggAttr:
+            self.aggregate(fields)
+        else:
+            self.count = 1
+
+    def aggregate(self, fields):
+        """Adds the count, ID, and score of a merged feature to the
+        running totals.
+        """
+        self.count += 1
+        ID = ID_PATTERN.search(fields[8])
+        if ID:
+            self.IDs.append(ID.group(1))
+        if fields[5] != '.':
+            self.scoreSum += float(fields[5])
 
-    def __init__(self, line):
-        """GFF3_line is initialized to contain the fields of the GFF3
-        line provided as attributes. The attributes are kept in a
-        dictionary and a the keys are ordered in a list to preserve
-        the order of attributes upon getting the sring representation
-        of the line from the GFF3_line object.
+    def add(self, fields, end):
+        """Merges the feature with fields and end coordinate end into
+        this feature.
         """
-        (self.seqid, 
-         self.source, 
-         self.type, 
-         self.start, 
-         self.end, 
-         self.score, 
-         self.strand, 
-         self.phase, 
-         self.attributes_str) = line.strip().split('\t')
-        # preserve attribute order as a list of keys (attributes_order)
-        attributes_list = self.attributes_str.split(';')
-        self.attributes_order = [attr.split('=')[0] for attr in 
-                                                               attributes_list]
-        # store attribute keys and their values in a dictionary
-        self.attributes = {attr.split('=')[0]:attr.split('=')[1] for attr in 
-                                                               attributes_list}
-        # rename the name attribute key to Name so it conforms to the
-        # GFF3 specification, where Name is a reserved attribute key
-        if 'name' in self.attributes:
-            self.attributes['Name'] = self.attributes.pop('name')
-            self.attributes_order[self.attributes_order.index('name')] = 'Name'
+        if end > self.end:
+            self.end = end
+        if self.members != None:
+            self.members.append(fields)
+        if self.aggAttr:
+            self.aggregate(fields)
+        else:
+            self.count += 1
 
     def __repr__(self):
         """Output for overloaded functions str() and repr()"""
-        return '\t'.join([str(self.seqid), 
-                          str(self.source), 
-                          str(self.type), 
-                          str(self.start), 
-                          str(self.end), 
-                          str(self.score), 
-                          str(self.strand), 
-                          str(self.phase), 
-                          str(self.attributes_str)])
-
-    def refreshAttrStr(self):
-        """If the attributes dictionary or attributes_order has been 
-        altered this should be called to update attributes_str.
-        """
-        self.attributes_str = ';'.join(['='.join(
-             [attr, self.attributes[attr]]) for attr in self.attributes_order])
+        # output each merged feature with the cluster_id attribute
+        if self.members != None:
+            lines = []
+            for fields in self.members:
+                if fields[8] == '.':
+                    attributes = 'cluster_id={0}'.format(self.clusterID)
+                else:
+                    attributes = '{0};cluster_id={1}'.format(fields[8],
+                                                             self.clusterID)
+                lines.append('\t'.join(fields[:8] + [attributes]))
+            return '\n'.join(lines)
+        fields = self.fields[:]
+        fields[3] = str(self.start)
+        fields[4] = str(self.end)
+        fields[5] = '.'
+        if not self.keepAttr:
+            fields[8] = '.'
+        if self.aggAttr:
+            if self.scoreSum == int(self.scoreSum):
+                scoreSum = int(self.scoreSum)
+            else:
+                scoreSum = self.scoreSum
+            aggregates = ('merged_count={0};merged_IDs={1};'
+                          'merged_score={2}').format(self.count,
+                                                     ','.join(self.IDs),
+                                                     scoreSum)
+            if fields[8] == '.':
+                fields[8] = aggregates
+            else:
+                fields[8] = '{0};{1}'.format(fields[8], aggregates)
+        return '\t'.join(fields)
 
 
-def mergeCoords(A, B):
-    """Takes two tuples of coordinates A and B as arguments; A must
-    have a start coordinate before or equal to the start coordinate
-    of B. If they do not overlap then A and B are returned as input
-    and if they overlap the minimum and maximum values are returned.
+def sweepMerge(lines,
+               strandAware=False,
+               byType=False,
+               distance=0,
+               keepAttr=False,
+               aggAttr=False,
+               cluster=False):
+    """Generator that merges features from the iterable lines, which
+    must be sorted by seqid and then by start coordinate, and yields
+    merged features as GFF3 lines in order of start coordinate. Each
+    group of features (all features on a scaffold, or per strand
+    and/or type if strandAware and/or byType) has one merged feature
+    open at a time. A feature is merged into its group's open feature
+    if it starts before the open feature's end plus distance; otherwise
+    the open feature is finished. Finished features are held until no
+    open feature starts before them so output stays sorted. With one
+    group nothing is held, but with several a long open feature in one
+    group holds back the finished features of the others starting
+    after it, so memory use depends on the number of features under
+    the longest open feature, up to a whole scaffold. If cluster is
+    True each merged feature is instead yielded as its original
+    features with a cluster_id attribute, numbered in order of output,
+    and memory use also depends on the largest cluster. Exits
+    with an error if a feature starts before the previous one or if a
+    scaffold's features are not contiguous.
+    """
+
+    def unsorted(line):
+        """Reports the first out-of-order line and exits."""
+        print(('Input is not sorted by seqid and start coordinate at this '
+               'line:\n{0}Sort it first (e.g. with gffSort.py) or run '
+               'without -sorted.').format(line), file=sys.stderr)
+        sys.exit(1)
 
-    let A = (a1, a2), B = (b1, b2) | a1<=b1, a1<=a2, b1<=b2
+    def output(feat):
+        """Numbers a finished feature's cluster and returns it as a
+        string.
+        """
+        nonlocal clusterCount
+        clusterCount += 1
+        feat.clusterID = clusterCount
+        return str(feat)
 
-    case 1: a2<=b1 ---> output A and B
+    clusterCount = 0
+    seenScafs = set()
+    scaf = None
+    lastStart = None
+    openFeats = {}
+    # heap of (start, order finished, MergedFeature)
+    finishedFeats = []
+    finishedCount = 0
+    for line in lines:
+        # skip comment lines
+        if line.startswith('#'):
+            continue
+        fields = line.strip().split('\t')
+        start = int(fields[3])
+        end = int(fields[4])
+        # first feature on a new scaffold: output all features from
+        # the previous scaffold
+        if fields[0] != scaf:
+            for feat in openFeats.values():
+                heapq.heappush(finishedFeats,
+                               (feat.start, finishedCount, feat))
+                finishedCount += 1
+            while finishedFeats:
+                yield output(heapq.heappop(finishedFeats)[2])
+            openFeats = {}
+            if fields[0] in seenScafs:
+                unsorted(line)
+            seenScafs.add(fields[0])
+            scaf = fields[0]
+        elif start < lastStart:
+            unsorted(line)
+        lastStart = start
+        group = (fields[6] if strandAware else None,
+                 fields[2] if byType else None)
+        feat = openFeats.get(group)
+        # feats overlap. extend the open feature and check for overlap
+        # with the subsequent feature
+        if feat != None and start < feat.end + distance:
+            feat.add(fields, end)
+            continue
+        openFeats[group] = MergedFeature(fields, keepAttr, aggAttr, cluster)
+        # feats do not overlap. finish the open feature and output
+        # finished features that no open feature starts before
+        if feat != None:
+            heapq.heappush(finishedFeats, (feat.start, finishedCount, feat))
+            finishedCount += 1
+            firstOpenStart = min(f.start for f in openFeats.values())
+            while finishedFeats and finishedFeats[0][0] <= firstOpenStart:
+                yield output(heapq.heappop(finishedFeats)[2])
+    # finish processing last features
+    for feat in openFeats.values():
+        heapq.heappush(finishedFeats, (feat.start, finishedCount, feat))
+        finishedCount += 1
+    while finishedFeats:
+        yield output(heapq.heappop(finishedFeats)[2])
 
-    case 2: b1<a2 && b2>a2 ---> output (a1, b2)
+def vectorMerge(coords):
+    """Takes a tuple of a NumPy array of start coordinates, an array of
+    end coordinates, and a distance, and merges features using the same
+    rule as sweepMerge(). Features are sorted by start coordinate (ties
+    keep input order), the running maximum of the end coordinates is
+    taken, and a new merged feature begins wherever a start coordinate
+    is at or past the running maximum end (plus distance) of the
+    features before it. Returns a tuple of three arrays: the input
+    indices of the features in sorted order, the positions in that
+    order where each merged feature begins, and the end coordinate of
+    each merged feature.
+    """
+    starts, ends, distance = coords
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = ends[order]
+    runningMaxEnd = np.maximum.accumulate(ends)
+    newFeat = np.empty(len(starts), dtype=bool)
+    newFeat[0] = True
+    newFeat[1:] = starts[1:] >= runningMaxEnd[:-1] + distance
+    firstFeats = np.flatnonzero(newFeat)
+    return (order, firstFeats, np.maximum.reduceat(ends, firstFeats))
 
-    case 3: b2<=a2 ---> output A
+def parallelMerge(inFl,
+                  threads,
+                  strandAware=False,
+                  byType=False,
+                  distance=0,
+                  keepAttr=False,
+                  aggAttr=False,
+                  cluster=False):
+    """Reads all features from inFl, merges the features of each group
+    on each scaffold (see sweepMerge()) with vectorMerge() in a pool of
+    worker processes, and writes the merged features to stdout in order
+    of scaffold and start coordinate. Only the lines and coordinates of
+    the features are kept in memory.
     """
+    gffLines = {}
+    gffCoords = {}
+    for line in inFl:
+        # skip comment lines
+        if not line.startswith('#'):
+            fields = line.split('\t', 7)
+            group = (fields[0],
+                     fields[6] if strandAware else '',
+                     fields[2] if byType else '')
+            if group in gffLines:
+                gffLines[group].append(line)
+                gffCoords[group][0].append(int(fields[3]))
+                gffCoords[group][1].append(int(fields[4]))
+            else:
+                gffLines[group] = [line]
+                gffCoords[group] = ([int(fields[3])], [int(fields[4])])
+    groups = sorted(gffLines.keys())
+    # hand each group's coordinates to the workers. map() returns
+    # results in the order of groups so output is deterministic
+    with Pool(threads) as pool:
+        mergedGroups = pool.map(vectorMerge,
+                                [(np.array(gffCoords[g][0], dtype=np.int64),
+                                  np.array(gffCoords[g][1], dtype=np.int64),
+                                  distance)
+                                 for g in groups])
+    # output merged features one scaffold at a time
+    scafFeats = []
+    clusterCount = 0
+    for i, (group, merged) in enumerate(zip(groups, mergedGroups)):
+        groupLines = gffLines[group]
+        order, firstFeats, mergedEnds = merged
+        order = order.tolist()
+        bounds = firstFeats.tolist() + [len(order)]
+        for j, end in enumerate(mergedEnds.tolist()):
+            feat = MergedFeature(groupLines[order[bounds[j]]].strip().split(
+                                            '\t'), keepAttr, aggAttr, cluster)
+            feat.end = end
+            # only look at the other merged features if their IDs and
+            # scores or lines are needed
+            if aggAttr or cluster:
+                for k in order[bounds[j] + 1:bounds[j + 1]]:
+                    feat.add(groupLines[k].strip().split('\t'), end)
+            scafFeats.append(feat)
+        if i == len(groups) - 1 or groups[i + 1][0] != group[0]:
+            scafFeats.sort(key=lambda x:x.start)
+            for feat in scafFeats:
+                clusterCount += 1
+                feat.clusterID = clusterCount
+                sys.stdout.write(str(feat) + '\n')
+            scafFeats = []
+
 
-    assert min(A) <= min(B), ("tuples given to mergeCoords in wrong order: "
-                                "A={0}, B={1}").format(A,B)
-    if min(B) >= max(A):
-        return ((A, B), 0)
-    elif min(B) < max(A) and max(B) > max(A):
-        output = (min(A),max(B))
-        return ((output, output), 1)
-    elif max(B) <= max(A):
-        return ((A, A), 2)
+if __name__ == '__main__':
+    args = sys.argv
+    # print help information if asked for
+    if '-h' in args:
+        help()
+    # read command line arguments
+    options = {'strandAware':'-s' in args,
+               'byType':'-byType' in args,
+               'distance':0,
+               'keepAttr':'-keepAttr' in args,
+               'aggAttr':'-aggAttr' in args,
+               'cluster':'-cluster' in args}
+    if '-d' in args:
+        options['distance'] = int(args[args.index('-d') + 1])
+    # merge sorted input as it is read
+    if '-sorted' in args:
+        for feat in sweepMerge(sys.stdin, **options):
+            sys.stdout.write(feat + '\n')
+    # merge each scaffold in a separate process
+    elif '-threads' in args:
+        if np == None:
+            print('-threads requires NumPy, which could not be imported.',
+                  file=sys.stderr)
+            sys.exit(1)
+        threads = int(args[args.index('-threads') + 1])
+        parallelMerge(sys.stdin, threads, **options)
+    # for each line in the input gff store the line in a dictionary
+    # organized by scaffold. then sort the features on each scaffold
+    # by start coordinate, merge them, and output them in order of
+    # scaffold and start coordinate
     else:
-        raise Exception(("Unexpected result from mergeCoords(A,B) using "
-                           " A={0}, B={1}").format(A,B))
-
-
-# print help information if asked for
-if '-h' in sys.argv:
-    help()
-# for each line in the input gff store as a GFF3_line object in a
-# dictionary organized by scaffold. then merge features on each
-# scaffold and output
-gffFeats = {}
-for line in sys.stdin:
-    # skip comment lines
-    if not line.startswith('#'):
-        lineObj = GFF3_line(line)
-        scaf = lineObj.seqid
-        if scaf in gffFeats:
-            gffFeats[scaf].append(lineObj)
-        else:
-            gffFeats[scaf] = [lineObj]
-# for each scaffold sort features by start coordinate then merge 
-# overlapping features
-for scaf in gffFeats: 
-    gffFeats[scaf] = sorted(gffFeats[scaf], key=lambda x:int(x.start))
-    newScafFeats = []
-    currentFeat = gffFeats[scaf][0]
-    i=0
-    while i < len(gffFeats[scaf]) - 1:
-        nextFeat = gffFeats[scaf][i + 1]
-        mergeResult = mergeCoords((int(currentFeat.start), int(currentFeat.end)), 
-                                  (int(nextFeat.start), int(nextFeat.end)))
-        # feats do not overlap
-        if mergeResult[1] == 0:
-            currentFeat.start, currentFeat.end = mergeResult[0][0]
-            currentFeat.score = '.'
-            if '-keepAttr' not in sys.argv:
-                currentFeat.attributes_str = '.'
-            newScafFeats.append(currentFeat)
-            currentFeat = nextFeat
-        # feats overlap. continue iterations and check for overlap with
-        # subsequent feature
-        else:
-            currentFeat.start, currentFeat.end = mergeResult[0][0]
-        i += 1
-    # finish processing last feature
-    currentFeat.score = '.'
-    if '-keepAttr' not in sys.argv:
-        currentFeat.attributes_str = '.'
-    newScafFeats.append(currentFeat)
-    # replace existing 
-    gffFeats[scaf] = newScafFeats
-# output new gff lines in order of scaffold and start coordinate
-for scaf in sorted(gffFeats.keys()):
-    for line in gffFeats[scaf]:
-        print(str(line))
+        gffLines = {}
+        for line in sys.stdin:
+            # skip comment lines
+            if not line.startswith('#'):
+                scaf = line.split('\t', 1)[0]
+                if scaf in gffLines:
+                    gffLines[scaf].append(line)
+                else:
+                    gffLines[scaf] = [line]
+
+        def sortedLines():
+            """Generator that yields the stored lines sorted by
+            scaffold and start coordinate.
+            """
+            for scaf in sorted(gffLines.keys()):
+                yield from sorted(gffLines[scaf],
+                                  key=lambda x:int(x.split('\t', 4)[3]))
+                del gffLines[scaf]
+
+        for feat in sweepMerge(sortedLines(), **options):
+            sys.stdout.write(feat + '\n')
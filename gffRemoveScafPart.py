@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import sys
+from intervalIndex import IntervalIndex
 
 
 def help():
@@ -12,48 +13,112 @@ def help():
     Description:
     ------------
     Removes features present in the range provided from a GFF3 file.
+    Any number of ranges can be provided in a BED file with -bed, and
+    all of them are removed in a single pass through the GFF3.
 
     Options:
     ------------
     -scaf  <string>     Scaffold name from which to remove features
     -range <int-int>    Range to remove, e.g. -range 452-1823
+    -bed   <path>       BED file of ranges to remove. BED coordinates
+                        are 0-based and end-exclusive, so the BED line
+                        scaf1 451 1823 is the same as -scaf scaf1
+                        -range 452-1823. Can be combined with -scaf and
+                        -range.
+    -mode  <string>     Which features are removed. One of:
+                        partial     features starting at or after the
+                                    start of a range and before its
+                                    end, or ending after its start and
+                                    before its end (default)
+                        contained   features entirely within a range
+                        overlap     features overlapping a range by at
+                                    least one base
     -h                  Output help information
     ''')
     sys.exit(0)
 
 
+def readBed(bedFilepath, regionIndex):
+    """Adds the ranges in a BED file to regionIndex, converting them to
+    1-based coordinates. Header lines are skipped.
+    """
+    with open(bedFilepath) as bedFl:
+        for line in bedFl:
+            if (line.startswith('#')
+             or line.startswith('track')
+             or line.startswith('browser')
+             or line.strip() == ''):
+                continue
+            contents = line.strip().split('\t')
+            regionIndex.add(contents[0], int(contents[1]) + 1,
+                            int(contents[2]))
+
+def partialOverlap(start, end, startTarget, endTarget):
+    """Returns True if the feature start-end starts within or ends
+    within the range startTarget-endTarget as tested by earlier
+    versions of this script.
+    """
+    return ((start >= startTarget and start < endTarget)
+         or (end > startTarget and end < endTarget))
+
+def contained(start, end, startTarget, endTarget):
+    """Returns True if the feature start-end is within the range
+    startTarget-endTarget.
+    """
+    return start >= startTarget and end <= endTarget
+
+def anyOverlap(start, end, startTarget, endTarget):
+    """Returns True if the feature start-end overlaps the range
+    startTarget-endTarget.
+    """
+    return start <= endTarget and end >= startTarget
+
+
 # print help information if not enough command line arguments are
 # provided
 args = sys.argv
-if ('-h' in args 
- or '-help' in args 
- or len(args) < 5
- or '-scaf' not in args
- or '-range' not in args):
+if ('-h' in args
+ or '-help' in args
+ or (('-scaf' not in args or '-range' not in args) and '-bed' not in args)):
     help()
-# parse command line arguments
-scafTarget = args[args.index('-scaf')+1]
-r = args[args.index('-range')+1].split('-')
-startTarget = int(r[0])
-endTarget = int(r[1])
+# parse command line arguments and index the ranges by scaffold
+regionIndex = IntervalIndex()
+if '-scaf' in args and '-range' in args:
+    scafTarget = args[args.index('-scaf')+1]
+    r = args[args.index('-range')+1].split('-')
+    regionIndex.add(scafTarget, int(r[0]), int(r[1]))
+if '-bed' in args:
+    readBed(args[args.index('-bed')+1], regionIndex)
+modes = {'partial':partialOverlap, 'contained':contained, 'overlap':anyOverlap}
+if '-mode' in args:
+    mode = args[args.index('-mode')+1]
+    if mode not in modes:
+        print('-mode must be one of partial, contained, or overlap',
+                                                               file=sys.stderr)
+        sys.exit(1)
+else:
+    mode = 'partial'
+removed = modes[mode]
 # for each line in the GFF3 file extract scaffold name and coordinates
-# and check if any part of the feature overlaps the region specified
-# by -range. If it does, do not output that line. If not, output that
-# line.
+# and check whether the feature is removed by any of the ranges on its
+# scaffold that it overlaps. If it is, do not output that line. If
+# not, output that line.
 for line in sys.stdin:
     if not line.startswith('#'):
-        contents = line.strip().split('\t')
+        contents = line.split('\t', 5)
         scaf = contents[0]
-        if scaf == scafTarget:
+        # feature is on a scaffold with ranges to remove
+        if scaf in regionIndex:
             start = int(contents[3])
             end = int(contents[4])
-            # feature is on scaffold and within range
-            if ((start >= startTarget and start < endTarget) 
-             or (end > startTarget and end < endTarget)):
+            # feature is on scaffold and within a range
+            if any(removed(start, end, startTarget, endTarget)
+                   for startTarget, endTarget, value in
+                             regionIndex.overlapping(scaf, start, end)):
                 continue
             # feature is on scaffold but out of range
             else:
-                print(line, end='')
+                sys.stdout.write(line)
         # feature is not on scaffold
         else:
-            print(line, end='')
+            sys.stdout.write(line)
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 
 import sys
+from intervalIndex import IntervalIndex
 
 
 def help():
     print('''
     Usage:
     ------------
-    gffRenameScaffolds.py -map <file> -input <file>
+    gffRenameScaffolds.py -map <file> -input <file> [-unmapped <file>]
+    gffRenameScaffolds.py -agp <file> -input <file> [-unmapped <file>]
+    gffRenameScaffolds.py -chain <file> -input <file> [-unmapped <file>]
 
     Description:
     ------------
@@ -16,6 +19,24 @@ def help():
     column contains the old scaffold name and the second column
     contains the new scaffold name.
 
+    With -agp or -chain, features are lifted over to new sequences
+    instead: the sequence id, start, end, and strand of each feature
+    are translated using an AGP file describing how the sequences in
+    the input (the components) were placed in new sequences (the
+    objects), e.g. after scaffolding, or a UCSC chain file from the
+    input sequences (target) to new sequences (query). A feature can
+    only be lifted if both its start and end fall within the same AGP
+    component line or the aligned blocks of the same chain. When chains
+    overlap, the first one in the file is used. ##sequence-region lines
+    are not output because the sequence lengths change.
+
+    Options:
+    ------------
+    -unmapped <file>    Write lines that could not be renamed or lifted
+                        over to this file. Without -unmapped these lines
+                        are not output and a warning is printed for
+                        each unknown sequence id.
+
     Output:
     ------------
     Modified lines from the input GFF3
@@ -23,17 +44,166 @@ def help():
     sys.exit()
 
 
+def readAGP(agp_flname):
+    """Returns an IntervalIndex of the component lines in an AGP file
+    with the 1-based component coordinates as intervals. Each value is
+    (line_number, object, object coordinate of the component start,
+    strand), where the strand is - if the component is reversed in the
+    object.
+    """
+    segments = IntervalIndex()
+    with open(agp_flname) as agp_fl:
+        for line_number, line in enumerate(agp_fl):
+            if line.startswith('#') or line.strip() == '':
+                continue
+            contents = line.strip().split('\t')
+            # gap lines have no component
+            if contents[4] in ('N', 'U'):
+                continue
+            obj = contents[0]
+            obj_beg, obj_end = int(contents[1]), int(contents[2])
+            comp_id = contents[5]
+            comp_beg, comp_end = int(contents[6]), int(contents[7])
+            if contents[8] == '-':
+                segments.add(comp_id, comp_beg, comp_end,
+                             (line_number, obj, obj_end, '-'))
+            else:
+                segments.add(comp_id, comp_beg, comp_end,
+                             (line_number, obj, obj_beg, '+'))
+    return segments
+
+def readChain(chain_flname):
+    """Returns an IntervalIndex of the aligned blocks in a UCSC chain
+    file with 1-based target coordinates as intervals. Each value is
+    (chain_number, query name, query coordinate of the block start,
+    strand), where the strand is - if the query is reversed.
+    """
+    segments = IntervalIndex()
+    with open(chain_flname) as chain_fl:
+        chain_number = 0
+        for line in chain_fl:
+            contents = line.split()
+            if contents == [] or line.startswith('#'):
+                continue
+            # header of a new chain
+            if contents[0] == 'chain':
+                chain_number += 1
+                t_name = contents[2]
+                q_name, q_size, q_strand = (contents[7], int(contents[8]),
+                                            contents[9])
+                t_pos, q_pos = int(contents[5]), int(contents[10])
+                continue
+            # an aligned block followed by the gaps before the next
+            # block. coordinates are 0-based and on the reverse strand
+            # of the query if q_strand is -
+            size = int(contents[0])
+            if q_strand == '-':
+                segments.add(t_name, t_pos + 1, t_pos + size,
+                             (chain_number, q_name, q_size - q_pos, '-'))
+            else:
+                segments.add(t_name, t_pos + 1, t_pos + size,
+                             (chain_number, q_name, q_pos + 1, '+'))
+            t_pos += size
+            q_pos += size
+            if len(contents) == 3:
+                t_pos += int(contents[1])
+                q_pos += int(contents[2])
+    return segments
+
+def liftPosition(segment, position):
+    """Returns the position on the new sequence of a position in the
+    interval (start, end, value) of a segment index.
+    """
+    start, end, (number, new_id, new_start, strand) = segment
+    if strand == '-':
+        return new_start - (position - start)
+    return new_start + (position - start)
+
+def liftFeature(segments, seqid, start, end):
+    """Returns (new seqid, new start, new end, strand of the segment)
+    for the feature seqid:start-end, or None if its start and end are
+    not in the same segment group (AGP line or chain).
+    """
+    # the segments containing the start and end of the feature, by
+    # group
+    start_segments = {}
+    end_segments = {}
+    for segment in segments.overlapping(seqid, start, end):
+        if segment[0] <= start:
+            start_segments[segment[2][0]] = segment
+        if segment[1] >= end:
+            end_segments[segment[2][0]] = segment
+    groups = start_segments.keys() & end_segments.keys()
+    if not groups:
+        return None
+    # use the first group in the file containing both ends
+    group = min(groups)
+    new_start = liftPosition(start_segments[group], start)
+    new_end = liftPosition(end_segments[group], end)
+    return (start_segments[group][2][1], min(new_start, new_end),
+            max(new_start, new_end), start_segments[group][2][3])
+
+def unmapped(line, seqid, unmapped_fl, unknown_ids):
+    """Writes a line that could not be renamed or lifted over to
+    unmapped_fl, or if it is None warns about its sequence id once.
+    """
+    if unmapped_fl != None:
+        unmapped_fl.write(line)
+    elif seqid not in unknown_ids:
+        unknown_ids.add(seqid)
+        print('Not in -map, -agp, or -chain: {0}'.format(seqid),
+                                                               file=sys.stderr)
+
+
 # print help information if not enough command line arguments were
 # provided
 args = sys.argv
-if ('-h' in args 
-    or len(args) < 5 
-    or '-map' not in args 
+if ('-h' in args
+    or len(args) < 5
+    or ('-map' not in args and '-agp' not in args and '-chain' not in args)
     or '-input' not in args):
     help()
 # read command line arguments
-map_flname = args[args.index('-map') + 1]
 in_flname = args[args.index('-input') + 1]
+if '-unmapped' in args:
+    unmapped_fl = open(args[args.index('-unmapped') + 1], 'w')
+else:
+    unmapped_fl = None
+# sequence ids already warned about
+unknown_ids = set()
+# lift features over to new sequences
+if '-agp' in args or '-chain' in args:
+    if '-agp' in args:
+        segments = readAGP(args[args.index('-agp') + 1])
+    else:
+        segments = readChain(args[args.index('-chain') + 1])
+    flip_strand = {'+':'-', '-':'+'}
+    out_fl = open(sys.stdout.fileno(), 'w', buffering=1024*1024,
+                  closefd=False)
+    with open(in_flname) as input_file, out_fl:
+        for line in input_file:
+            # sequence lengths change, so these lines are dropped
+            if line.startswith('##sequence-region'):
+                continue
+            # output commented lines unaltered
+            elif line.startswith('#'):
+                out_fl.write(line)
+                continue
+            contents = line.rstrip('\n').split('\t')
+            lifted = liftFeature(segments, contents[0], int(contents[3]),
+                                 int(contents[4]))
+            if lifted == None:
+                unmapped(line, contents[0], unmapped_fl, unknown_ids)
+                continue
+            contents[0], start, end, strand = lifted
+            contents[3], contents[4] = str(start), str(end)
+            if strand == '-':
+                contents[6] = flip_strand.get(contents[6], contents[6])
+            out_fl.write('\t'.join(contents) + '\n')
+    if unmapped_fl != None:
+        unmapped_fl.close()
+    sys.exit(0)
+map_flname = args[args.index('-map') + 1]
 map_dct = {}
 # for each line put the values of the two columns into a dictionary
 # {oldScafName:newScafName}
@@ -43,7 +213,7 @@ with open(map_flname) as map_fl:
         try:
             from_id = contents[0]
             to_id = contents[1]
-        except KeyError:
+        except IndexError:
             continue
         if from_id in map_dct:
             print('Duplicate ID in first column: {0}'.format(from_id))
@@ -57,14 +227,22 @@ with open(in_flname) as input_file:
         # rename them accordingly
         if  line.startswith('##sequence-region'):
             contents = line.strip().split()
+            if contents[1] not in map_dct:
+                unmapped(line, contents[1], unmapped_fl, unknown_ids)
+                continue
             contents[1] = map_dct[contents[1]]
             print('{0}\t{1}'.format(contents[0], ' '.join(contents[1:])))
         # output commented lines unaltered
         elif line.startswith('#'):
-            print(line)
+            sys.stdout.write(line)
         # replace the scaffold name in the first field of gff feature
         # lines with the new name
         else:
-            contents = line.strip().split()
+            contents = line.rstrip('\n').split('\t')
+            if contents[0] not in map_dct:
+                unmapped(line, contents[0], unmapped_fl, unknown_ids)
+                continue
             contents[0] = map_dct[contents[0]]
             print('\t'.join(contents))
+if unmapped_fl != None:
+    unmapped_fl.close()
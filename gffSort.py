@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import sys
+import heapq
+import tempfile
+
+
+def help():
+    print('''
+    Usage:
+    ------------
+    gffSort.py [options] < input.gff > sorted.gff
+
+    Description:
+    ------------
+    Sorts the features in a GFF3 file by seqid, start coordinate, and
+    end coordinate. Input larger than the memory budget set by -mem is
+    sorted in chunks that are written to temporary files and then
+    merged, so files much larger than the available memory can be
+    sorted. Features with identical sort keys keep their input order.
+
+    Directive lines starting with ## (e.g. ##gff-version and
+    ##sequence-region) are output first in their original order.
+    Other commented lines and ### lines are not output. Anything after
+    a ##FASTA line is output unchanged after the sorted features.
+
+    Options:
+    ------------
+    -gff       <path>   Input GFF3. Default is to read from stdin.
+
+    -mem       <int>    Memory budget in megabytes. Default 1024.
+
+    -tmpDir    <path>   Directory for temporary files. Default is the
+                        system temporary directory.
+
+    -hierarchy          Sort features with the same start by
+                        descending end instead of ascending end, and
+                        features without a Parent attribute before
+                        features with one, so parent features (e.g.
+                        gene, mRNA) precede their children (e.g. exon).
+    ''', file=sys.stderr)
+    sys.exit(0)
+
+
+def coordKey(line):
+    """Returns the sort key (seqid, start, end) for a GFF3 line."""
+    fields = line.split('\t', 5)
+    return (fields[0], int(fields[3]), int(fields[4]))
+
+def hierarchyKey(line):
+    """Returns the sort key (seqid, start, -end, hasParent) for a GFF3
+    line so that enclosing features sort before the features they
+    contain.
+    """
+    fields = line.split('\t')
+    return (fields[0],
+            int(fields[3]),
+            -int(fields[4]),
+            'Parent=' in fields[8])
+
+def writeRun(lines, tmpDir):
+    """Writes lines to a new temporary file and returns the file,
+    rewound for reading. The file is deleted when it is closed.
+    """
+    run = tempfile.TemporaryFile(mode='w+', dir=tmpDir, encoding='utf-8',
+                                 errors='surrogateescape')
+    run.writelines(lines)
+    run.seek(0)
+    return run
+
+def externalSort(lines, key, memBytes, tmpDir=None, fanIn=128):
+    """Generator that yields lines from the iterable lines in the
+    order given by key, using at most roughly memBytes of memory for
+    the lines held at once. When the budget is reached the lines held
+    are sorted and written to a temporary file (a run). After the
+    input is exhausted all runs are merged with heapq.merge. If more
+    than fanIn runs accumulate they are merged into one run first so
+    the number of open files stays bounded. The sort is stable.
+
+    Arguments:
+    ----------
+    lines: iterable of strings, each ending with a newline
+    key: function returning the sort key for a line
+    memBytes: approximate memory budget in bytes
+    tmpDir: directory for temporary files
+    fanIn: maximum number of runs to merge at once
+    """
+    # the estimated per-line overhead of holding a line and its place
+    # in a list, in bytes
+    lineOverhead = 128
+    runs = []
+    chunk = []
+    chunkBytes = 0
+    for line in lines:
+        chunk.append(line)
+        chunkBytes += len(line) + lineOverhead
+        if chunkBytes >= memBytes:
+            chunk.sort(key=key)
+            runs.append(writeRun(chunk, tmpDir))
+            chunk = []
+            chunkBytes = 0
+            # merge runs into a single run when there are too many.
+            # runs are merged in the order they were written so the
+            # sort stays stable
+            if len(runs) >= fanIn:
+                merged = writeRun(heapq.merge(*runs, key=key), tmpDir)
+                for run in runs:
+                    run.close()
+                runs = [merged]
+    chunk.sort(key=key)
+    # everything fit in memory
+    if runs == []:
+        yield from chunk
+    # merge the runs with the remaining lines, which were read last
+    else:
+        yield from heapq.merge(*runs, iter(chunk), key=key)
+        for run in runs:
+            run.close()
+
+def gffSort(inFl, outFl, memBytes, tmpDir=None, hierarchy=False):
+    """Reads a GFF3 from inFl and writes it to outFl with features
+    sorted by externalSort(). Directives are written first and any
+    ##FASTA section is written last.
+    """
+    directives = []
+    fastaSection = None
+
+    def features():
+        """Generator that yields feature lines from inFl and sets
+        aside directives and the ##FASTA section.
+        """
+        nonlocal fastaSection
+        for line in inFl:
+            if line.startswith('##FASTA'):
+                # keep the FASTA section out of memory until the sorted
+                # features have been written
+                fastaSection = tempfile.TemporaryFile(mode='w+', dir=tmpDir)
+                fastaSection.write(line)
+                for line in inFl:
+                    fastaSection.write(line)
+                fastaSection.seek(0)
+                return
+            elif line.startswith('###'):
+                continue
+            elif line.startswith('##'):
+                directives.append(line)
+            elif line.startswith('#') or line.strip() == '':
+                continue
+            else:
+                if not line.endswith('\n'):
+                    line += '\n'
+                yield line
+
+    key = hierarchyKey if hierarchy else coordKey
+    sortedFeats = externalSort(features(), key, memBytes, tmpDir)
+    # the directives have all been read once the first sorted feature
+    # is available
+    firstFeat = next(sortedFeats, None)
+    outFl.writelines(directives)
+    if firstFeat != None:
+        outFl.write(firstFeat)
+        outFl.writelines(sortedFeats)
+    if fastaSection != None:
+        for line in fastaSection:
+            outFl.write(line)
+        fastaSection.close()
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    if '-h' in args or '-help' in args:
+        help()
+    # read command line arguments
+    if '-mem' in args:
+        memBytes = int(args[args.index('-mem') + 1]) * 1024 * 1024
+    else:
+        memBytes = 1024 * 1024 * 1024
+    if '-tmpDir' in args:
+        tmpDir = args[args.index('-tmpDir') + 1]
+    else:
+        tmpDir = None
+    hierarchy = '-hierarchy' in args
+    if '-gff' in args:
+        with open(args[args.index('-gff') + 1]) as inFl:
+            gffSort(inFl, sys.stdout, memBytes, tmpDir, hierarchy)
+    else:
+        gffSort(sys.stdin, sys.stdout, memBytes, tmpDir, hierarchy)
@@ -1,40 +1,173 @@
 #!/usr/bin/env python3
 
+import os
+import re
 import sys
-from gff3line import GFF3_line
 
 
 def help():
     print('''
     Usage:
     ------------
-    gffSubset -attr <str> -list <path> -gff <path>
+    gffSubset -attr <str> -list <path> -gff <path> [-index]
+    gffSubset -attr <str> -demux <path> -gff <path> [-out <prefix>]
 
-    Description: 
+    Description:
     ------------
     Takes a GFF3 file, a list, and the name of an attribute key present
     in the GFF3 file and outputs each line for which the value of the
-    attribute key is in the list.
+    attribute key is in the list. A comma-separated value such as
+    Parent=mRNA1,mRNA2 matches each of its values. Lines without the
+    attribute key are not output.
+
+    With -demux, takes a two-column tab-delimited file instead of a
+    list. The first column contains attribute values and the second the
+    name of the subset (e.g. gene family) that lines with that value
+    are written to. A value may belong to more than one subset. All
+    subsets are written in a single pass through the GFF3, each to the
+    file <prefix>.<subset>.gff. Lines are held in memory and appended
+    to their files whenever 64 MB of them are held, so only one file
+    is open at a time however many subsets there are. Characters of
+    subset names other than letters, digits, _, ., and - are replaced
+    by _ in file names, and two subsets that would get the same file
+    name are reported as an error before any file is written.
+
+    Options:
+    ------------
+    -out <prefix>   Prefix of the files written with -demux. Default is
+                    the -gff file name.
+
+    -index          With -list, find lines using an index of the -attr
+                    values (see gffIndex.py) instead of reading the
+                    whole GFF3. The index is built on first use and
+                    rebuilt when the GFF3 changes. The attribute key
+                    must match exactly (name does not match Name).
         ''', file=sys.stderr)
     sys.exit(0)
 
 
+# bytes of lines held with -demux before they are written
+HELD_BYTES = 64 * 1024 * 1024
+
+
+def attrPattern(attr):
+    """Returns a compiled regular expression matching the value of the
+    attribute key attr in the attributes column of a whole GFF3 line,
+    so lines do not need to be split. The key name also matches Name,
+    as GFF3_line renames it.
+    """
+    if attr == 'Name':
+        key = '(?:Name|name)'
+    else:
+        key = re.escape(attr)
+    return re.compile('[\\t;]{0}=([^;\\n]*)'.format(key))
+
+def writeSubsets(subsetLines, subsetPaths):
+    """Appends the lines held for each subset in subsetLines
+    {subset:[lines]} to its file in subsetPaths and empties the lists.
+    """
+    for subset, lines in subsetLines.items():
+        if lines:
+            with open(subsetPaths[subset], 'a') as outFl:
+                outFl.writelines(lines)
+            lines.clear()
+
+
 args = sys.argv
 # output help information if missing command line arguments
-if ('-attr' not in args 
-     or '-list' not in args 
+if ('-attr' not in args
+     or ('-list' not in args and '-demux' not in args)
      or '-gff' not in args
      or len(args) < 7):
     help()
 # read command line arguments
 attr = args[args.index('-attr') + 1]
 gff = args[args.index('-gff') + 1]
-lst = args[args.index('-list') + 1]
+attrValue = attrPattern(attr)
+# read each value's subsets into a dictionary {value:[subsets]} and
+# write the lines of each subset to its file
+if '-demux' in args:
+    if '-out' in args:
+        outPrefix = args[args.index('-out') + 1]
+    else:
+        outPrefix = os.path.basename(gff)
+    subsets = {}
+    subsetPaths = {}
+    demuxPath = args[args.index('-demux') + 1]
+    # {file name:subset} to find subsets written to the same file
+    pathSubsets = {}
+    with open(demuxPath) as fl:
+        for lineNumber, line in enumerate(fl, 1):
+            if line.strip() == '':
+                continue
+            columns = line.strip().split('\t')
+            if len(columns) != 2:
+                print('Line {0} of {1} does not have two tab-separated '
+                      'columns'.format(lineNumber, demuxPath), file=sys.stderr)
+                sys.exit(1)
+            value, subset = columns
+            if value in subsets:
+                if subset not in subsets[value]:
+                    subsets[value].append(subset)
+            else:
+                subsets[value] = [subset]
+            if subset not in subsetPaths:
+                # keep subset names that are unsafe in file names
+                # readable
+                path = '{0}.{1}.gff'.format(outPrefix,
+                                      re.sub('[^A-Za-z0-9_.-]', '_', subset))
+                if path in pathSubsets:
+                    print('Subsets {0} and {1} would both be written to '
+                          '{2}'.format(pathSubsets[path], subset, path),
+                          file=sys.stderr)
+                    sys.exit(1)
+                pathSubsets[path] = subset
+                subsetPaths[subset] = path
+    # start each file empty
+    for path in pathSubsets:
+        open(path, 'w').close()
+    # lines read for each subset and not yet written
+    subsetLines = {subset:[] for subset in subsetPaths}
+    heldBytes = 0
+    with open(gff) as fl:
+        for line in fl:
+            # skip commented lines
+            if line.startswith('#'):
+                continue
+            match = attrValue.search(line)
+            if match == None:
+                continue
+            values = match.group(1).split(',')
+            if len(values) == 1:
+                lineSubsets = subsets.get(values[0], [])
+            else:
+                lineSubsets = []
+                for value in values:
+                    for subset in subsets.get(value, []):
+                        if subset not in lineSubsets:
+                            lineSubsets.append(subset)
+            if lineSubsets:
+                line = line.strip() + '\n'
+                for subset in lineSubsets:
+                    subsetLines[subset].append(line)
+                heldBytes += len(line)
+                if heldBytes > HELD_BYTES:
+                    writeSubsets(subsetLines, subsetPaths)
+                    heldBytes = 0
+    writeSubsets(subsetLines, subsetPaths)
+    sys.exit(0)
 # read list contents into a set
+lst = args[args.index('-list') + 1]
 lstSet = set()
 with open(lst) as fl:
     for line in fl:
         lstSet.add(line.strip())
+# look up lines with values in lstSet in the attribute index
+if '-index' in args:
+    from gffIndex import lookupLines
+    for line in lookupLines(gff, attr, lstSet):
+        sys.stdout.write(line.strip() + '\n')
+    sys.exit(0)
 # read gff lines and output lines containing a key-value pair of the
 # attribute given by -attr and one of the elements in the lstSet
 with open(gff) as fl:
@@ -42,6 +175,7 @@ with open(gff) as fl:
         # skip commented lines
         if line.startswith('#'):
             continue
-        GFF = GFF3_line(line)
-        if GFF.attributes[attr] in lstSet:
-            print(line.strip())
+        match = attrValue.search(line)
+        if match and any(value in lstSet
+                         for value in match.group(1).split(',')):
+            sys.stdout.write(line.strip() + '\n')
@@ -1,27 +1,160 @@
 #!/usr/bin/env python3
 
+import os
+import re
 import sys
-from gff3line import GFF3_line
 
 
 def help():
     print('''
     Usage:
     ------------
-    gffSubset -list <path> -gff <path>
+    gffSubset -list <path> -gff <path> [-index]
 
-    Description: 
+    Description:
     ------------
     Takes a list of LTR_retrotransposon IDs and a GFF3 file and outputs
     feature blocks for the elements in the list. Assumes the GFF3 is
-    properly sorted with parent-child relationships preserved.
+    properly sorted with parent-child relationships preserved. A block
+    is a repeat_region feature and the features following it up to the
+    next repeat_region. Elements are matched by number, so
+    LTR_retrotransposon12 in the list selects the block of
+    repeat_region12.
+
+    Options:
+    ------------
+    -index      Use an index of the byte offsets of the blocks in the
+                GFF3 (<gff>.blocks.idx) to copy only the blocks in the
+                list from the GFF3 instead of reading all of it. The
+                index is built on first use and rebuilt when the GFF3
+                changes. Lines are copied as they are in the GFF3.
         ''', file=sys.stderr)
     sys.exit(0)
 
 
+# the ID attribute in the attributes column
+ATTR_ID = re.compile('(?:^|;)ID=([^;]*)')
+
+
+def elementNumber(elementId):
+    """Returns the number of an LTR_retrotransposon or repeat_region
+    ID, e.g. 12 for LTR_retrotransposon12 or repeat_region12. IDs
+    without either prefix are returned unchanged.
+    """
+    for prefix in ('LTR_retrotransposon', 'repeat_region'):
+        if elementId.startswith(prefix):
+            return elementId[len(prefix):]
+    return elementId
+
+def repeatRegionNumber(attributes):
+    """Returns the element number of a repeat_region from the
+    attributes column of its line.
+    """
+    featureId = ATTR_ID.search(attributes)
+    if featureId == None:
+        return None
+    return elementNumber(featureId.group(1))
+
+def blockRanges(gffPath):
+    """Generator that yields (element number, 'offset:length') for the
+    byte ranges of the feature lines of each repeat_region block in a
+    GFF3. A block interrupted by commented lines has more than one
+    range.
+    """
+    with open(gffPath, 'rb') as fl:
+        offset = 0
+        number = None
+        rangeStart = None
+        for line in fl:
+            if line.startswith(b'#'):
+                # end the current range before a commented line
+                if rangeStart != None:
+                    yield (number, '{0}:{1}'.format(rangeStart,
+                                                    offset - rangeStart))
+                    rangeStart = None
+            else:
+                fields = line.rstrip(b'\r\n').split(b'\t', 8)
+                if len(fields) > 8 and fields[2] == b'repeat_region':
+                    if rangeStart != None:
+                        yield (number, '{0}:{1}'.format(rangeStart,
+                                                        offset - rangeStart))
+                    number = repeatRegionNumber(fields[8].decode())
+                    rangeStart = offset
+                # continue a block after commented lines
+                elif number != None and rangeStart == None:
+                    rangeStart = offset
+            offset += len(line)
+        if rangeStart != None:
+            yield (number, '{0}:{1}'.format(rangeStart, offset - rangeStart))
+
+def openBlockIndex(gffPath):
+    """Returns the SortedKeyIndex of the blocks of a GFF3, building it
+    first if it does not exist or the GFF3 has changed.
+    """
+    from gffIndex import SortedKeyIndex, writeSortedKeyIndex
+    indexPath = gffPath + '.blocks.idx'
+    if os.path.exists(indexPath):
+        index = SortedKeyIndex(indexPath)
+        if index.isCurrent(gffPath):
+            return index
+        index.close()
+    writeSortedKeyIndex(indexPath, gffPath, blockRanges(gffPath))
+    return SortedKeyIndex(indexPath)
+
+def copyRange(inFl, outFd, offset, length):
+    """Copies length bytes starting at offset in inFl to the file
+    descriptor outFd, with os.sendfile if possible.
+    """
+    try:
+        while length > 0:
+            sent = os.sendfile(outFd, inFl.fileno(), offset, length)
+            if sent == 0:
+                break
+            offset += sent
+            length -= sent
+        return
+    except (OSError, AttributeError):
+        pass
+    inFl.seek(offset)
+    while length > 0:
+        data = inFl.read(min(length, 1024 * 1024))
+        if data == b'':
+            break
+        os.write(outFd, data)
+        length -= len(data)
+
+def copyBlocks(gffPath, numbers, outFd):
+    """Writes the blocks of the elements numbers in a GFF3 to the file
+    descriptor outFd in file order, each preceded by ###.
+    """
+    index = openBlockIndex(gffPath)
+    ranges = []
+    for number in numbers:
+        found = index.lookup(number)
+        if found != None:
+            for r in found.split(','):
+                ranges.append(tuple(int(x) for x in r.split(':')))
+    index.close()
+    ranges.sort()
+    fileSize = os.path.getsize(gffPath)
+    with open(gffPath, 'rb') as inFl:
+        # whether the last line of the file needs a line end added
+        inFl.seek(max(fileSize - 1, 0))
+        lastLineOpen = fileSize > 0 and inFl.read(1) != b'\n'
+        for offset, length in ranges:
+            # a range starting with a repeat_region starts a block, the
+            # others continue a block after commented lines
+            inFl.seek(offset)
+            if inFl.readline().split(b'\t', 3)[2:3] == [b'repeat_region']:
+                os.write(outFd, b'###\n')
+            copyRange(inFl, outFd, offset, length)
+            if lastLineOpen and offset + length == fileSize:
+                os.write(outFd, b'\n')
+
+
 args = sys.argv
 # output help information if missing command line arguments
-if ('-list' not in args 
+if ('-list' not in args
      or '-gff' not in args
      or len(args) < 5):
     help()
@@ -32,7 +165,12 @@ lst = args[args.index('-list') + 1]
 lstSet = set()
 with open(lst) as fl:
     for line in fl:
-        lstSet.add(line.strip().lstrip('LTR_retrotransposon'))
+        lstSet.add(elementNumber(line.strip()))
+# copy the blocks in lstSet using the block index
+if '-index' in args:
+    sys.stdout.flush()
+    copyBlocks(gff, lstSet, sys.stdout.fileno())
+    sys.exit(0)
 # read gff lines and output lines belonging to each block whose
 # repeat_region feature number is in lstSet
 with open(gff) as fl:
@@ -41,12 +179,12 @@ with open(gff) as fl:
         # skip commented lines
         if line.startswith('#'):
             continue
-        GFF = GFF3_line(line)
-        if GFF.type == 'repeat_region':
+        fields = line.rstrip('\r\n').split('\t', 8)
+        if fields[2] == 'repeat_region':
             output = False
-            if GFF.attributes['ID'].lstrip('repeat_region') in lstSet:
+            if repeatRegionNumber(fields[8]) in lstSet:
                 output = True
-                print('###')
-                print(line.strip())
+                sys.stdout.write('###\n')
+                sys.stdout.write(line.strip() + '\n')
         elif output == True:
-            print(line.strip())
+            sys.stdout.write(line.strip() + '\n')
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+
+class IntervalIndex:
+    """A class to represent intervals on sequences (e.g. scaffolds)
+    indexed so that the intervals overlapping a query interval can be
+    found without looking at every interval on the sequence. Intervals
+    have closed, 1-based coordinates as in GFF3.
+
+    The intervals on each sequence are put in a nested containment
+    list the first time the sequence is queried: intervals are sorted
+    by start and longest first, and each interval contained in another
+    is put in the sublist of the one containing it. The intervals in a
+    list then have increasing starts and ends, so a query finds the
+    first one reaching the start of the query and the last one starting
+    before its end with bisect, searching the sublists of those it
+    finds the same way. A long interval, such as a whole chromosome,
+    therefore does not slow down queries elsewhere.
+
+    Methods:
+    ------------
+    add()           Adds an interval with a value
+    overlapping()   Returns the intervals overlapping a query interval
+    """
+    def __init__(self):
+        # {seqid:[(start, end, value), ...]}
+        self.intervals = {}
+        # {seqid:top-level sublist} for sequences already indexed. A
+        # sublist is a tuple of lists (starts, ends, intervals,
+        # children) of its intervals, where children holds the sublist
+        # of the intervals each one contains, or None
+        self.indexed = {}
+
+    def __contains__(self, seqid):
+        return seqid in self.intervals
+
+    def add(self, seqid, start, end, value=None):
+        """Adds the interval start-end on seqid with value."""
+        if seqid in self.intervals:
+            self.intervals[seqid].append((start, end, value))
+            self.indexed.pop(seqid, None)
+        else:
+            self.intervals[seqid] = [(start, end, value)]
+
+    def index(self, seqid):
+        """Builds and returns the nested containment list of the
+        intervals on seqid.
+        """
+        top = ([], [], [], [])
+        # (end, sublist, position in sublist) of the intervals
+        # containing the current interval, innermost last
+        containing = []
+        for interval in sorted(self.intervals[seqid],
+                               key=lambda interval:(interval[0],
+                                                    -interval[1])):
+            start, end = interval[0], interval[1]
+            while containing and containing[-1][0] < end:
+                containing.pop()
+            if containing:
+                parentEnd, parentList, k = containing[-1]
+                sublist = parentList[3][k]
+                if sublist == None:
+                    sublist = parentList[3][k] = ([], [], [], [])
+            else:
+                sublist = top
+            starts, ends, members, children = sublist
+            starts.append(start)
+            ends.append(end)
+            members.append(interval)
+            children.append(None)
+            containing.append((end, sublist, len(members) - 1))
+        self.indexed[seqid] = top
+        return top
+
+    def overlapping(self, seqid, start, end):
+        """Returns a list of (start, end, value) for the intervals on
+        seqid that overlap start-end, sorted by start.
+        """
+        if seqid not in self.intervals:
+            return []
+        if seqid in self.indexed:
+            top = self.indexed[seqid]
+        else:
+            top = self.index(seqid)
+        starts, ends, members, children = top
+        first = bisect_left(ends, start)
+        last = bisect_right(starts, end, first)
+        found = members[first:last]
+        toSearch = list(filter(None, children[first:last]))
+        if toSearch == []:
+            return found
+        # search the sublists of the intervals found, which hold the
+        # intervals they contain
+        while toSearch:
+            starts, ends, members, children = toSearch.pop()
+            first = bisect_left(ends, start)
+            last = bisect_right(starts, end, first)
+            if first < last:
+                found.extend(members[first:last])
+                toSearch.extend(filter(None, children[first:last]))
+        found.sort(key=itemgetter(0, 1))
+        return found
+
+
+def coveredLength(intervals, start, end):
+    """Returns the number of positions in start-end covered by any of
+    intervals, a list of (start, end, ...) sorted by start.
+    """
+    covered = 0
+    # the last position counted so far
+    lastEnd = start - 1
+    for interval in intervals:
+        intervalStart = max(interval[0], lastEnd + 1)
+        intervalEnd = min(interval[1], end)
+        if intervalEnd >= intervalStart:
+            covered += intervalEnd - intervalStart + 1
+            lastEnd = intervalEnd
+    return covered
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+from multiprocessing import Pool
+
+
+def help():
+    print('''
+    Usage:
+    ------------
+    renameSeqids.py -map <path> [options] <file> [<file> ...]
+
+    Description:
+    ------------
+    Renames sequence ids (e.g. scaffold names) in any number of GFF3,
+    FASTA, BED, VCF, and Circos track files per the two-column
+    tab-delimited mapping file given by -map, where the first column
+    contains the old name and the second column contains the new name.
+    The map is read once and the files are rewritten in parallel. Each
+    renamed file is written to the -outDir directory with the same
+    file name. Only the sequence ids are changed:
+
+        GFF3    the first column of feature lines, ##sequence-region
+                lines, and the headers of a ##FASTA section
+        FASTA   the first word of each header line
+        BED     the first column, except track and browser lines
+        VCF     the CHROM column and the ID of ##contig lines
+        track   the first column of a Circos track file
+
+    The format of each file is determined by its extension (.gff,
+    .gff3, .gtf, .fa, .fasta, .fna, .fas, .faa, .bed, .vcf) or if the
+    extension is not known by looking at the first lines of the file.
+    Names not in the map are left unchanged and reported on stderr.
+
+    Options:
+    ------------
+    -outDir  <path>     Directory to write renamed files to. Default
+                        renamed. Must not be the directory of an input
+                        file.
+
+    -threads <int>      Number of files to rename at once. Default 1.
+
+    -format  <str>      Treat all files as this format (gff, fasta, bed,
+                        vcf, or track) instead of detecting it.
+    ''', file=sys.stderr)
+    sys.exit(0)
+
+
+# formats of files with these extensions
+EXTENSION_FORMATS = {'.gff':'gff', '.gff3':'gff', '.gtf':'gff',
+                     '.fa':'fasta', '.fasta':'fasta', '.fna':'fasta',
+                     '.fas':'fasta', '.faa':'fasta', '.bed':'bed',
+                     '.vcf':'vcf'}
+# the ID of a VCF ##contig line
+CONTIG_ID = re.compile('(##contig=<(?:.*,)?ID=)([^,>]*)')
+# the number of bytes of lines read and written at a time
+CHUNK_BYTES = 1024 * 1024
+
+
+def readMap(mapFilepath):
+    """Reads a two-column tab-delimited file into a dictionary
+    {old name:new name}.
+    """
+    nameMap = {}
+    with open(mapFilepath) as mapFl:
+        for line in mapFl:
+            if line.strip() == '':
+                continue
+            old, new = line.strip().split('\t')
+            nameMap[old] = new
+    return nameMap
+
+def sniffFormat(filepath):
+    """Returns the format of a file from its first non-empty lines, or
+    None if it cannot be recognized.
+    """
+    with open(filepath) as fl:
+        for line in fl:
+            if line.strip() == '':
+                continue
+            if line.startswith('>'):
+                return 'fasta'
+            if line.startswith('##gff-version'):
+                return 'gff'
+            if line.startswith('##fileformat=VCF'):
+                return 'vcf'
+            if (line.startswith('#')
+             or line.startswith('track')
+             or line.startswith('browser')):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if (len(fields) >= 9 and fields[3].isdigit()
+                                 and fields[4].isdigit()):
+                return 'gff'
+            if (len(fields) >= 3 and fields[1].isdigit()
+                                 and fields[2].isdigit()):
+                return 'bed'
+            fields = line.split()
+            if (len(fields) >= 3 and fields[1].isdigit()
+                                 and fields[2].isdigit()):
+                return 'track'
+            return None
+    return None
+
+def detectFormat(filepath):
+    """Returns the format of a file from its extension or contents."""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in EXTENSION_FORMATS:
+        return EXTENSION_FORMATS[extension]
+    return sniffFormat(filepath)
+
+
+class Renamer:
+    """A class to rename the sequence ids in lines of one format
+    and keep track of the names not in the map.
+
+    Attributes:
+    ------------
+    nameMap     dictionary {old name:new name}
+    unknown     set of names not in nameMap
+    fasta       True after a ##FASTA line in a GFF3
+
+    Methods:
+    ------------
+    rename()    Returns a line with the sequence id renamed
+    """
+    def __init__(self, nameMap, fmt):
+        self.nameMap = nameMap
+        self.unknown = set()
+        self.fasta = False
+        self.rename = {'gff':self.renameGFF, 'fasta':self.renameFasta,
+                       'bed':self.renameBed, 'vcf':self.renameVCF,
+                       'track':self.renameTrack}[fmt]
+
+    def newName(self, name):
+        """Returns the new name for name, or name if it is not in the
+        map.
+        """
+        if name in self.nameMap:
+            return self.nameMap[name]
+        self.unknown.add(name)
+        return name
+
+    def renameFirstField(self, line, separator='\t'):
+        """Returns line with the text before the first separator
+        renamed.
+        """
+        name, sep, rest = line.partition(separator)
+        if sep == '':
+            return self.newName(name.rstrip('\n')) + '\n'
+        return self.newName(name) + sep + rest
+
+    def renameFasta(self, line):
+        if line.startswith('>'):
+            header = line[1:].rstrip('\n')
+            name, sep, description = header.partition(' ')
+            return '>' + self.newName(name) + sep + description + '\n'
+        return line
+
+    def renameGFF(self, line):
+        if self.fasta:
+            return self.renameFasta(line)
+        if line.startswith('#'):
+            if line.startswith('##sequence-region'):
+                contents = line.split()
+                contents[1] = self.newName(contents[1])
+                return ' '.join(contents) + '\n'
+            if line.startswith('##FASTA'):
+                self.fasta = True
+            return line
+        if line.strip() == '':
+            return line
+        return self.renameFirstField(line)
+
+    def renameBed(self, line):
+        if (line.startswith('#')
+         or line.startswith('track')
+         or line.startswith('browser')
+         or line.strip() == ''):
+            return line
+        return self.renameFirstField(line)
+
+    def renameVCF(self, line):
+        if line.startswith('#'):
+            match = CONTIG_ID.match(line)
+            if match:
+                return (match.group(1) + self.newName(match.group(2))
+                                                    + line[match.end():])
+            return line
+        return self.renameFirstField(line)
+
+    def renameTrack(self, line):
+        if line.startswith('#') or line.strip() == '':
+            return line
+        # keep the whitespace that separates the first field
+        match = re.match('(\\S+)(.*)', line, re.DOTALL)
+        return self.newName(match.group(1)) + match.group(2)
+
+
+def initWorker(workerNameMap):
+    """Sets the name map in each worker process once."""
+    global nameMap
+    nameMap = workerNameMap
+
+def renameFile(job):
+    """Writes a renamed copy of a file. job is a tuple (input path,
+    output path, format). Lines are read, renamed, and written in
+    chunks. Returns (input path, format, sorted list of unknown names).
+    """
+    inPath, outPath, fmt = job
+    renamer = Renamer(nameMap, fmt)
+    rename = renamer.rename
+    with open(inPath) as inFl, open(outPath, 'w',
+                                    buffering=CHUNK_BYTES) as outFl:
+        while True:
+            lines = inFl.readlines(CHUNK_BYTES)
+            if lines == []:
+                break
+            outFl.writelines([rename(line) for line in lines])
+    return (inPath, fmt, sorted(renamer.unknown))
+
+
+if __name__ == '__main__':
+    args = sys.argv
+    # output help information if missing command line arguments
+    if '-h' in args or '-map' not in args:
+        help()
+    # read command line arguments. the files are the arguments that
+    # are neither options nor option values
+    optionsWithValues = ('-map', '-outDir', '-threads', '-format')
+    inPaths = [arg for i, arg in enumerate(args[1:], 1)
+                   if arg not in optionsWithValues
+                   and args[i - 1] not in optionsWithValues]
+    if inPaths == []:
+        help()
+    if '-outDir' in args:
+        outDir = args[args.index('-outDir') + 1]
+    else:
+        outDir = 'renamed'
+    if '-threads' in args:
+        threads = int(args[args.index('-threads') + 1])
+    else:
+        threads = 1
+    os.makedirs(outDir, exist_ok=True)
+    # determine the format of each file and refuse to overwrite inputs
+    jobs = []
+    for inPath in inPaths:
+        if os.path.realpath(os.path.dirname(inPath) or '.') == \
+           os.path.realpath(outDir):
+            print('-outDir is the directory of {0}. Choose another '
+                  '-outDir.'.format(inPath), file=sys.stderr)
+            sys.exit(1)
+        if '-format' in args:
+            fmt = args[args.index('-format') + 1]
+        else:
+            fmt = detectFormat(inPath)
+        if fmt not in ('gff', 'fasta', 'bed', 'vcf', 'track'):
+            print('Cannot determine format of {0}. Use -format.'.format(
+                                                     inPath), file=sys.stderr)
+            sys.exit(1)
+        outPath = os.path.join(outDir, os.path.basename(inPath))
+        if outPath in [job[1] for job in jobs]:
+            print('More than one input file is named {0}'.format(
+                            os.path.basename(inPath)), file=sys.stderr)
+            sys.exit(1)
+        jobs.append((inPath, outPath, fmt))
+    # rename the files, largest first so the pool finishes together
+    jobs.sort(key=lambda job:os.path.getsize(job[0]), reverse=True)
+    nameMap = readMap(args[args.index('-map') + 1])
+    if threads > 1:
+        with Pool(threads, initializer=initWorker,
+                  initargs=(nameMap,)) as pool:
+            results = list(pool.imap_unordered(renameFile, jobs))
+    else:
+        results = [renameFile(job) for job in jobs]
+    # report names not in the map
+    for inPath, fmt, unknown in results:
+        for name in unknown:
+            print('WARNING: Name not found in mapping file\t{0}\t{1}'.format(
+                                               inPath, name), file=sys.stderr)
@@ -1,79 +1,107 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import re
+from functools import lru_cache
 
 
 def help():
     print('''
+    Usage:
+    ------------
+    repeatMaskerGFFsubset.py [-prefix <str>] [-outDir <path>] < input.gff
+
+    Description:
+    ------------
     Takes RepeatMasker-generated GFF3 on stdin and writes lines from the
     GFF3 file for each of the following categories: copia, gypsy,
-    otherltr, nonltr, mudr, hat, and otherdna.
+    otherltr, nonltr, mudr, hat, and otherdna. Each line is written to
+    the first category in that order (otherltr before mudr, hat,
+    otherdna, and nonltr) with a keyword anywhere in the line, and
+    lines without a keyword are not written. Lines are appended to
+    <outDir>/<prefix><category>.gff, which is created when the first
+    line of a category is found.
+
+    Options:
+    ------------
+    -prefix <str>   Text to put before the name of each output file.
+                    Default none.
+
+    -outDir <path>  Directory to write the output files to, created if
+                    needed. Default the current directory.
 ''', file = sys.stderr)
     exit(0)
 
 
+# categories in order of priority and the keywords of each. keywords
+# match regardless of case except those in (?-i:...)
+CATEGORIES = (('copia', 'copia|shacop'),
+              ('gypsy', 'gypsy|ogre'),
+              ('otherltr', 'dirs|erv|bel|ltr|tto1|tnt1|tlc1|tcn1|'
+                           '(?-i:gag|zf-CCHC|DUF4219|RVT|Asp_protease|RVP)'),
+              ('mudr', 'mudr'),
+              ('hat', 'hat'),
+              ('otherdna', 'helitron|dna|mariner|tc1|harb|enspm|cacta|'
+                           'penelope|polinton|maverick|piggybac|dada'),
+              ('nonltr', 'sine|jock|cr1|crack|daphne|line|l1|tx1|rep|rtex|'
+                         'rte'))
+CATEGORY_NAMES = [name for name, keywords in CATEGORIES] + [None]
+# every keyword of every category, found at each position in a string
+# with a lookahead so no keyword hides another one
+KEYWORDS = re.compile('(?=' + '|'.join('(?P<{0}>{1})'.format(name, keywords)
+                                       for name, keywords in CATEGORIES)
+                      + ')', re.IGNORECASE)
+PRIORITY = {name:i for i, name in enumerate(CATEGORY_NAMES)}
+
+
+@lru_cache(maxsize=65536)
+def tokenPriority(token):
+    """Returns the index in CATEGORIES of the first category with a
+    keyword in token, or len(CATEGORIES) if there is none.
+    """
+    best = len(CATEGORIES)
+    for match in KEYWORDS.finditer(token):
+        best = min(best, PRIORITY[match.lastgroup])
+    return best
+
+def classify(line):
+    """Returns the first category with a keyword in line, or None.
+    Keywords do not contain whitespace, so this is the first category
+    of any of the whitespace-separated words of the line, which are
+    each classified once. Numbers can not contain a keyword.
+    """
+    best = len(CATEGORIES)
+    for token in line.split():
+        if token.isdigit():
+            continue
+        priority = tokenPriority(token)
+        if priority < best:
+            best = priority
+            if best == 0:
+                break
+    return CATEGORY_NAMES[best]
+
+
 if '-h' in sys.argv or '-help' in sys.argv:
     help()
-for line in sys.stdin:
-    if line.startswith('#'):
-        continue
-    lowercase_name = line.lower()
-    if ('copia' in lowercase_name 
-      or 'shacop' in lowercase_name):
-        with open('copia.gff', 'a') as out:
-            out.write(line)
-    elif ('gypsy' in lowercase_name 
-      or 'ogre' in lowercase_name):
-        with open('gypsy.gff', 'a') as out:
-            out.write(line)
-    elif ('dirs' in lowercase_name
-      or 'erv' in lowercase_name
-      or 'bel' in lowercase_name
-      or 'ltr' in lowercase_name 
-      or 'tto1' in lowercase_name 
-      or 'tnt1' in lowercase_name 
-      or 'tlc1' in lowercase_name 
-      or 'tcn1' in lowercase_name 
-      or 'gag' in line 
-      or 'zf-CCHC' in line 
-      or 'DUF4219' in line 
-      or 'RVT' in line 
-      or 'Asp_protease' in line 
-      or 'RVP' in line):
-        with open('otherltr.gff', 'a') as out:
-            out.write(line)
-    elif 'mudr' in lowercase_name:
-        with open('mudr.gff', 'a') as out:
-            out.write(line)
-    elif 'hat' in lowercase_name:
-        with open('hat.gff', 'a') as out:
-            out.write(line)
-    elif ('helitron' in lowercase_name 
-      or 'dna' in lowercase_name 
-      or re.search('dna\d', lowercase_name)
-      or 'mariner' in lowercase_name 
-      or 'tc1' in lowercase_name
-      or 'harb' in lowercase_name 
-      or 'enspm' in lowercase_name 
-      or 'cacta' in lowercase_name
-      or 'penelope' in lowercase_name 
-      or 'polinton' in lowercase_name 
-      or 'maverick' in lowercase_name 
-      or 'piggybac' in lowercase_name 
-      or 'dada' in lowercase_name):
-        with open('otherdna.gff', 'a') as out:
-            out.write(line)
-    elif ('sine' in lowercase_name
-      or 'jock' in lowercase_name 
-      or 'cr1' in lowercase_name 
-      or 'crack' in lowercase_name 
-      or 'daphne' in lowercase_name 
-      or 'line' in lowercase_name
-      or 'l1' in lowercase_name 
-      or 'tx1' in lowercase_name 
-      or 'rep' in lowercase_name
-      or 'rtex' in lowercase_name
-      or 'rte' in lowercase_name):
-        with open('nonltr.gff', 'a') as out:
-            out.write(line)
+args = sys.argv
+prefix = args[args.index('-prefix') + 1] if '-prefix' in args else ''
+outDir = args[args.index('-outDir') + 1] if '-outDir' in args else '.'
+os.makedirs(outDir, exist_ok=True)
+# an output file for each category, opened when first written to
+outFls = {}
+try:
+    for line in sys.stdin:
+        if line.startswith('#'):
+            continue
+        category = classify(line)
+        if category == None:
+            continue
+        if category not in outFls:
+            outFls[category] = open(os.path.join(outDir, '{0}{1}.gff'.format(
+                                prefix, category)), 'a', buffering=1024*1024)
+        outFls[category].write(line)
+finally:
+    for outFl in outFls.values():
+        outFl.close()
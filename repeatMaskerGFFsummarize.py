@@ -2,6 +2,7 @@
 
 import sys
 import re
+from functools import lru_cache
 
 
 def help():
@@ -64,6 +65,145 @@ def help():
     sys.exit(0)
 
 
+# rules to assign a category to a feature from its name and Repbase
+# description, in order of priority. each rule has regex patterns of
+# keywords to search for in the name or description as they are (Name,
+# Description) or in lowercase (name, description). the rules used
+# when -db was used and the name is in the Repbase DB:
+DB_RULES = (
+    ('Simple', {'Name':'\\([ATCG]+\\)n|^Simple$'}),
+    ('Unspecified', {'Name':'^Unspecified$'}),
+    ('Copia', {'name':'copia|shacop', 'description':'copia'}),
+    ('Gypsy', {'name':'gypsy|ogre', 'description':'gypsy|ogre'}),
+    ('Helitron', {'name':'helitron', 'description':'helitron'}),
+    ('Mariner', {'name':'mariner|tc1', 'description':'mariner'}),
+    ('MuDR', {'name':'mudr', 'description':'mudr|mutator'}),
+    ('Harbinger', {'name':'harb', 'description':'harbinger'}),
+    ('tRNA', {'name':'trna'}),
+    ('rRNA', {'name':'rrna', 'description':'rrna'}),
+    ('snRNA', {'name':'snrna', 'description':'snrna'}),
+    ('Other_SINE', {'name':'sine'}),
+    ('EnSpm/CACTA', {'name':'enspm|cacta', 'description':'cacta|enspm'}),
+    ('Caulimovirus', {'description':'caulimovir'}),
+    ('Microsatellite', {'name':'minisat', 'description':'microsatellite'}),
+    ('hAT', {'name':'hat', 'Description':'hAT'}),
+    ('Novosib', {'description':'novosib'}),
+    ('Penelope', {'name':'penelope', 'description':'penelope'}),
+    ('Polinton', {'name':'polinton|maverick',
+                  'description':'polinton|maverick'}),
+    ('PiggyBac', {'name':'piggybac', 'description':'piggybac'}),
+    ('RTEX', {'name':'rtex', 'Description':'RTEX'}),
+    ('RTE', {'name':'rte', 'Description':'RTE'}),
+    ('Jockey', {'name':'jock|cr1|crack|daphne',
+                'description':'jock|crack|daphne|cr1'}),
+    ('Other_LINE', {'name':'line'}),
+    ('DIRS', {'name':'dirs'}),
+    ('DADA', {'name':'dada', 'description':'dada'}),
+    ('BEL', {'name':'bel'}),
+    ('L1', {'name':'l1|tx1', 'Description':'L1|tx1'}),
+    ('L2', {'name':'l2', 'Description':'L2'}),
+    ('ERV', {'name':'erv'}),
+    ('REP', {'name':'rep'}),
+    ('SOLA', {'name':'sola', 'Description':'sola'}),
+    ('Satellite', {'name':'sat', 'description':'satellite'}),
+    ('Other_non-LTR_retrotransposon',
+                        {'description':'non-ltr retrotransposon'}),
+    ('Other_DNA_transposon', {'name':'dna', 'description':'dna transpos'}),
+    ('Other_LTR_retrotransposon', {'name':'ltr|tto1|tnt1|tlc1|tcn1',
+                                   'description':'ltr retrotranspos'}),
+    ('Unspecified', {'name':'unspecified'}))
+# the rules used otherwise. the Other_LTR_retrotransposon rule also
+# applies if the whole GFF3 line has an LTR retrotransposon domain
+NO_DB_RULES = (
+    ('Simple', {'Name':'\\([ATCG]+\\)n|^Simple$'}),
+    ('Unspecified', {'Name':'^Unspecified$'}),
+    ('Copia', {'name':'copia|shacop'}),
+    ('Gypsy', {'name':'gypsy|ogre'}),
+    ('hAT', {'name':'hat'}),
+    ('Helitron', {'name':'helitron'}),
+    ('Mariner', {'name':'mariner|tc1'}),
+    ('MuDR', {'name':'mudr'}),
+    ('Harbinger', {'name':'harb'}),
+    ('Penelope', {'name':'penelope'}),
+    ('Polinton', {'name':'polinton'}),
+    ('PiggyBac', {'name':'piggybac'}),
+    ('tRNA', {'name':'trna'}),
+    ('rRNA', {'name':'rrna'}),
+    ('DADA', {'name':'dada'}),
+    ('Other_SINE', {'name':'sine'}),
+    ('EnSpm/CACTA', {'name':'enspm|cacta'}),
+    ('RTEX', {'name':'rtex'}),
+    ('RTE', {'name':'rte'}),
+    ('Jockey', {'name':'jock|cr1|crack|daphne'}),
+    ('Other_LINE', {'name':'line'}),
+    ('DIRS', {'name':'dirs'}),
+    ('BEL', {'name':'bel'}),
+    ('Other_LTR_retrotransposon', {'name':'ltr|tto1|tnt1|tlc1|tcn1'}),
+    ('L1', {'name':'l1|tx1'}),
+    ('L2', {'name':'l2'}),
+    ('ERV', {'name':'erv'}),
+    ('REP', {'name':'rep'}),
+    ('SOLA', {'name':'sola'}),
+    ('Satellite', {'name':'sat'}),
+    ('Microsatellite', {'name':'minisat'}),
+    ('Other_DNA_transposon', {'name':'dna'}),
+    ('Unspecified', {'name':'unspecified'}))
+# LTR retrotransposon domains in a GFF3 line and the rule they select
+LTR_DOMAIN = re.compile('gag|zf-CCHC|DUF4219|RVT|Asp_protease|RVP')
+LTR_DOMAIN_RULE = [short_name for short_name, keywords in
+                   NO_DB_RULES].index('Other_LTR_retrotransposon')
+
+
+def compile_rules(rules):
+    """Returns a dictionary {text:regex} with a regex for each of Name,
+    name, Description, and description used in rules that finds the
+    keywords of all the rules at each position of a string. The group
+    r<i> is named for the index i of the rule of each keyword, and a
+    lookahead is used so no keyword hides another one.
+    """
+    patterns = {}
+    for text in ('Name', 'name', 'Description', 'description'):
+        groups = ['(?P<r{0}>{1})'.format(i, keywords[text]) for
+                  i, (short_name, keywords) in enumerate(rules)
+                  if text in keywords]
+        if groups:
+            patterns[text] = re.compile('(?=' + '|'.join(groups) + ')')
+    return patterns
+
+DB_PATTERNS = compile_rules(DB_RULES)
+NO_DB_PATTERNS = compile_rules(NO_DB_RULES)
+
+
+@lru_cache(maxsize=65536)
+def classify(name, description):
+    """Returns ((short name, supershort name), result if the line has an
+    LTR retrotransposon domain or None if that does not change the
+    result) for a feature name and its Repbase description, or None as
+    the description if -db was not used or the name is not in the
+    Repbase DB. The first rule with a keyword anywhere in the texts is
+    used, or the name itself and Other if there is none.
+    """
+    if description == None:
+        rules, patterns = NO_DB_RULES, NO_DB_PATTERNS
+        texts = {'Name':name, 'name':name.lower()}
+    else:
+        rules, patterns = DB_RULES, DB_PATTERNS
+        texts = {'Name':name, 'name':name.lower(),
+                 'Description':description,
+                 'description':description.lower()}
+    best = len(rules)
+    for text, pattern in patterns.items():
+        for match in pattern.finditer(texts[text]):
+            best = min(best, int(match.lastgroup[1:]))
+    if best == len(rules):
+        result = (name, 'Other')
+    else:
+        result = (rules[best][0], rules[best][0])
+    if description == None and LTR_DOMAIN_RULE < best:
+        return (result, (rules[LTR_DOMAIN_RULE][0],) * 2)
+    return (result, None)
+
+
 # output help if missing command line arguments or -h is present
 if len(sys.argv) < 2 or '-h' in sys.argv:
     help()
@@ -71,8 +211,6 @@ if len(sys.argv) < 2 or '-h' in sys.argv:
 target_re_pattern = re.compile('Target "Motif:(.+)"')
 # matches repeatmasker- and repeatrunner-derived features
 target_re_pattern_repeatmasker = re.compile('Target=(.+?)\s')
-# for matching "simple" repeats in repeatmasker results
-name_simple_pattern = re.compile('\([ATCG]+\)n')
 # for parsing repeatmasker results from a MAKER-derived gff
 target_re_pattern_makerlines = re.compile('Name=species:(.+?)\|genus')
 # dictionaries to contain summary results
@@ -96,6 +234,7 @@ if '-db' in sys.argv:
                 repbase_db[name] += line.strip().lstrip('KW ')
 # regex pattern to match an unknown format in MAKER-derived gff
 bestblasthit_pat = re.compile('bestblasthit_(.+)\.aln_len')
+bed_input = '-bed' in sys.argv
 # read input gff and assign each feature to a category in the full,
 # short, and supershort dictionaries
 with open(input_file_name) as in_fl:
@@ -104,7 +243,7 @@ with open(input_file_name) as in_fl:
         if not line.startswith('#'):
             fields = line.split('\t')
             # input is in BED format
-            if '-bed' in sys.argv:
+            if bed_input:
                 start = int(fields[1])
                 end = int(fields[2])
                 length = end - start
@@ -114,22 +253,19 @@ with open(input_file_name) as in_fl:
                 # line is MAKER-derived
                 if fields[7] == 'match':
                     if 'bestblast' in fields[9]:
-                        name = re.search(bestblasthit_pat, fields[9]).group(1)
+                        name = bestblasthit_pat.search(fields[9]).group(1)
                     elif 'genus:Simple' in fields[9]:
                         name = 'Simple'
                     else:
                         try:
-                            name = re.search(target_re_pattern, 
-                                             fields[9]).group(1)
+                            name = target_re_pattern.search(fields[9]).group(1)
                         # previous regex search failed to match anything
                         except AttributeError:
-                            name = re.search(target_re_pattern_repeatmasker, 
-                                             fields[9]).group(1)
-                    supershort_name = None
+                            name = target_re_pattern_repeatmasker.search(
+                                                         fields[9]).group(1)
                 # repeatmasker lines
                 else:
-                    name = re.search(target_re_pattern, fields[9]).group(1)
-                    supershort_name = None
+                    name = target_re_pattern.search(fields[9]).group(1)
             # input is in gff3 format
             else:
                 start = int(fields[3])
@@ -138,244 +274,31 @@ with open(input_file_name) as in_fl:
                 if 'Simple_repeat' in fields[8]:
                     name = 'Simple'
                 elif 'bestblast' in fields[8]:
-                    name = re.search(bestblasthit_pat, fields[8]).group(1)
+                    name = bestblasthit_pat.search(fields[8]).group(1)
                 elif '|genus:Unspecified;' in fields[8]:
                     name = 'Unspecified'
                 else:
                     # attempt a series of searches with regex patterns
                     try:
-                        name = re.search(target_re_pattern, fields[8]).group(1)
+                        name = target_re_pattern.search(fields[8]).group(1)
                     except AttributeError:
                         try:
-                            name = re.search(target_re_pattern_makerlines, 
-                                             fields[8]).group(1)
+                            name = target_re_pattern_makerlines.search(
+                                                         fields[8]).group(1)
                         except AttributeError:
                             try:
-                                name = re.search(target_re_pattern_repeatmasker, 
-                                                 fields[8]).group(1)
+                                name = target_re_pattern_repeatmasker.search(
+                                                         fields[8]).group(1)
                             except AttributeError:
-                                name = re.search(bestblasthit_pat, 
-                                                 fields[8]).group(1)
-                supershort_name = None
+                                name = bestblasthit_pat.search(
+                                                         fields[8]).group(1)
             # assign categories for the short and supershort tables
-            try:
-                # -db was used
-                repbase_db[name]
-                lowercase_name = name.lower()
-                repbase_db_entry_lowercase = repbase_db[name].lower()
-                if re.search(name_simple_pattern, name):
-                    short_name = 'Simple'
-                elif name == 'Simple':
-                    short_name = 'Simple'
-                elif name == 'Unspecified':
-                    short_name = 'Unspecified'
-                elif ('copia' in lowercase_name 
-                        or 'copia' in repbase_db_entry_lowercase 
-                        or 'shacop' in lowercase_name):
-                    short_name = 'Copia'
-                elif ('gypsy' in lowercase_name 
-                        or 'gypsy' in repbase_db_entry_lowercase 
-                        or 'ogre' in lowercase_name 
-                        or 'ogre' in repbase_db_entry_lowercase):
-                    short_name = 'Gypsy'
-                elif ('helitron' in lowercase_name 
-                        or 'helitron' in repbase_db_entry_lowercase):
-                    short_name = 'Helitron'
-                elif ('mariner' in lowercase_name 
-                        or 'mariner' in repbase_db_entry_lowercase 
-                        or 'tc1' in lowercase_name):
-                    short_name = 'Mariner'
-                elif ('mudr' in lowercase_name 
-                        or 'mudr' in repbase_db_entry_lowercase 
-                        or 'mutator' in repbase_db_entry_lowercase):
-                    short_name = 'MuDR'
-                elif ('harb' in lowercase_name 
-                        or 'harbinger' in repbase_db_entry_lowercase):
-                    short_name = 'Harbinger'
-                elif 'trna' in lowercase_name:
-                    short_name = 'tRNA'
-                elif ('rrna' in lowercase_name 
-                        or 'rrna' in repbase_db_entry_lowercase):
-                    short_name = 'rRNA'
-                elif ('snrna' in lowercase_name 
-                        or 'snrna' in repbase_db_entry_lowercase):
-                    short_name = 'snRNA'
-                elif 'sine' in lowercase_name:
-                    short_name = 'Other_SINE'
-                elif ('cacta' in repbase_db_entry_lowercase 
-                        or 'enspm' in lowercase_name 
-                        or 'enspm' in repbase_db_entry_lowercase 
-                        or 'cacta' in lowercase_name):
-                    short_name = 'EnSpm/CACTA'
-                elif 'caulimovir' in repbase_db_entry_lowercase:
-                    short_name = 'Caulimovirus'
-                elif ('microsatellite' in repbase_db_entry_lowercase 
-                        or 'minisat' in lowercase_name):
-                    short_name = 'Microsatellite'
-                elif 'hat' in lowercase_name or 'hAT' in repbase_db[name]:
-                    short_name = 'hAT'
-                elif 'novosib' in repbase_db_entry_lowercase:
-                    short_name = 'Novosib'
-                elif ('penelope' in lowercase_name 
-                        or 'penelope' in repbase_db_entry_lowercase):
-                    short_name = 'Penelope'
-                elif ('polinton' in lowercase_name 
-                        or 'polinton' in repbase_db_entry_lowercase):
-                    short_name = 'Polinton'
-                elif ('maverick' in lowercase_name 
-                        or 'maverick' in repbase_db_entry_lowercase):
-                    short_name = 'Polinton'
-                elif ('piggybac' in lowercase_name 
-                        or 'piggybac' in repbase_db_entry_lowercase):
-                    short_name = 'PiggyBac'
-                elif ('RTEX' in repbase_db[name] or 'rtex' in lowercase_name:
-                    short_name = 'RTEX'
-                elif 'RTE' in repbase_db[name] or 'rte' in lowercase_name:
-                    short_name = 'RTE'
-                elif ('jock' in lowercase_name 
-                        or 'cr1' in lowercase_name 
-                        or 'crack' in lowercase_name 
-                        or 'daphne' in lowercase_name 
-                        or 'jock' in repbase_db_entry_lowercase 
-                        or 'crack' in repbase_db_entry_lowercase 
-                        or 'daphne' in repbase_db_entry_lowercase 
-                        or 'cr1' in repbase_db_entry_lowercase):
-                    short_name = 'Jockey'
-                elif 'line' in lowercase_name:
-                    short_name = 'Other_LINE'
-                elif 'dirs' in lowercase_name:
-                    short_name = 'DIRS'
-                elif ('dada' in lowercase_name 
-                        or 'dada' in repbase_db_entry_lowercase):
-                    short_name = 'DADA'
-                elif 'bel' in lowercase_name:
-                    short_name = 'BEL'
-                elif ('L1' in repbase_db[name] 
-                        or 'l1' in lowercase_name 
-                        or 'tx1' in lowercase_name 
-                        or 'tx1' in repbase_db[name]):
-                    short_name = 'L1'
-                elif 'L2' in repbase_db[name] or 'l2' in lowercase_name:
-                    short_name = 'L2'
-                elif 'erv' in lowercase_name:
-                    short_name = 'ERV'
-                elif 'rep' in lowercase_name:
-                    short_name = 'REP'
-                elif 'sola' in lowercase_name or 'sola' in repbase_db[name]:
-                    short_name = 'SOLA'
-                elif ('satellite' in repbase_db_entry_lowercase 
-                        or 'sat' in lowercase_name):
-                    short_name = 'Satellite'
-                elif 'non-ltr retrotransposon' in repbase_db_entry_lowercase:
-                    short_name = 'Other_non-LTR_retrotransposon'
-                elif ('dna transpos' in repbase_db_entry_lowercase 
-                        or 'dna' in lowercase_name 
-                        or re.search('dna\d', lowercase_name)):
-                    short_name = 'Other_DNA_transposon'
-                elif ('ltr retrotranspos' in repbase_db_entry_lowercase 
-                        or 'ltr' in lowercase_name 
-                        or 'tto1' in lowercase_name 
-                        or 'tnt1' in lowercase_name 
-                        or 'tlc1' in lowercase_name 
-                        or 'tcn1' in lowercase_name):
-                    short_name = 'Other_LTR_retrotransposon'
-                elif 'unspecified' in lowercase_name:
-                    short_name = 'Unspecified'
-                else:
-                    short_name = name
-                    supershort_name = 'Other'
-                if not supershort_name == 'Other':
-                    supershort_name = short_name
-            # runs if -db was not specified
-            except KeyError:
-                lowercase_name = name.lower()
-                if re.search(name_simple_pattern, name):
-                    short_name = 'Simple'
-                elif name == 'Simple':
-                    short_name = 'Simple'
-                elif name == 'Unspecified':
-                    short_name = 'Unspecified'
-                elif 'copia' in lowercase_name or 'shacop' in lowercase_name:
-                    short_name = 'Copia'
-                elif 'gypsy' in lowercase_name or 'ogre' in lowercase_name:
-                    short_name = 'Gypsy'
-                elif 'hat' in lowercase_name:
-                    short_name = 'hAT'
-                elif 'helitron' in lowercase_name:
-                    short_name = 'Helitron'
-                elif 'mariner' in lowercase_name or 'tc1' in lowercase_name:
-                    short_name = 'Mariner'
-                elif 'mudr' in lowercase_name:
-                    short_name = 'MuDR'
-                elif 'harb' in lowercase_name:
-                    short_name = 'Harbinger'
-                elif 'penelope' in lowercase_name:
-                    short_name = 'Penelope'
-                elif 'polinton' in lowercase_name:
-                    short_name = 'Polinton'
-                elif 'piggybac' in lowercase_name:
-                    short_name = 'PiggyBac'
-                elif 'trna' in lowercase_name:
-                    short_name = 'tRNA'
-                elif 'rrna' in lowercase_name:
-                    short_name = 'rRNA'
-                elif 'dada' in lowercase_name:
-                    short_name = 'DADA'
-                elif 'sine' in lowercase_name:
-                    short_name = 'Other_SINE'
-                elif 'enspm' in lowercase_name or 'cacta' in lowercase_name:
-                    short_name = 'EnSpm/CACTA'
-                elif 'rtex' in lowercase_name:
-                    short_name = 'RTEX'
-                elif 'rte' in lowercase_name:
-                    short_name = 'RTE'
-                elif ('jock' in lowercase_name 
-                        or 'cr1' in lowercase_name 
-                        or 'crack' in lowercase_name 
-                        or 'daphne' in lowercase_name):
-                    short_name = 'Jockey'
-                elif 'line' in lowercase_name:
-                    short_name = 'Other_LINE'
-                elif 'dirs' in lowercase_name:
-                    short_name = 'DIRS'
-                elif 'bel' in lowercase_name:
-                    short_name = 'BEL'
-                elif ('ltr' in lowercase_name 
-                        or 'tto1' in lowercase_name 
-                        or 'tnt1' in lowercase_name 
-                        or 'tlc1' in lowercase_name 
-                        or 'tcn1' in lowercase_name 
-                        or 'gag' in line 
-                        or 'zf-CCHC' in line 
-                        or 'DUF4219' in line 
-                        or 'RVT' in line 
-                        or 'Asp_protease' in line 
-                        or 'RVP' in line):
-                    short_name = 'Other_LTR_retrotransposon'
-                elif 'l1' in lowercase_name or 'tx1' in lowercase_name:
-                    short_name = 'L1'
-                elif 'l2' in lowercase_name:
-                    short_name = 'L2'
-                elif 'erv' in lowercase_name:
-                    short_name = 'ERV'
-                elif 'rep' in lowercase_name:
-                    short_name = 'REP'
-                elif 'sola' in lowercase_name:
-                    short_name = 'SOLA'
-                elif 'sat' in lowercase_name:
-                    short_name = 'Satellite'
-                elif 'minisat' in lowercase_name:
-                    short_name = 'Microsatellite'
-                elif ('dna' in lowercase_name 
-                        or re.search('dna\d', lowercase_name)):
-                    short_name = 'Other_DNA_transposon'
-                elif 'unspecified' in lowercase_name:
-                    short_name = 'Unspecified'
-                else:
-                    short_name = name
-                    supershort_name = 'Other'
-                if not supershort_name == 'Other':
-                    supershort_name = short_name
+            # using the Repbase description if -db was used and name
+            # is in it
+            (short_name, supershort_name), ltr_domain_result = \
+                                          classify(name, repbase_db.get(name))
+            if ltr_domain_result != None and LTR_DOMAIN.search(line):
+                short_name, supershort_name = ltr_domain_result
             # for full output
             if name in summary_dct_full:
                 summary_dct_full[name]['count'] += 1
@@ -0,0 +1,55 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+                                                                  __file__))))
+import LTRdigestLTRidentity
+from LTRdigestLTRidentity import alignPairs, batches, pairCells
+
+
+def job(number, length5, length3):
+    return ('LTR_retrotransposon{0}'.format(number), 'seq1',
+            (1, length5), (10001, 10000 + length3))
+
+def mutate(seq, rng):
+    bases = list(seq)
+    for i in range(len(bases) // 20):
+        bases[rng.randrange(len(bases))] = rng.choice('ACGT')
+    del bases[rng.randrange(len(bases))]
+    return ''.join(bases)
+
+
+class LTRIdentityTest(unittest.TestCase):
+
+    def test_batches_capped_by_cells(self):
+        # short pairs around one long pair
+        jobs = ([job(i, 300, 310) for i in range(50)] + [job(50, 20000, 19000)]
+                + [job(i, 300, 290) for i in range(51, 100)])
+        cells = LTRdigestLTRidentity.BATCH_CELLS
+        LTRdigestLTRidentity.BATCH_CELLS = 1000000
+        try:
+            found = list(batches(jobs, 20))
+        finally:
+            LTRdigestLTRidentity.BATCH_CELLS = cells
+        self.assertEqual([j for batch in found for j in batch], jobs)
+        for batch in found:
+            rows = max(pairCells(j, 20)[0] for j in batch)
+            width = max(pairCells(j, 20)[1] for j in batch)
+            self.assertTrue(len(batch) == 1
+                            or len(batch) * rows * width <= 1000000)
+        self.assertIn([jobs[50]], found)
+
+    def test_batch_results_match_single_pairs(self):
+        rng = random.Random(5)
+        pairs = []
+        for length in (120, 400, 80, 1500, 300):
+            seq = ''.join(rng.choice('ACGT') for i in range(length))
+            pairs.append((seq, mutate(seq, rng)))
+        self.assertEqual(alignPairs(pairs, 20),
+                         [alignPairs([pair], 20)[0] for pair in pairs])
+
+
+if __name__ == '__main__':
+    unittest.main()
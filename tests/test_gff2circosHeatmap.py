@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'gff2circosHeatmap.py')
+
+
+class GroupFilesTest(unittest.TestCase):
+
+    def run_groups(self, classes):
+        with tempfile.TemporaryDirectory() as tmp:
+            gff = os.path.join(tmp, 'in.gff')
+            lens = os.path.join(tmp, 'lens.txt')
+            with open(gff, 'w') as fl:
+                for i, cls in enumerate(classes):
+                    fl.write('c1\t.\trepeat\t{0}\t{1}\t.\t+\t.\t'
+                             'Class={2}\n'.format(i * 10 + 1, i * 10 + 5, cls))
+            with open(lens, 'w') as fl:
+                fl.write('c1\t100\n')
+            result = subprocess.run([sys.executable, SCRIPT, '-gff', gff,
+                                     '-scafLens', lens, '-window', '50',
+                                     '-groupBy', 'attr:Class', '-out',
+                                     os.path.join(tmp, 'out')],
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+            return result, sorted(name for name in os.listdir(tmp)
+                                  if name.startswith('out.'))
+
+    def test_group_files(self):
+        result, files = self.run_groups(['LTR/Gypsy', 'DNA'])
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(files, ['out.DNA.txt', 'out.LTR_Gypsy.txt'])
+
+    def test_groups_with_the_same_file_name(self):
+        result, files = self.run_groups(['LTR/Gypsy', 'LTR_Gypsy'])
+        self.assertEqual(result.returncode, 1)
+        self.assertEqual(result.stderr, 'Groups LTR/Gypsy and LTR_Gypsy '
+                         'would both be written to {0}\n'.format(
+                             result.args[-1] + '.LTR_Gypsy.txt'))
+        self.assertEqual(files, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
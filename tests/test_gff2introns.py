@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# genes with exons without a Parent. g3 shares its start with its first
+# exon, so gffSort.py puts that exon before it, and the exon on c3 is
+# not within a gene of its own seqid
+GFF = ('c1\t.\tgene\t1\t100\t.\t+\t.\tID=g1\n'
+       'c1\t.\tmRNA\t1\t100\t.\t+\t.\tID=t1;Parent=g1\n'
+       'c1\t.\texon\t1\t20\t.\t+\t.\tParent=t1\n'
+       'c1\t.\texon\t60\t100\t.\t+\t.\tParent=t1\n'
+       'c2\t.\tgene\t1\t8\t.\t+\t.\tID=g2\n'
+       'c2\t.\texon\t1\t8\t.\t+\t.\tID=e0\n'
+       'c2\t.\tgene\t10\t90\t.\t+\t.\tID=g3\n'
+       'c2\t.\texon\t10\t20\t.\t+\t.\tID=e1\n'
+       'c2\t.\texon\t50\t90\t.\t+\t.\tID=e2\n'
+       'c3\t.\texon\t5\t10\t.\t+\t.\tID=e3\n')
+
+
+def run(script, args, text):
+    return subprocess.run([sys.executable, os.path.join(ROOT, script)]
+                          + args, input=text, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, check=True,
+                          universal_newlines=True)
+
+
+class Gff2IntronsTest(unittest.TestCase):
+
+    def test_exons_without_parent_in_gffSort_order(self):
+        for sortArgs in ([], ['-hierarchy']):
+            sortedGff = run('gffSort.py', sortArgs, GFF).stdout
+            for args in ([], ['-unsorted'], ['-threads', '2']):
+                result = run('gff2introns.py', args, sortedGff)
+                self.assertEqual(result.stdout, 't1\t39\ng3\t29\n')
+                self.assertEqual(result.stderr, 't1\t2\ng2\t1\ng3\t2\n')
+
+    def test_intron_gff(self):
+        sortedGff = run('gffSort.py', [], GFF).stdout
+        self.assertEqual(run('gff2introns.py', ['-gff'], sortedGff).stdout,
+                         'c1\t.\tintron\t21\t59\t.\t+\t.\t'
+                         'ID=t1:intron_1;Parent=t1\n'
+                         'c2\t.\tintron\t21\t49\t.\t+\t.\t'
+                         'ID=g3:intron_1;Parent=g3\n')
+
+    def test_transcripts_without_parent_lines(self):
+        # exons of transcripts whose mRNA and gene lines are missing
+        gff = ('c1\t.\texon\t1\t10\t.\t+\t.\tParent=t1\n'
+               'c1\t.\texon\t15\t20\t.\t+\t.\tParent=t2\n'
+               'c1\t.\texon\t31\t40\t.\t+\t.\tParent=t1\n'
+               'c1\t.\texon\t51\t60\t.\t+\t.\tParent=t2\n'
+               'c2\t.\texon\t1\t10\t.\t+\t.\tParent=t3\n')
+        for args in ([], ['-unsorted']):
+            result = run('gff2introns.py', args, gff)
+            self.assertEqual(result.stdout, 't1\t20\nt2\t30\n')
+            self.assertEqual(result.stderr, 't1\t2\nt2\t2\nt3\t1\n')
+
+    def test_unavailable_splice_motifs(self):
+        # a GT-AG intron at 11-30 of s1, an intron running past the end
+        # of s1, and an intron on a seqid not in the FASTA
+        gff = ('s1\t.\tmRNA\t1\t40\t.\t+\t.\tID=t1\n'
+               's1\t.\texon\t1\t10\t.\t+\t.\tParent=t1\n'
+               's1\t.\texon\t31\t40\t.\t+\t.\tParent=t1\n'
+               's1\t.\tmRNA\t35\t80\t.\t+\t.\tID=t2\n'
+               's1\t.\texon\t35\t40\t.\t+\t.\tParent=t2\n'
+               's1\t.\texon\t70\t80\t.\t+\t.\tParent=t2\n'
+               's2\t.\tmRNA\t1\t40\t.\t+\t.\tID=t3\n'
+               's2\t.\texon\t1\t10\t.\t+\t.\tParent=t3\n'
+               's2\t.\texon\t31\t40\t.\t+\t.\tParent=t3\n')
+        with tempfile.TemporaryDirectory() as tmp:
+            fasta = os.path.join(tmp, 'genome.fa')
+            with open(fasta, 'w') as fl:
+                fl.write('>s1\n' + 'A' * 10 + 'GT' + 'C' * 16 + 'AG'
+                         + 'T' * 20 + '\n')
+            result = run('gff2introns.py', ['-fasta', fasta], gff)
+        self.assertEqual([line.rsplit('=', 1)[1] for line
+                          in result.stdout.splitlines()],
+                         ['GT-AG', 'NA', 'NA'])
+        self.assertEqual(result.stderr,
+                         '#splice_motif\tcount\tfraction\tclass\n'
+                         'NA\t2\tNA\tunavailable\n'
+                         'GT-AG\t1\t1.0000\tcanonical\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'gffFilter.py')
+
+GFF = ('c1\t.\tgene\t1\t100\t.\t+\t.\tID=g1\n'
+       'c1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m1;Parent=g1\n'
+       'c2\t.\tgene\t1\t500\t.\t-\t.\tID=g2\n')
+
+
+def run(args, text=GFF):
+    return subprocess.run([sys.executable, SCRIPT] + args, input=text,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+
+class GffFilterTest(unittest.TestCase):
+
+    def test_missing_operand_at_end(self):
+        for expr in ('type==gene &&', 'type==gene || !', 'type==gene && ('):
+            result = run(['-expr', expr])
+            self.assertEqual(result.returncode, 1)
+            self.assertEqual(result.stderr,
+                             'Missing operand at end of -expr\n')
+
+    def test_other_errors_at_end(self):
+        for expr, error in (('(type==gene', 'Missing ) at end of -expr'),
+                            ('type==', 'Missing value after == at end of '
+                                       '-expr'),
+                            ('type==gene)', 'Unexpected ) in -expr')):
+            result = run(['-expr', expr])
+            self.assertEqual(result.returncode, 1)
+            self.assertEqual(result.stderr, error + '\n')
+
+    def test_invalid_regular_expression(self):
+        result = run(['-expr', 'attr.ID~['])
+        self.assertEqual(result.returncode, 1)
+        self.assertTrue(result.stderr.startswith(
+                            'Invalid regular expression in -expr: ['))
+        self.assertEqual(len(result.stderr.splitlines()), 1)
+
+    def test_list_paths_with_quotes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ids = os.path.join(tmp, "it's.txt")
+            scafs = os.path.join(tmp, 'scaf "1".txt')
+            with open(ids, 'w') as fl:
+                fl.write('g1\ng2\n')
+            with open(scafs, 'w') as fl:
+                fl.write('c1\n')
+            lines = GFF.splitlines(True)
+            self.assertEqual(run(['-id', ids]).stdout, lines[0] + lines[2])
+            self.assertEqual(run(['-id', ids, '-v']).stdout, lines[1])
+            self.assertEqual(run(['-id', ids, '-scaf', scafs]).stdout,
+                             lines[0])
+
+    def test_id_and_expr(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            ids = os.path.join(tmp, 'ids.txt')
+            gff = os.path.join(tmp, 'in.gff')
+            with open(ids, 'w') as fl:
+                fl.write('g1\nm1\ng2\n')
+            with open(gff, 'w') as fl:
+                fl.write(GFF)
+            for index in ([], ['-index']):
+                result = run(['-gff', gff, '-id', ids, '-expr',
+                              'type==gene || length<50'] + index, '')
+                self.assertEqual(result.stdout, GFF.splitlines(True)[0]
+                                 + GFF.splitlines(True)[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+from bisect import bisect_left, bisect_right
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'gffRemoveScafPart.py')
+MODES = {'partial':lambda s, e, a, b:((s >= a and s < b) or (e > a and e < b)),
+         'contained':lambda s, e, a, b:s >= a and e <= b,
+         'overlap':lambda s, e, a, b:s <= b and e >= a}
+
+
+def gffLines(count, rng):
+    lines = []
+    for i in range(count):
+        start = rng.randint(1, 5000000)
+        lines.append('scaf{0}\t.\tgene\t{1}\t{2}\t.\t+\t.\tID=g{3}\n'.format(
+                     rng.randint(1, 3), start, start + rng.randint(0, 5000),
+                     i))
+    return lines
+
+def bedRanges(count, rng):
+    ranges = []
+    for i in range(count):
+        start = rng.randint(0, 5000000)
+        ranges.append(('scaf{0}'.format(rng.randint(1, 3)), start,
+                       start + rng.randint(1, 2000)))
+    return ranges
+
+
+class GffRemoveScafPartTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.gff = os.path.join(self.tmp.name, 'in.gff')
+        self.lines = gffLines(100000, rng)
+        with open(self.gff, 'w') as fl:
+            fl.writelines(self.lines)
+        self.ranges = bedRanges(10000, rng)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_script(self, ranges, mode):
+        bed = os.path.join(self.tmp.name, 'ranges.bed')
+        with open(bed, 'w') as fl:
+            for scaf, start, end in ranges:
+                fl.write('{0}\t{1}\t{2}\n'.format(scaf, start, end))
+        with open(self.gff) as inFl:
+            begin = time.time()
+            out = subprocess.run([sys.executable, SCRIPT, '-bed', bed,
+                                  '-mode', mode], stdin=inFl,
+                                 stdout=subprocess.PIPE, check=True,
+                                 universal_newlines=True).stdout
+            return out, time.time() - begin
+
+    def expected(self, ranges, mode):
+        # short ranges by scaffold sorted by start, and the long ranges,
+        # which are checked against every feature
+        short = {}
+        long = []
+        for scaf, a, b in ranges:
+            if b - a <= 2000:
+                short.setdefault(scaf, []).append((a, b))
+            else:
+                long.append((scaf, a, b))
+        for scaf in short:
+            short[scaf].sort()
+        starts = {scaf:[a for a, b in short[scaf]] for scaf in short}
+        removed = MODES[mode]
+        kept = []
+        for line in self.lines:
+            fields = line.split('\t')
+            scaf, start, end = fields[0], int(fields[3]), int(fields[4])
+            candidates = short.get(scaf, [])[
+                             bisect_left(starts.get(scaf, []), start - 2000):
+                             bisect_right(starts.get(scaf, []), end)]
+            candidates += [(a, b) for s, a, b in long if s == scaf]
+            if not any(removed(start, end, a + 1, b)
+                       for a, b in candidates):
+                kept.append(line)
+        return ''.join(kept)
+
+    def test_long_range(self):
+        # a range over most of a scaffold beside many short ones
+        ranges = self.ranges + [('scaf1', 1000, 4000000)]
+        for mode in MODES:
+            out, seconds = self.run_script(ranges, mode)
+            self.assertEqual(out, self.expected(ranges, mode), mode)
+        withoutLong = min(self.run_script(self.ranges, 'partial')[1]
+                          for i in range(2))
+        withLong = min(self.run_script(ranges, 'partial')[1]
+                       for i in range(2))
+        self.assertLess(withLong, withoutLong * 3 + 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
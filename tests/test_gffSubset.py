@@ -0,0 +1,88 @@
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'gffSubset.py')
+
+GFF = ('c1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m1;Parent=g1\n'
+       'c1\t.\tmRNA\t1\t100\t.\t+\t.\tID=m2;Parent=g1\n'
+       'c1\t.\texon\t1\t50\t.\t+\t.\tID=e1;Parent=m1,m2\n'
+       'c1\t.\texon\t60\t100\t.\t+\t.\tID=e2;Parent=m2\n'
+       'c1\t.\texon\t1\t50\t.\t+\t.\tID=e3;Parent=m3\n')
+
+
+def limitFiles():
+    # fewer file descriptors than -demux subsets
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, hard))
+
+
+class GffSubsetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.gff = os.path.join(self.tmp.name, 'in.gff')
+        with open(self.gff, 'w') as fl:
+            fl.write(GFF)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_list_matches_comma_separated_values(self):
+        with open(self.path('list.txt'), 'w') as fl:
+            fl.write('m1\n')
+        outputs = []
+        for args in ([], ['-index']):
+            outputs.append(subprocess.run([sys.executable, SCRIPT, '-attr',
+                                'Parent', '-list', self.path('list.txt'),
+                                '-gff', self.gff] + args,
+                                stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout)
+        self.assertEqual(outputs[0], GFF.splitlines(True)[2])
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_demux_more_subsets_than_open_files(self):
+        # each Parent value in many subsets, m1 and m2 in the same one
+        subsets = 200
+        with open(self.path('demux.txt'), 'w') as fl:
+            for i in range(subsets):
+                fl.write('m1\tfamily{0}\n'.format(i))
+                fl.write('m2\tfamily{0}\n'.format(i))
+        subprocess.run([sys.executable, SCRIPT, '-attr', 'Parent', '-demux',
+                        self.path('demux.txt'), '-gff', self.gff, '-out',
+                        self.path('out')], check=True, preexec_fn=limitFiles)
+        lines = GFF.splitlines(True)
+        for i in range(subsets):
+            with open(self.path('out.family{0}.gff'.format(i))) as fl:
+                self.assertEqual(fl.read(), ''.join(lines[2:4]))
+
+    def test_demux_errors(self):
+        for mapping, error in (('m1\ta b\nm2\ta_b\n', 'Subsets a b and a_b '
+                                'would both be written to {0}\n'.format(
+                                    self.path('out.a_b.gff'))),
+                               ('m1\tfamily1\nm2\n', 'Line 2 of {0} does not '
+                                'have two tab-separated columns\n'.format(
+                                    self.path('demux.txt')))):
+            with open(self.path('demux.txt'), 'w') as fl:
+                fl.write(mapping)
+            result = subprocess.run([sys.executable, SCRIPT, '-attr',
+                                     'Parent', '-demux',
+                                     self.path('demux.txt'), '-gff',
+                                     self.gff, '-out', self.path('out')],
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True)
+            self.assertEqual(result.returncode, 1)
+            self.assertEqual(result.stderr, error)
+            self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                             ['demux.txt', 'in.gff'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+                                                                  __file__))))
+from intervalIndex import IntervalIndex, coveredLength
+
+
+def bruteForce(intervals, start, end):
+    return sorted([interval for interval in intervals
+                   if interval[0] <= end and interval[1] >= start],
+                  key=lambda interval:(interval[0], interval[1]))
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def randomIntervals(self, rng, count, length):
+        intervals = []
+        for i in range(count):
+            start = rng.randint(1, length)
+            intervals.append((start, start + rng.randint(0, 500), i))
+        return intervals
+
+    def test_overlapping_matches_brute_force(self):
+        rng = random.Random(1)
+        intervals = self.randomIntervals(rng, 2000, 100000)
+        # long intervals covering most of the sequence, nested and
+        # duplicated
+        intervals += [(1, 100000, 'chromosome'), (5, 90000, 'region'),
+                      (5, 90000, 'region2'), (50000, 50000, 'point')]
+        index = IntervalIndex()
+        for start, end, value in intervals:
+            index.add('chr1', start, end, value)
+        for i in range(500):
+            start = rng.randint(-100, 100100)
+            end = start + rng.randint(0, 2000)
+            self.assertEqual(index.overlapping('chr1', start, end),
+                             bruteForce(intervals, start, end))
+        self.assertEqual(index.overlapping('chr2', 1, 10), [])
+
+    def test_add_after_query(self):
+        index = IntervalIndex()
+        index.add('chr1', 10, 20, 'a')
+        self.assertEqual(index.overlapping('chr1', 15, 15), [(10, 20, 'a')])
+        index.add('chr1', 1, 100, 'b')
+        self.assertEqual(index.overlapping('chr1', 15, 15),
+                         [(1, 100, 'b'), (10, 20, 'a')])
+
+    def test_long_interval_does_not_slow_queries(self):
+        rng = random.Random(2)
+        intervals = [(i * 50 + 1, i * 50 + 20, i) for i in range(200000)]
+        queries = [rng.randint(1, 10000000) for i in range(2000)]
+
+        def timeQueries(index):
+            began = time.perf_counter()
+            for start in queries:
+                index.overlapping('chr1', start, start + 100)
+            return time.perf_counter() - began
+
+        index = IntervalIndex()
+        for start, end, value in intervals:
+            index.add('chr1', start, end, value)
+        index.overlapping('chr1', 1, 1)
+        withoutLong = timeQueries(index)
+        index.add('chr1', 1, 10000000, 'chromosome')
+        index.overlapping('chr1', 1, 1)
+        withLong = timeQueries(index)
+        # each query finds one more interval, so the time should stay
+        # about the same instead of growing with the number of
+        # intervals
+        self.assertLess(withLong, withoutLong * 5 + 0.05)
+        found = index.overlapping('chr1', 1001, 1010)
+        self.assertEqual(found, [(1, 10000000, 'chromosome'),
+                                 (1001, 1020, 20)])
+
+    def test_covered_length(self):
+        intervals = [(1, 10, None), (5, 20, None), (30, 40, None)]
+        self.assertEqual(coveredLength(intervals, 1, 100), 31)
+        self.assertEqual(coveredLength(intervals, 15, 35), 12)
+
+
+if __name__ == '__main__':
+    unittest.main()